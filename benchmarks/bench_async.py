@@ -0,0 +1,79 @@
+"""
+Responsiveness of the event loop while large strings are generated.
+
+A ticker coroutine wakes up every millisecond and records how late it
+is; the lag is reported for the blocking call, the cooperative
+'agenerate' and the executor-backed 'astream'.
+
+    python benchmarks/bench_async.py [nb_strings]
+"""
+
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.aio import agenerate, astream
+
+PATTERN = "([a-z]{1,10} ){2000}(%d{0,99999},){5000}"
+TICK = 0.001
+
+
+async def ticker(lags, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - start - TICK)
+
+
+async def measure(work):
+    lags = []
+    stop = asyncio.Event()
+    task = asyncio.ensure_future(ticker(lags, stop))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await task
+    lags.sort()
+    return elapsed, lags[len(lags) * 99 // 100] if lags else 0.0, \
+        lags[-1] if lags else 0.0
+
+
+async def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    tree = randregex.parse_rand_regex(PATTERN)
+
+    async def blocking():
+        for _ in range(nb):
+            randregex.produce_randregex_from_tree(tree)
+            await asyncio.sleep(0)
+
+    async def cooperative():
+        for _ in range(nb):
+            await agenerate(tree, yield_every=200)
+
+    async def executor():
+        async for _ in astream(tree, nb, maxsize=8, batch_size=1):
+            pass
+
+    print("{:<14} {:>10} {:>14} {:>14}".format(
+        "mode", "total (s)", "p99 lag (ms)", "max lag (ms)"
+    ))
+    for name, work in [("blocking", blocking), ("agenerate", cooperative),
+                       ("astream", executor)]:
+        elapsed, p99, worst = await measure(work)
+        print("{:<14} {:>10.2f} {:>14.2f} {:>14.2f}".format(
+            name, elapsed, p99 * 1000, worst * 1000
+        ))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+"""
+Cost of the random draws with BitStreamRandom and random.Random.
+
+For draws below several n, prints the time of one randint and the
+number of random bits BitStreamRandom consumed per draw (the Mersenne
+Twister consumes a 32 bits word per draw below n <= 2**32), then the
+throughput of a pattern generated with each generator.
+
+    python benchmarks/bench_bitstream.py [nb_draws]
+"""
+
+import os
+import sys
+import math
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.sampling import BitStreamRandom
+
+PATTERN = "[a-z]{5,15}@[a-z]{3,8}\\.(com|org|net) (%d{0,9999};){5}"
+RANGES = [2, 3, 10, 26, 100, 1000, 10**6]
+
+
+def best(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    mt = random.Random(1)
+    bs = BitStreamRandom(1)
+    print("{:>8} {:>12} {:>12} {:>8} {:>10} {:>10}".format(
+        "n", "Random ns", "BitStream ns", "speedup", "bits/draw", "log2(n)"
+    ))
+    for n in RANGES:
+        t_mt = best(lambda: mt.randint(0, n - 1), nb)
+        t_bs = best(lambda: bs.randint(0, n - 1), nb)
+        bs.seed(2)
+        for _ in range(nb):
+            bs.randint(0, n - 1)
+        print("{:>8} {:>12.0f} {:>12.0f} {:>7.2f}x {:>10.2f} {:>10.2f}".format(
+            n, t_mt * 1e9, t_bs * 1e9, t_mt / t_bs, bs.bits_drawn / nb,
+            math.log2(n)
+        ))
+
+    tree = randregex.parse_rand_regex(PATTERN)
+    number = max(nb // 50, 1)
+    for name, rng in (("Random", mt), ("BitStreamRandom", bs)):
+        t = best(lambda: randregex.produce_randregex(tree, {}, rng), number)
+        print("{:>16}: {:10.0f} strings/s".format(name, 1 / t))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Cold versus warm startup time of a pattern library, with and without
+the on-disk cache of parsed trees.
+
+Each measure runs in a fresh interpreter, as a worker process would.
+
+    python benchmarks/bench_cache.py [nb_patterns]
+"""
+
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+WORKER = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import randregex.randregex as randregex
+from randregex.cache import parse_rand_regex_cached
+patterns = [
+    "(?id=[a-z]{{4}}%d{{0,{{i}}}})-[A-Z0-9_]{{8,16}}-(foo|bar|baz<50>)($id)"
+    .replace("{{i}}", str(i))
+    for i in range({nb})
+]
+trees = [{parse}(p) for p in patterns]
+randregex.produce_randregex_from_tree(trees[0])
+print(time.perf_counter() - start)
+"""
+
+
+def run(nb, parse, cache_dir):
+    env = dict(os.environ, RANDREGEX_CACHE_DIR=cache_dir)
+    code = WORKER.format(root=ROOT, nb=nb, parse=parse)
+    out = subprocess.check_output([sys.executable, "-c", code], env=env)
+    return float(out)
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    cache_dir = tempfile.mkdtemp(prefix="randregex-bench-")
+    try:
+        nocache = run(nb, "randregex.parse_rand_regex", cache_dir)
+        cold = run(nb, "parse_rand_regex_cached", cache_dir)
+        warm = run(nb, "parse_rand_regex_cached", cache_dir)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print("{} patterns".format(nb))
+    print("no cache   : {:.3f} s".format(nocache))
+    print("cold cache : {:.3f} s".format(cold))
+    print("warm cache : {:.3f} s  (x{:.1f} faster than no cache)".format(
+        warm, nocache / warm
+    ))
+
+
+if __name__ == "__main__":
+    main()
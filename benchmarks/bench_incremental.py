@@ -0,0 +1,64 @@
+"""
+Latency of an edit of a large template with the incremental parser,
+compared with a full parse of the edited template.
+
+    python benchmarks/bench_incremental.py [nb_fields]
+"""
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.incremental import IncrementalParser
+
+FIELD = ("(?f{0}=[a-z]{{3,8}}) = (%d{{0,999}}|(none|null)<10>|"
+         "\"[A-Za-z0-9 ]{{0,20}}\"){{1,3}};\\n")
+
+
+def template(nb):
+    return "".join(FIELD.format(i) for i in range(nb))
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    text = template(nb)
+    print("template of {} characters, {} fields".format(len(text), nb))
+
+    start = time.perf_counter()
+    parser = IncrementalParser(text)
+    print("initial parse: {:.1f} ms".format(
+        (time.perf_counter() - start) * 1e3
+    ))
+
+    rng = random.Random(0)
+    full = incremental = 0.0
+    nb_edits = 50
+    parsed = 0
+    for _ in range(nb_edits):
+        # Type a letter within the name list of a random field
+        pos = parser.text.index("(none|", rng.randrange(len(parser.text)
+                                                      - 100)) + 1
+        start = time.perf_counter()
+        parser.edit(pos, pos, "x")
+        incremental += time.perf_counter() - start
+        parsed += parser.nb_parsed
+
+        start = time.perf_counter()
+        randregex.parse_rand_regex(parser.text)
+        full += time.perf_counter() - start
+
+    print("full parse:  {:8.2f} ms per edit".format(full / nb_edits * 1e3))
+    print("incremental: {:8.2f} ms per edit, {:.0f} characters parsed".format(
+        incremental / nb_edits * 1e3, parsed / nb_edits
+    ))
+    print("speedup: {:.1f}x".format(full / incremental))
+
+
+if __name__ == "__main__":
+    main()
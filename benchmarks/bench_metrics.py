@@ -0,0 +1,61 @@
+"""
+Cost of the metrics on the generation.
+
+Compares the throughput of 'produce_randregex_from_tree' with the
+metrics disabled, and enabled at several sample rates, against a
+direct call of 'produce_randregex' which bypasses the check.
+
+    python benchmarks/bench_metrics.py [nb_strings]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.metrics import enable_metrics, disable_metrics
+
+PATTERN = "[a-z]{5,15}@[a-z]{3,8}\\.(com|org|net) (%d{0,9999};){5}"
+
+
+def throughput(generate, nb):
+    """
+    Return the best throughput of 5 runs of nb / 5 strings
+    """
+
+    per_run = max(nb // 5, 1)
+    return per_run / min(timeit.repeat(generate, number=per_run, repeat=5))
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    tree = randregex.parse_rand_regex(PATTERN)
+    # Warm up, the first runs are often slower
+    throughput(lambda: randregex.produce_randregex(tree, {}), nb)
+    base = throughput(lambda: randregex.produce_randregex(tree, {}), nb)
+    print("{:>24}: {:10.0f} strings/s".format("produce_randregex", base))
+
+    def from_tree():
+        return randregex.produce_randregex_from_tree(tree)
+
+    res = throughput(from_tree, nb)
+    print("{:>24}: {:10.0f} strings/s ({:+.1f}%)".format(
+        "metrics disabled", res, 100 * (res / base - 1)
+    ))
+    for rate in (0.001, 0.01, 0.1, 1.0):
+        registry = enable_metrics(rate)
+        res = throughput(from_tree, nb)
+        disable_metrics()
+        print("{:>24}: {:10.0f} strings/s ({:+.1f}%)".format(
+            "sample rate {}".format(rate), res, 100 * (res / base - 1)
+        ))
+    print()
+    print(registry.prometheus().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Generation speed of numeric-heavy rows such as CSV lines.
+
+The named variant "(?row=...)" of each pattern cannot use the bulk
+numeric path (its last repetition has to be captured), so it shows the
+cost of generating and formatting the numbers one node at a time.
+
+    python benchmarks/bench_numeric.py [nb_strings]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+
+PATTERNS = [
+    "(%f{0,1},){20}",
+    "(%.3f{0,1},){20}",
+    "(%05d{0,99999};){20}",
+    "(%d{-1000,1000} %.2f{-1,1}\\t){10}",
+]
+
+
+def bench(pattern, nb):
+    tree = randregex.parse_rand_regex(pattern)
+    start = time.perf_counter()
+    for _ in range(nb):
+        randregex.produce_randregex_from_tree(tree)
+    return nb / (time.perf_counter() - start)
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("{:<40} {:>12} {:>12} {:>8}".format(
+        "pattern", "bulk str/s", "node str/s", "speedup"
+    ))
+    for pattern in PATTERNS:
+        bulk = bench(pattern, nb)
+        node = bench("(?row=" + pattern[1:], nb)
+        print("{:<40} {:>12.0f} {:>12.0f} {:>7.1f}x".format(
+            pattern, bulk, node, bulk / node
+        ))
+
+
+if __name__ == "__main__":
+    main()
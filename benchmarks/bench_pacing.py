@@ -0,0 +1,46 @@
+"""
+Emission lag of 'PacedGenerator' at increasing rates.
+
+For each rate, the strings are emitted for a few seconds and the
+histograms of the generation times and of the lag behind the schedule
+are printed. Past the throughput of the producer thread, the buffer
+runs dry and the lag grows without bound.
+
+    python benchmarks/bench_pacing.py [duration] [--poisson]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.pacing import PacedGenerator
+
+PATTERN = "[a-z]{5,15}@[a-z]{3,8}\\.(com|org|net) (%d{0,9999};){5}"
+RATES = [100, 1000, 5000, 10000, 20000]
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    duration = float(args[0]) if args else 2.0
+    poisson = "--poisson" in sys.argv
+    tree = randregex.parse_rand_regex(PATTERN)
+    print("{} arrivals, {}s per rate".format(
+        "Poisson" if poisson else "evenly spaced", duration
+    ))
+    for rate in RATES:
+        with PacedGenerator(tree, rate, poisson=poisson) as generator:
+            for _ in generator.emit(duration=duration):
+                pass
+        print("rate {:6d}/s: {} strings, {} underruns".format(
+            rate, generator.emitted, generator.underruns
+        ))
+        print("    generation", generator.generation.format())
+        print("    lag       ", generator.lag.format())
+
+
+if __name__ == "__main__":
+    main()
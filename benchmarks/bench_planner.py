@@ -0,0 +1,80 @@
+"""
+Generation with the planner against the recursive walk.
+
+For each pattern, the plan is printed with 'explain', then both
+generators are timed. The check fails (exit status 1) if a planned
+string does not match the pattern, or if the measured speedup is far
+from the speedup predicted by the cost model.
+
+    python benchmarks/bench_planner.py [nb_strings]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.planner import Plan
+
+# (randregex, equivalent Python regex)
+PATTERNS = [
+    ("[a-z]{5,15}@[a-z]{3,8}\\.(com|org|net)",
+     "[a-z]{5,15}@[a-z]{3,8}\\\\\\.(com|org|net)"),
+    ("[A-Z][a-z]{3,10} [0-9]{5} (?c=[A-Z]{2})-($c)",
+     "[A-Z][a-z]{3,10} [0-9]{5} ([A-Z]{2})-\\1"),
+    ("(%d{0,9999};){20}", "([0-9]{1,4};){20}"),
+    ("GET /(index|about|(api/v[12]/[a-z]{4,8})) HTTP/1\\.1",
+     "GET /(index|about|(api/v[12]/[a-z]{4,8})) HTTP/1\\\\\\.1"),
+]
+
+# The measured speedup may differ from the predicted one by this factor
+TOLERANCE = 4.0
+
+
+def timed(fct, nb):
+    start = time.perf_counter()
+    for _ in range(nb):
+        fct()
+    return (time.perf_counter() - start) / nb
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(0)
+    failed = False
+    for pattern, python_regex in PATTERNS:
+        tree = randregex.parse_rand_regex(pattern)
+        plan = Plan(tree)
+        print(pattern)
+        print(plan.explain())
+
+        for _ in range(1000):
+            res = plan.generate(rng)
+            if not re.fullmatch(python_regex, res):
+                print("  MISMATCH: {!r}".format(res))
+                failed = True
+                break
+
+        walk = timed(lambda: randregex.produce_randregex(tree, {}, rng), nb)
+        planned = timed(lambda: plan.generate(rng), nb)
+        measured = walk / planned
+        predicted = plan.scalar_cost / plan.cost
+        ok = 1 / TOLERANCE < measured / predicted < TOLERANCE
+        failed = failed or not ok
+        print("  walk {:.2f} us, plan {:.2f} us, speedup {:.2f}x "
+              "(predicted {:.2f}x) {}\n".format(
+                  walk * 1e6, planned * 1e6, measured, predicted,
+                  "ok" if ok else "FAILED"
+              ))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
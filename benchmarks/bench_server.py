@@ -0,0 +1,123 @@
+"""
+Throughput and latency of the local generation server against
+in-process calls.
+
+"in-process cold" parses the pattern for every string, as short-lived
+client processes do; "in-process warm" reuses the parsed tree. The
+server is queried by several threads sharing a pooled Client, so that
+their concurrent requests are batched by the server.
+
+    python benchmarks/bench_server.py [nb_requests] [nb_threads]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.server import GenerationServer
+from randregex.client import Client
+
+PATTERN = "[A-Z][a-z]{3,8} [A-Z][a-z]{3,10} \\<[a-z]{5}@(gmail|yahoo)\\.com\\>"
+
+
+def start_server(path):
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        async def serve():
+            server = GenerationServer(path)
+            await server.start()
+            holder["server"] = server
+            holder["loop"] = asyncio.get_running_loop()
+            ready.set()
+            await server.serve_forever()
+        try:
+            asyncio.run(serve())
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    ready.wait()
+    return holder
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+def report(name, nb, elapsed, latencies):
+    print("{:<20} {:>12.0f} {:>12.1f} {:>12.1f}".format(
+        name, nb / elapsed, percentile(latencies, 50) * 1e6,
+        percentile(latencies, 99) * 1e6
+    ))
+
+
+def timed(fct):
+    start = time.perf_counter()
+    fct()
+    return time.perf_counter() - start
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    nb_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print("{:<20} {:>12} {:>12} {:>12}".format(
+        "mode", "req/s", "p50 (us)", "p99 (us)"
+    ))
+
+    latencies = []
+    def cold():
+        tree = randregex.parse_rand_regex(PATTERN)
+        randregex.produce_randregex_from_tree(tree)
+    start = time.perf_counter()
+    for _ in range(nb):
+        latencies.append(timed(cold))
+    report("in-process cold", nb, time.perf_counter() - start, latencies)
+
+    tree = randregex.parse_rand_regex(PATTERN)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(nb):
+        latencies.append(timed(
+            lambda: randregex.produce_randregex_from_tree(tree)
+        ))
+    report("in-process warm", nb, time.perf_counter() - start, latencies)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "randregex.sock")
+        start_server(path)
+        with Client(path, pool_size=nb_threads) as client:
+            client.generate(PATTERN)
+            for threads in [1, nb_threads]:
+                latencies = []
+                start = time.perf_counter()
+                with ThreadPoolExecutor(threads) as executor:
+                    latencies = list(executor.map(
+                        lambda _: timed(lambda: client.generate(PATTERN)),
+                        range(nb)
+                    ))
+                report("server {} thread(s)".format(threads), nb,
+                       time.perf_counter() - start, latencies)
+
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(nb // 100):
+                latencies.append(timed(lambda: client.generate(PATTERN, 100)))
+            report("server batch of 100", nb,
+                   time.perf_counter() - start, latencies)
+
+
+if __name__ == "__main__":
+    main()
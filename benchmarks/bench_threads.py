@@ -0,0 +1,69 @@
+"""
+Scaling of 'generate_many' with the number of threads.
+
+With the GIL, the throughput stays flat; on a free-threaded build of
+CPython (python3.13t and later), it should grow with the number of
+cores. The "global" column shows the throughput of threads sharing the
+random module instead of having their own generator.
+
+    python benchmarks/bench_threads.py [nb_strings]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.threads import freeze_tree, generate_many
+
+PATTERN = "[a-z]{5,15}@[a-z]{3,8}\\.(com|org|net) (%d{0,9999};){5}"
+
+
+def bench_global(tree, nb, threads):
+    per_thread = nb // threads
+
+    def work(_):
+        for _ in range(per_thread):
+            randregex.produce_randregex_from_tree(tree)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(work, range(threads)))
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def bench_many(tree, nb, threads):
+    start = time.perf_counter()
+    generate_many(tree, nb, threads=threads)
+    return nb / (time.perf_counter() - start)
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print("Python {} ({})".format(
+        sys.version.split()[0], "GIL" if gil else "free-threaded"
+    ))
+    tree = freeze_tree(randregex.parse_rand_regex(PATTERN))
+    base = None
+    print("{:>8} {:>14} {:>14} {:>8}".format(
+        "threads", "per-thread/s", "global/s", "scaling"
+    ))
+    # 'generate_many' uses os.cpu_count() threads by default
+    for threads in sorted({1, 2, 4, 8, os.cpu_count() or 1}):
+        many = bench_many(tree, nb, threads)
+        shared = bench_global(tree, nb, threads)
+        if base is None:
+            base = many
+        print("{:>8} {:>14.0f} {:>14.0f} {:>7.2f}x".format(
+            threads, many, shared, many / base
+        ))
+
+
+if __name__ == "__main__":
+    main()
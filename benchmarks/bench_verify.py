@@ -0,0 +1,57 @@
+"""
+Throughput of the bulk verifier compared with the generation, on a
+large sample of generated strings. Exits with status 1 if a generated
+string does not match its tree.
+
+    python benchmarks/bench_verify.py [nb_strings]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.realpath(__file__)))
+)
+
+import randregex.randregex as randregex
+from randregex.verify import Verifier, tree_to_regex
+
+PATTERNS = [
+    "[a-z]{5,15}@[a-z]{3,8}\\.(com|org|net)",
+    "(?c=[A-Z]{2})-%05d{0,99999}-($c)",
+    "(%d{-999,999};){10}",
+    "[^a-z]{3}\\d{2}\\p{L}{5}",
+]
+
+
+def main():
+    nb = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(0)
+    failed = False
+    print("{:<40} {:>12} {:>12}".format("pattern", "generate/s", "verify/s"))
+    for pattern in PATTERNS:
+        tree = randregex.parse_rand_regex(pattern)
+        start = time.perf_counter()
+        strings = [randregex.produce_randregex(tree, {}, rng)
+                   for _ in range(nb)]
+        generate = nb / (time.perf_counter() - start)
+
+        verifier = Verifier(tree)
+        start = time.perf_counter()
+        bad = verifier.mismatches(strings)
+        verify = nb / (time.perf_counter() - start)
+        print("{:<40} {:>12.0f} {:>12.0f}".format(pattern, generate, verify))
+        if bad:
+            failed = True
+            print("  regex: {}".format(tree_to_regex(tree)))
+            for i in bad[:5]:
+                print("  MISMATCH: {!r}".format(strings[i]))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
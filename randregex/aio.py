@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the asyncio API: the generation of a large
+string gives the control back to the event loop every few nodes, and
+batches of strings can be generated in an executor and consumed
+through a bounded asyncio.Queue.
+"""
+
+import asyncio
+import random
+
+from .randregex import (
+    pick_choice, pick_repeat, repeated_value, produce_number,
+    numeric_template, produce_numeric_rows, produce_randregex
+)
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .wordlist import get_word_list
+from .threads import freeze_tree, chunk_rng
+
+# Number of repetitions of a numeric group produced in one piece
+ROWS_PER_PIECE = 256
+
+# Marks the end of the strings put in a queue by 'produce_to_queue'
+END = None
+
+
+def produce_pieces(treelist, names, rng=random):
+    """
+    Iterate over the pieces of a random string, one piece per node.
+    Same as produce_randregex, but the result is yielded piece by piece.
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt or PipeElt
+        - names : a map of generated group names
+        - rng: the random generator, the random module by default
+    """
+
+    for regex_elt in treelist:
+        if isinstance(regex_elt, PipeElt):
+            yield from produce_pieces(pick_choice(regex_elt, rng), names, rng)
+            continue
+
+        if (isinstance(regex_elt, RegexElt)
+                and regex_elt.elt_type == EltType.NUMBER):
+            yield produce_number(regex_elt, rng)
+            continue
+
+        r = pick_repeat(regex_elt.count_infos, rng)
+
+        if isinstance(regex_elt, GroupElt):
+            template = numeric_template(regex_elt)
+            if template is not None:
+                for start in range(0, r, ROWS_PER_PIECE):
+                    yield produce_numeric_rows(
+                        template, min(ROWS_PER_PIECE, r - start), rng
+                    )
+                continue
+            for _ in range(r):
+                if regex_elt.name:
+                    tmp = "".join(
+                        produce_pieces(regex_elt.list_elt, names, rng)
+                    )
+                    names[regex_elt.name] = tmp
+                    yield tmp
+                else:
+                    yield from produce_pieces(regex_elt.list_elt, names, rng)
+        elif regex_elt.elt_type == EltType.CHAR_CLASS:
+            yield regex_elt.elt_val.sample_string(r, rng)
+        elif regex_elt.elt_type == EltType.WORD_LIST:
+            word_list = get_word_list(regex_elt.elt_val)
+            for _ in range(r):
+                yield word_list.sample(rng)
+        elif r:
+            yield repeated_value(regex_elt, names) * r
+
+
+async def agenerate_chunks(tree, chunk_size=65536, yield_every=1000,
+                           rng=random):
+    """
+    Asynchronously iterate over the chunks of a random string.
+    The control goes back to the event loop every 'yield_every'
+    nodes and after each chunk.
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - chunk_size (int): the minimum length of the chunks,
+          except the last one
+        - yield_every (int): the number of nodes produced between
+          two switches to the event loop
+        - rng: the random generator, the random module by default
+    """
+
+    buffer = []
+    size = 0
+    nodes = 0
+    for piece in produce_pieces(tree, {}, rng):
+        buffer.append(piece)
+        size += len(piece)
+        nodes += 1
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+            nodes = yield_every
+        if nodes >= yield_every:
+            nodes = 0
+            await asyncio.sleep(0)
+    if buffer:
+        yield "".join(buffer)
+
+
+async def agenerate(tree, yield_every=1000, rng=random):
+    """
+    Generate a random string without blocking the event loop for
+    more than 'yield_every' nodes
+    """
+
+    return "".join([
+        chunk async for chunk in agenerate_chunks(
+            tree, yield_every=yield_every, rng=rng
+        )
+    ])
+
+
+def _generate_batch(tree, seed, k, nb):
+    rng = chunk_rng(seed, k)
+    return [produce_randregex(tree, {}, rng) for _ in range(nb)]
+
+
+async def produce_to_queue(tree, nb, queue, batch_size=256, executor=None,
+                           seed=None):
+    """
+    Generate 'nb' random strings by batches in an executor and put them
+    in 'queue', then put END. With a bounded queue, the generation waits
+    for the consumer (backpressure).
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - nb (int): the number of strings, forever if None
+        - queue (asyncio.Queue): the queue receiving the strings
+        - batch_size (int): the number of strings generated by each
+          call in the executor
+        - executor: the concurrent.futures executor, the default
+          executor of the loop if None
+        - seed (int, str or bytes): the seed of the sequence, or None.
+          The strings are the same as the ones of
+          'randregex.threads.generate_many' with chunk_size=batch_size.
+    """
+
+    loop = asyncio.get_running_loop()
+    freeze_tree(tree)
+    k = 0
+    done = 0
+    while nb is None or done < nb:
+        size = batch_size if nb is None else min(batch_size, nb - done)
+        batch = await loop.run_in_executor(
+            executor, _generate_batch, tree, seed, k, size
+        )
+        for s in batch:
+            await queue.put(s)
+        done += size
+        k += 1
+    await queue.put(END)
+
+
+async def astream(tree, nb=None, maxsize=1024, batch_size=256,
+                  executor=None, seed=None):
+    """
+    Asynchronously iterate over 'nb' random strings (forever if None),
+    generated in an executor. At most 'maxsize' + 'batch_size' strings
+    are generated ahead of the consumer.
+    """
+
+    queue = asyncio.Queue(maxsize)
+    task = asyncio.ensure_future(produce_to_queue(
+        tree, nb, queue, batch_size, executor, seed
+    ))
+    try:
+        while True:
+            s = await queue.get()
+            if s is END:
+                break
+            yield s
+        await task
+    finally:
+        if not task.done():
+            task.cancel()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a bytes generation mode for pure ASCII patterns.
+The strings are generated directly into a bytearray, and the
+character classes are precomputed as bytes lookup tables.
+"""
+
+import random
+import itertools
+
+from .randregex import (
+    RandRegexException, parse_rand_regex, pick_choice, pick_repeat,
+    repeated_value, produce_number
+)
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .wordlist import get_word_list
+
+
+class ByteClass:
+    """
+    A character class precomputed for the bytes mode.
+    Attributes:
+        - table: the bytes which may be generated
+        - cum_weights: the cumulative weights of the bytes of the table,
+          None if they all have the same probability
+        - count_infos: the CountInfos of the class, None if the class
+          is generated exactly once
+    """
+
+    def __init__(self, table, cum_weights, count_infos):
+        self.table = table
+        self.cum_weights = cum_weights
+        self.count_infos = count_infos
+
+
+def class_leaves(pipe_elt):
+    """
+    Return the list of (byte, probability) generated by a PipeElt
+    made only of single characters, or None if the PipeElt
+    generates anything else.
+    """
+
+    res = []
+    for choice, weight in pipe_elt.list_elt:
+        proba = weight / pipe_elt.expected_weight
+        if len(choice) != 1:
+            return None
+        elt = choice[0]
+        if isinstance(elt, PipeElt):
+            leaves = class_leaves(elt)
+            if leaves is None:
+                return None
+            res.extend((c, p * proba) for c, p in leaves)
+        elif (isinstance(elt, RegexElt) and len(elt.elt_val) == 1
+                  and (elt.elt_type == EltType.CHAR
+                       or elt.elt_type == EltType.ESCAPED_CHAR)
+                  and elt.count_infos.count_infos[0][:2] == (1, 1)
+                  and len(elt.count_infos.count_infos) == 1):
+            res.append((ord(elt.elt_val), proba))
+        else:
+            return None
+    return res
+
+
+def make_byte_class(pipe_elt, count_infos):
+    """
+    Transform a PipeElt into a ByteClass if it only generates
+    single characters, return None otherwise
+    """
+
+    leaves = class_leaves(pipe_elt)
+    if leaves is None:
+        return None
+    table = bytes(c for c, _ in leaves)
+    if all(p == leaves[0][1] for _, p in leaves):
+        return ByteClass(table, None, count_infos)
+    return ByteClass(
+        table, list(itertools.accumulate(p for _, p in leaves)), count_infos
+    )
+
+
+def compile_bytes_tree(treelist):
+    """
+    Transform a tree returned by 'parse_rand_regex' into a tree for
+    the bytes mode: characters become bytes and the "or lists" of
+    single characters become ByteClass
+
+    Parameters:
+        treelist (list): list of GroupElt, RegexElt or PipeElt
+
+    Returns:
+        list: list of GroupElt, RegexElt, PipeElt or ByteClass
+    """
+
+    res = []
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            byte_class = make_byte_class(elt, None)
+            if byte_class is not None:
+                res.append(byte_class)
+            else:
+                res.append(PipeElt(
+                    [(compile_bytes_tree(choice), weight)
+                     for choice, weight in elt.list_elt],
+                    elt.expected_weight
+                ))
+        elif isinstance(elt, GroupElt):
+            byte_class = None
+            if (not elt.name and len(elt.list_elt) == 1
+                    and isinstance(elt.list_elt[0], PipeElt)):
+                byte_class = make_byte_class(elt.list_elt[0], elt.count_infos)
+            if byte_class is not None:
+                res.append(byte_class)
+            else:
+                res.append(GroupElt(
+                    compile_bytes_tree(elt.list_elt), elt.count_infos,
+                    elt.name
+                ))
+        elif elt.elt_type == EltType.CHAR_CLASS:
+            if elt.elt_val.ranges[-1][1] > 0x7f:
+                raise RandRegexException(
+                    "The bytes mode only accepts ASCII character classes"
+                )
+            chars = list(elt.elt_val.chars())
+            cum_weights = None
+            if elt.elt_val.by_range:
+                cum_weights = list(itertools.accumulate(
+                    elt.elt_val.proba(c) for c in chars
+                ))
+            res.append(ByteClass(
+                bytes(map(ord, chars)), cum_weights, elt.count_infos
+            ))
+        elif (elt.elt_type == EltType.CHAR
+                  or elt.elt_type == EltType.ESCAPED_CHAR):
+            res.append(RegexElt(
+                elt.elt_type, elt.elt_val.encode("ascii"), elt.count_infos
+            ))
+        elif elt.elt_type == EltType.WORD_LIST:
+            if not get_word_list(elt.elt_val).is_ascii:
+                raise RandRegexException(
+                    "The bytes mode only accepts ASCII word lists: {} has "
+                    "non ASCII words".format(elt.elt_val)
+                )
+            res.append(elt)
+        else:
+            res.append(elt)
+    return res
+
+
+def parse_rand_regex_bytes(randregex):
+    """
+    Return the randRegEx information Tree for the bytes mode.
+    The result should be used with 'produce_bytes_from_tree' method
+
+    Parameters:
+        randregex (string or bytes): the randregex, which must only
+        contain ASCII characters
+
+    Returns:
+        list: list of GroupElt, RegexElt, PipeElt or ByteClass
+    """
+
+    if isinstance(randregex, (bytes, bytearray)):
+        try:
+            randregex = randregex.decode("ascii")
+        except UnicodeDecodeError as e:
+            raise RandRegexException(
+                "The bytes mode only accepts ASCII patterns: byte {} "
+                "at position {} is not ASCII".format(
+                    hex(randregex[e.start]), e.start
+                )
+            )
+    elif not randregex.isascii():
+        pos = next(i for i, c in enumerate(randregex) if not c.isascii())
+        raise RandRegexException(
+            "The bytes mode only accepts ASCII patterns: character {!r} "
+            "at position {} is not ASCII".format(randregex[pos], pos)
+        )
+
+    return compile_bytes_tree(parse_rand_regex(randregex))
+
+
+def produce_bytes(treelist, names, out, rng=random):
+    """
+    Produce random bytes recursively into 'out'.
+    Called By produce_bytes_from_tree
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt, PipeElt
+          or ByteClass
+        - names : a map of generated group names
+        - out (bytearray): the output buffer
+        - rng: the random generator, the random module by default
+    """
+
+    for regex_elt in treelist:
+        if isinstance(regex_elt, PipeElt):
+            produce_bytes(pick_choice(regex_elt, rng), names, out, rng)
+            continue
+
+        if isinstance(regex_elt, ByteClass):
+            r = 1
+            if regex_elt.count_infos is not None:
+                r = pick_repeat(regex_elt.count_infos, rng)
+            out += bytes(rng.choices(
+                regex_elt.table, cum_weights=regex_elt.cum_weights, k=r
+            ))
+            continue
+
+        if (isinstance(regex_elt, RegexElt)
+                and regex_elt.elt_type == EltType.NUMBER):
+            out += produce_number(regex_elt, rng).encode("ascii")
+            continue
+
+        r = pick_repeat(regex_elt.count_infos, rng)
+
+        if isinstance(regex_elt, GroupElt):
+            for _ in range(r):
+                start = len(out)
+                produce_bytes(regex_elt.list_elt, names, out, rng)
+                if regex_elt.name:
+                    names[regex_elt.name] = bytes(out[start:])
+        elif regex_elt.elt_type == EltType.WORD_LIST:
+            word_list = get_word_list(regex_elt.elt_val)
+            for _ in range(r):
+                out += word_list.sample(rng).encode("ascii")
+        elif r:
+            out += repeated_value(regex_elt, names) * r
+
+
+def produce_bytes_from_tree(tree, rng=random):
+    """
+    Generate random bytes according to the information
+    returned by the method 'parse_rand_regex_bytes'
+
+    Returns:
+        bytearray: the generated bytes, which can be written to a file
+        or a socket without any copy
+    """
+
+    out = bytearray()
+    produce_bytes(tree, {}, out, rng)
+    return out
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a persistent on-disk cache of parsed trees,
+in the spirit of __pycache__: parsing a pattern which was already
+parsed by a previous process only costs reading a small file
+"""
+
+import os
+import sys
+import struct
+import hashlib
+import tempfile
+import zlib
+
+from .randregex import RandRegexException, parse_rand_regex, __version__
+from .serialize import FORMAT_VERSION, dump_tree, load_tree
+from .interning import intern_tree
+
+MAGIC = b"RRXC"
+
+# magic, format version, payload crc32, payload size, pattern digest
+_HEADER = struct.Struct(">4sHII32s")
+
+# The serialized trees depend on the library and on the marshal format
+_VERSION_TAG = "{}-{}".format(
+    __version__, sys.implementation.cache_tag
+).encode("ascii")
+
+
+def default_cache_dir():
+    """
+    Return the directory used when no cache directory is given:
+    $RANDREGEX_CACHE_DIR if defined, ~/.cache/randregex otherwise
+    """
+
+    path = os.environ.get("RANDREGEX_CACHE_DIR")
+    if path:
+        return path
+    return os.path.join(os.path.expanduser("~"), ".cache", "randregex")
+
+
+def pattern_digest(randregex):
+    """
+    Return the sha256 digest of a pattern, tagged with the library version
+    """
+
+    h = hashlib.sha256(_VERSION_TAG)
+    h.update(b"\0")
+    h.update(randregex.encode("utf-8", "surrogatepass"))
+    return h.digest()
+
+
+def cache_path(digest, cache_dir=None):
+    """
+    Return the path of the cache entry of a pattern digest
+    """
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    return os.path.join(cache_dir, digest.hex()[:40] + ".rrc")
+
+
+def read_cache_entry(path, digest):
+    """
+    Read a cache entry.
+
+    Returns:
+        list: the cached tree, or None if the entry is missing or stale
+    """
+
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read()
+    except OSError:
+        return None
+
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, crc, size, entry_digest = _HEADER.unpack_from(data)
+    payload = data[_HEADER.size:]
+    if (magic != MAGIC or version != FORMAT_VERSION
+            or entry_digest != digest or size != len(payload)
+            or zlib.crc32(payload) != crc):
+        return None
+    try:
+        return load_tree(payload)
+    except RandRegexException:
+        return None
+
+
+def write_cache_entry(path, digest, tree):
+    """
+    Atomically write a cache entry. Errors are silently ignored, so
+    that a read-only cache directory only disables the cache.
+    """
+
+    payload = dump_tree(tree)
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, zlib.crc32(payload), len(payload), digest
+    )
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(header)
+                fp.write(payload)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        pass
+
+
+def parse_rand_regex_cached(randregex, cache_dir=None, intern=False):
+    """
+    Same as 'parse_rand_regex', but the tree is read from the on-disk
+    cache when a valid entry exists, and written to it otherwise.
+
+    Parameters:
+        - randregex (string): the randregex
+        - cache_dir (string): the cache directory,
+          'default_cache_dir()' if None
+        - intern (bool): see 'parse_rand_regex'
+
+    Returns:
+        list: list of GroupElt, RegexElt or PipeElt
+    """
+
+    digest = pattern_digest(randregex)
+    path = cache_path(digest, cache_dir)
+
+    tree = read_cache_entry(path, digest)
+    if tree is None:
+        tree = parse_rand_regex(randregex)
+        write_cache_entry(path, digest, tree)
+    if intern:
+        tree = intern_tree(tree)
+    return tree
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the character classes stored as sorted ranges of
+codepoints: negated classes "[^...]", the intersection "&&[...]" and
+subtraction "--[...]" of classes, and the shorthands \\d, \\w, \\s,
+\\p{...} (see randregex/unicode_classes.py). A class costs O(#ranges)
+in memory and O(log #ranges) per random character, whatever the number
+of characters it contains.
+"""
+
+import random
+from bisect import bisect_right
+
+from .randregex import RandRegexException
+from .parsing_structures import EltType, RegexElt
+
+
+class CharRanges:
+    """
+    An immutable set of characters.
+    Attributes:
+        - ranges: the sorted tuple of disjoint, non adjacent (lo, hi)
+          codepoint ranges, bounds included
+        - size: the number of characters
+        - by_range: if False, the characters are sampled uniformly;
+          if True, a range is picked uniformly, then a character of
+          the range, so that small ranges are not drowned out by
+          large ones (such as the CJK ideographs within \\p{L})
+    """
+
+    def __init__(self, ranges, by_range=False):
+        self.by_range = by_range
+        merged = []
+        for lo, hi in sorted(ranges):
+            if lo > hi:
+                continue
+            if merged and lo <= merged[-1][1] + 1:
+                if hi > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], hi)
+            else:
+                merged.append((lo, hi))
+        self.ranges = tuple(merged)
+        self._starts = [lo for lo, _ in merged]
+        self._cum = []
+        size = 0
+        for lo, hi in merged:
+            size += hi - lo + 1
+            self._cum.append(size)
+        self.size = size
+
+    @staticmethod
+    def from_chars(chars):
+        return CharRanges((ord(c), ord(c)) for c in chars)
+
+    def union(self, other):
+        return CharRanges(self.ranges + other.ranges)
+
+    def difference(self, other):
+        res = []
+        j = 0
+        others = other.ranges
+        for lo, hi in self.ranges:
+            while j < len(others) and others[j][1] < lo:
+                j += 1
+            k = j
+            while k < len(others) and others[k][0] <= hi:
+                if others[k][0] > lo:
+                    res.append((lo, others[k][0] - 1))
+                lo = max(lo, others[k][1] + 1)
+                k += 1
+            if lo <= hi:
+                res.append((lo, hi))
+        return CharRanges(res)
+
+    def intersection(self, other):
+        return self.difference(self.difference(other))
+
+    def complement(self, universe):
+        return universe.difference(self)
+
+    def __contains__(self, c):
+        code = ord(c)
+        i = bisect_right(self._starts, code) - 1
+        return i >= 0 and code <= self.ranges[i][1]
+
+    def __len__(self):
+        return self.size
+
+    def char_at(self, k):
+        """
+        Return the character number k of the class, in codepoint order
+        """
+
+        i = bisect_right(self._cum, k)
+        return chr(self.ranges[i][0] + k - (self._cum[i - 1] if i else 0))
+
+    def sample(self, rng=random):
+        """
+        Return a random character of the class
+        """
+
+        if self.by_range:
+            lo, hi = self.ranges[rng.randrange(len(self.ranges))]
+            return chr(rng.randint(lo, hi))
+        return self.char_at(rng.randrange(self.size))
+
+    def sample_string(self, nb, rng=random):
+        """
+        Return a string of 'nb' characters of the class
+        """
+
+        if self.by_range:
+            return "".join([self.sample(rng) for _ in range(nb)])
+        return "".join([self.char_at(rng.randrange(self.size))
+                        for _ in range(nb)])
+
+    def proba(self, c):
+        """
+        Return the probability that 'sample' returns 'c'
+        """
+
+        if c not in self:
+            return 0.0
+        if self.by_range:
+            code = ord(c)
+            lo, hi = self.ranges[bisect_right(self._starts, code) - 1]
+            return 1.0 / len(self.ranges) / (hi - lo + 1)
+        return 1.0 / self.size
+
+    def chars(self):
+        """
+        Iterate over the characters of the class, in codepoint order
+        """
+
+        for lo, hi in self.ranges:
+            for code in range(lo, hi + 1):
+                yield chr(code)
+
+    def __eq__(self, other):
+        return (isinstance(other, CharRanges) and self.ranges == other.ranges
+                and self.by_range == other.by_range)
+
+    def __hash__(self):
+        return hash((self.ranges, self.by_range))
+
+    def __repr__(self):
+        if self.by_range:
+            return "CharRanges({!r}, by_range=True)".format(list(self.ranges))
+        return "CharRanges({!r})".format(list(self.ranges))
+
+
+# The universe of the negated classes when none is given
+PRINTABLE_ASCII = CharRanges([(0x20, 0x7e)])
+
+# The letters of the shorthand classes \\d, \\w, \\s, \\p{...}
+# and of their negations
+SHORTHAND_LETTERS = "dDwWsSpP"
+
+
+def _is_syntax(charlist, i, c):
+    return (i < len(charlist) and charlist[i].elt_type == EltType.CHAR
+            and charlist[i].elt_val == c)
+
+
+def _is_set_operation(charlist, i):
+    return ((_is_syntax(charlist, i, '-') and _is_syntax(charlist, i+1, '-')
+             or _is_syntax(charlist, i, '&')
+             and _is_syntax(charlist, i+1, '&'))
+            and _is_syntax(charlist, i+2, '['))
+
+
+def is_char_class(charlist):
+    """
+    Tell whether the content of a squared bracket uses a negation,
+    a set operation or a shorthand, and must become a CharRanges
+    """
+
+    if len(charlist) > 1 and _is_syntax(charlist, 0, '^'):
+        return True
+    backslash = False
+    for i in range(len(charlist)):
+        if backslash:
+            if (charlist[i].elt_type == EltType.CHAR
+                    and charlist[i].elt_val in SHORTHAND_LETTERS):
+                return True
+            backslash = False
+        elif _is_syntax(charlist, i, '\\'):
+            backslash = True
+        elif _is_set_operation(charlist, i):
+            return True
+    return False
+
+
+def parse_shorthand(charlist, i, universe=None):
+    """
+    Parse a shorthand class \\d, \\w, \\s, \\p{X} or their negations
+    \\D, \\W, \\S, \\P{X}, where X is a Unicode general category
+    such as L or Lu. With \\p{X:range}, the characters are sampled
+    by range (see CharRanges).
+
+    Parameters:
+        - charlist (list): list of RegexElt
+        - i (int): the position of the letter following the backslash
+        - universe (CharRanges): the characters of the negations,
+          PRINTABLE_ASCII if None, in which case \\d, \\w, \\s are
+          ASCII (see unicode_classes.shorthand_class)
+
+    Returns:
+        (int, CharRanges): the position of the last parsed element,
+        the parsed class
+    """
+
+    from .unicode_classes import shorthand_class, category_class
+
+    letter = charlist[i].elt_val
+    if letter not in "pP":
+        return i, shorthand_class(letter, universe)
+    if universe is None:
+        universe = PRINTABLE_ASCII
+
+    if not _is_syntax(charlist, i+1, '{'):
+        raise RandRegexException(
+            "Expected a category such as {{L}} after \\{}".format(letter)
+        )
+    name = ""
+    i += 2
+    while not _is_syntax(charlist, i, '}'):
+        if i >= len(charlist) or not RegexElt.IsChar(charlist[i]):
+            raise RandRegexException(
+                "A caracter '{' does not have a closing caracter '}'"
+            )
+        name += charlist[i].elt_val
+        i += 1
+    name, _, mode = name.partition(":")
+    if mode not in ("", "range"):
+        raise RandRegexException(
+            "Unknown sampling mode {} of \\{}{{{}}}".format(
+                mode, letter, name
+            )
+        )
+    res = category_class(name, letter == "P", universe)
+    if mode == "range":
+        res = CharRanges(res.ranges, by_range=True)
+    return i, res
+
+
+def parse_char_class(charlist, universe=None):
+    """
+    Parse the content of a squared bracket into a CharRanges.
+    A leading '^' negates the whole class within 'universe'; the
+    operations "--[...]" and "&&[...]" apply from left to right.
+
+    Parameters:
+        - charlist (list): the RegexElt between '[' and ']'
+        - universe (CharRanges): the characters of the negated
+          classes, PRINTABLE_ASCII if None
+
+    Returns:
+        CharRanges: the characters of the class
+    """
+
+    i, res = _parse_class(charlist, 0, universe)
+    if i != len(charlist):
+        raise RandRegexException(
+            "Unexpected ']' in a character class operation"
+        )
+    if res.size == 0:
+        raise RandRegexException("The character class is empty")
+    return res
+
+
+def _parse_class(charlist, i, universe):
+    """
+    Parse a class up to the end of the list or an unmatched ']'
+
+    Returns:
+        (int, CharRanges): the end position, the parsed class
+    """
+
+    negate = False
+    if len(charlist) > i + 1 and _is_syntax(charlist, i, '^'):
+        negate = True
+        i += 1
+
+    items = []
+    backslash = False
+    while i < len(charlist) and not (
+            not backslash and (_is_syntax(charlist, i, ']')
+                               or _is_set_operation(charlist, i))):
+        c = charlist[i].elt_val
+        if backslash and (c in SHORTHAND_LETTERS
+                          and charlist[i].elt_type == EltType.CHAR):
+            i, shorthand = parse_shorthand(charlist, i, universe)
+            if shorthand.by_range:
+                raise RandRegexException(
+                    "The sampling by range is not allowed within brackets"
+                )
+            items.extend(shorthand.ranges)
+            backslash = False
+        elif backslash:
+            if c != '<' and c != '>':
+                items.append((ord('\\'), ord('\\')))
+            items.append((ord(c), ord(c)))
+            backslash = False
+        elif c == '\\' and charlist[i].elt_type == EltType.CHAR:
+            backslash = True
+        elif c == '<' and charlist[i].elt_type == EltType.CHAR:
+            raise RandRegexException(
+                "Weights are not allowed in negated classes "
+                "or class operations"
+            )
+        elif (i+2 < len(charlist) and _is_syntax(charlist, i+1, '-')
+                  and not _is_set_operation(charlist, i+1)):
+            lo, hi = ord(c), ord(charlist[i+2].elt_val)
+            if lo > hi:
+                raise RandRegexException(
+                    "Bad character range {}-{}".format(c, chr(hi))
+                )
+            items.append((lo, hi))
+            i += 2
+        else:
+            items.append((ord(c), ord(c)))
+        i += 1
+    if backslash:
+        items.append((ord('\\'), ord('\\')))
+    if not items:
+        raise RandRegexException("An empty character list [] is forbidden")
+    res = CharRanges(items)
+
+    while _is_set_operation(charlist, i):
+        op = charlist[i].elt_val
+        i, other = _parse_class(charlist, i + 3, universe)
+        if not _is_syntax(charlist, i, ']'):
+            raise RandRegexException(
+                "Missing ']' in a character class operation"
+            )
+        i += 1
+        if op == '-':
+            res = res.difference(other)
+        else:
+            res = res.intersection(other)
+
+    if negate:
+        res = res.complement(PRINTABLE_ASCII if universe is None else universe)
+    return i, res
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the client of the local generation server
+(see randregex/server.py). The connections are kept in a pool and
+reused by the following requests, from any thread.
+"""
+
+import socket
+import threading
+
+from .randregex import RandRegexException
+from .protocol import (
+    OP_REGISTER, OP_GENERATE, STATUS_OK, STATUS_UNKNOWN_PATTERN, MAX_FRAME,
+    FRAME, GENERATE, PATTERN_KEY, pack_frame, decode_strings
+)
+
+
+def recv_exactly(sock, size):
+    """
+    Receive exactly 'size' bytes from a socket
+    """
+
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    pos = 0
+    while pos < size:
+        nb = sock.recv_into(view[pos:])
+        if nb == 0:
+            raise ConnectionError("Connection closed by the server")
+        pos += nb
+    return buffer
+
+
+def read_frame_sock(sock):
+    """
+    Read a frame from a socket and return its payload
+    """
+
+    size = FRAME.unpack(recv_exactly(sock, FRAME.size))[0]
+    if size > MAX_FRAME:
+        raise RandRegexException("Frame too large")
+    return recv_exactly(sock, size)
+
+
+def exchange(sock, payload):
+    """
+    Send a request payload and return the answer payload. The socket
+    is closed on error.
+    """
+
+    try:
+        sock.sendall(pack_frame(payload))
+        return read_frame_sock(sock)
+    except BaseException:
+        sock.close()
+        raise
+
+
+class Client:
+    """
+    A client of the generation server.
+    Attributes:
+        - path: the path of the Unix socket, or None for TCP
+        - host, port: the TCP address of the server
+        - pool_size: the maximum number of idle connections kept
+        - timeout: the timeout of the sockets in seconds, or None
+    """
+
+    def __init__(self, path=None, host="127.0.0.1", port=7878, pool_size=8,
+                 timeout=None):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = []
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.path is not None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.path
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            address = (self.host, self.port)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def request(self, payload):
+        """
+        Send a request payload and return the answer payload,
+        on a connection of the pool
+        """
+
+        with self._lock:
+            sock = self._pool.pop() if self._pool else None
+        if sock is not None:
+            try:
+                answer = exchange(sock, payload)
+            except ConnectionError:
+                # A pooled connection may have been closed by a restart
+                # of the server, the requests are safe to send again
+                sock = None
+        if sock is None:
+            sock = self._connect()
+            answer = exchange(sock, payload)
+        with self._lock:
+            if len(self._pool) < self.pool_size:
+                self._pool.append(sock)
+                sock = None
+        if sock is not None:
+            sock.close()
+        return answer
+
+    def register(self, pattern):
+        """
+        Return the key of a pattern on the server, which parses it on
+        its first registration
+        """
+
+        key = self._keys.get(pattern)
+        if key is None:
+            answer = self.request(bytes([OP_REGISTER]) + pattern.encode("utf-8"))
+            check_answer(answer)
+            key = PATTERN_KEY.unpack(answer)[1]
+            self._keys[pattern] = key
+        return key
+
+    def generate(self, pattern, nb=1):
+        """
+        Return a list of 'nb' random strings of a pattern
+        """
+
+        answer = self.request(GENERATE.pack(
+            OP_GENERATE, self.register(pattern), nb
+        ))
+        if answer[0] == STATUS_UNKNOWN_PATTERN:
+            # The server has been restarted, the key of the pattern does
+            # not depend on the server, so it only has to be registered
+            self._keys.pop(pattern, None)
+            answer = self.request(GENERATE.pack(
+                OP_GENERATE, self.register(pattern), nb
+            ))
+        check_answer(answer)
+        return decode_strings(answer)
+
+    def generate_one(self, pattern):
+        return self.generate(pattern, 1)[0]
+
+    def close(self):
+        with self._lock:
+            pool = self._pool
+            self._pool = []
+        for sock in pool:
+            sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def check_answer(answer):
+    """
+    Raise a RandRegexException if an answer is an error
+    """
+
+    if answer[0] != STATUS_OK:
+        raise RandRegexException(bytes(answer[1:]).decode("utf-8"))
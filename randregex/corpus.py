@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a corpus of pregenerated strings: the strings
+are written in utf-8 straight into a memory-mapped data file, and
+their offsets into a fixed-width index file, so that any process can
+read the string number i with no copy and no parsing.
+
+Layout of the index file "<path>.idx":
+    - header: magic, version, padding, nb of strings (big endian)
+    - nb + 1 offsets in the data file, as little-endian 64 bits
+      integers: the string i is data[offsets[i]:offsets[i + 1]]
+"""
+
+import os
+import sys
+import mmap
+import array
+import random
+import struct
+
+from .randregex import RandRegexException, produce_randregex
+from .length import expected_length
+from .counter_rng import CounterRandom
+
+MAGIC = b"RRXI"
+CORPUS_VERSION = 1
+
+# The data file grows by at least this number of bytes
+GROW_CHUNK = 1 << 24
+
+_HEADER = struct.Struct(">4sH2xQ")
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+class CorpusWriter:
+    """
+    Appends strings to a memory-mapped data file, grown by chunks.
+    The index is written by 'close'.
+    Attributes:
+        - path: the data file
+        - size: the number of bytes written
+        - offsets: the array of the offsets of the strings
+        - grow_chunk: the minimum growth of the file
+    """
+
+    def __init__(self, path, expected_size=0, grow_chunk=GROW_CHUNK):
+        self.path = path
+        self.size = 0
+        self.offsets = array.array("Q", [0])
+        self.grow_chunk = grow_chunk
+        self._fp = open(path, "w+b")
+        self._map = None
+        self._capacity = 0
+        self._grow(max(int(expected_size), 1))
+
+    def _grow(self, needed):
+        """
+        Make room for 'needed' more bytes
+        """
+
+        capacity = max(self.size + needed, self._capacity + self.grow_chunk)
+        if self._map is not None:
+            self._map.close()
+        self._fp.truncate(capacity)
+        self._map = mmap.mmap(self._fp.fileno(), capacity)
+        self._capacity = capacity
+
+    def append(self, data):
+        """
+        Append a string, or bytes already encoded
+        """
+
+        if isinstance(data, str):
+            data = data.encode("utf-8", "surrogatepass")
+        end = self.size + len(data)
+        if end > self._capacity:
+            self._grow(len(data))
+        self._map[self.size:end] = data
+        self.size = end
+        self.offsets.append(end)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def close(self):
+        """
+        Truncate the data file to its actual size and write the index
+        """
+
+        if self._fp is None:
+            return
+        self._map.flush()
+        self._map.close()
+        self._fp.truncate(self.size)
+        self._fp.close()
+        self._fp = None
+
+        offsets = self.offsets
+        if sys.byteorder != "little":
+            offsets = array.array("Q", offsets)
+            offsets.byteswap()
+        tmp = index_path(self.path) + ".tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(_HEADER.pack(MAGIC, CORPUS_VERSION, len(self)))
+            fp.write(offsets.tobytes())
+        os.replace(tmp, index_path(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def build_corpus(path, tree, nb, seed=None, rng=random):
+    """
+    Generate 'nb' strings of a tree into a corpus. The data file is
+    sized in advance from the expected length of the strings.
+
+    Parameters:
+        - path (string): the data file, the index is "<path>.idx"
+        - tree: the tree returned by 'parse_rand_regex'
+        - nb (int): the number of strings
+        - seed (int, str or bytes): if not None, the string i is
+          'generate_at(tree, seed, i)', and 'rng' is not used
+        - rng: the random generator, the random module by default
+    """
+
+    expected_size = nb * expected_length(tree) * 1.05
+    with CorpusWriter(path, expected_size) as writer:
+        for i in range(nb):
+            if seed is not None:
+                rng = CounterRandom(seed, i)
+            writer.append(produce_randregex(tree, {}, rng))
+
+
+class Corpus:
+    """
+    A read-only corpus backed by memory-mapped files.
+    corpus[i] is a memoryview of the utf-8 bytes of the string i,
+    which must be released before closing the corpus.
+    Attributes:
+        - path: the data file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(index_path(path), "rb") as fp:
+            self._index_map = mmap.mmap(fp.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+        if len(self._index_map) < _HEADER.size:
+            self._index_map.close()
+            raise RandRegexException("{} is not a corpus".format(path))
+        magic, version, self._nb = _HEADER.unpack_from(self._index_map)
+        if magic != MAGIC or version != CORPUS_VERSION:
+            self._index_map.close()
+            raise RandRegexException("{} is not a corpus".format(path))
+
+        self._index_view = memoryview(self._index_map)[_HEADER.size:]
+        if sys.byteorder == "little":
+            self._offsets = self._index_view.cast("Q")
+        else:
+            self._offsets = array.array("Q", self._index_view)
+            self._offsets.byteswap()
+
+        with open(path, "rb") as fp:
+            size = os.fstat(fp.fileno()).st_size
+            if size:
+                self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                self._data = memoryview(self._map)
+            else:
+                self._map = None
+                self._data = memoryview(b"")
+
+    def __len__(self):
+        return self._nb
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._nb
+        if not 0 <= i < self._nb:
+            raise IndexError("corpus index out of range")
+        return self._data[self._offsets[i]:self._offsets[i + 1]]
+
+    def get_str(self, i):
+        """
+        Return the string number i
+        """
+
+        with self[i] as view:
+            return str(view, "utf-8", "surrogatepass")
+
+    def __iter__(self):
+        for i in range(self._nb):
+            yield self[i]
+
+    def close(self):
+        self._data.release()
+        if self._map is not None:
+            self._map.close()
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._index_view.release()
+        self._index_map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
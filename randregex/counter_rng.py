@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a counter-based random generator: the random
+stream of the string number i only depends on (seed, i), so that
+any string of a seeded sequence can be generated in O(1), on any
+worker, without generating the previous ones
+"""
+
+import random
+import hashlib
+import struct
+
+from .randregex import produce_randregex_from_tree
+
+_BLOCK = struct.Struct(">QQ")
+
+
+def seed_key(seed):
+    """
+    Return the 32 bytes key derived from a seed (int, str or bytes)
+    """
+
+    if isinstance(seed, int):
+        data = b"i" + str(seed).encode("ascii")
+    elif isinstance(seed, str):
+        data = b"s" + seed.encode("utf-8")
+    elif isinstance(seed, (bytes, bytearray)):
+        data = b"b" + bytes(seed)
+    else:
+        raise TypeError("The seed must be an int, a str or bytes")
+    return hashlib.blake2b(data, digest_size=32).digest()
+
+
+class CounterRandom(random.Random):
+    """
+    A random.Random whose stream is the keyed blake2b hash of
+    (index, block number) for block number 0, 1, 2...
+    Attributes:
+        - key: the key derived from the seed
+        - index: the index of the stream
+    """
+
+    def __init__(self, seed=0, index=0):
+        self.key = seed_key(seed)
+        self.index = index
+        super().__init__()
+
+    def seed(self, a=None, version=2):
+        """
+        Restart the stream, with a new seed if 'a' is not None
+        """
+
+        if a is not None:
+            self.key = seed_key(a)
+        self._block = 0
+        self._buffer = b""
+        self._pos = 0
+        self.gauss_next = None
+
+    def _next_bytes(self, nb):
+        while len(self._buffer) - self._pos < nb:
+            block = hashlib.blake2b(
+                _BLOCK.pack(self.index, self._block), key=self.key
+            ).digest()
+            self._buffer = self._buffer[self._pos:] + block
+            self._pos = 0
+            self._block += 1
+        res = self._buffer[self._pos:self._pos + nb]
+        self._pos += nb
+        return res
+
+    def getrandbits(self, k):
+        if k < 0:
+            raise ValueError("number of bits must be non-negative")
+        nb = (k + 7) // 8
+        return int.from_bytes(self._next_bytes(nb), "big") >> (nb * 8 - k)
+
+    def random(self):
+        return self.getrandbits(53) * (1.0 / 9007199254740992.0)
+
+    def getstate(self):
+        return (self.key, self.index, self._block, self._buffer, self._pos,
+                self.gauss_next)
+
+    def setstate(self, state):
+        (self.key, self.index, self._block, self._buffer, self._pos,
+         self.gauss_next) = state
+
+
+def generate_at(tree, seed, i, lazy=False):
+    """
+    Generate the string number 'i' of the sequence seeded by 'seed'.
+    The result only depends on (tree, seed, i).
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - seed (int, str or bytes): the seed of the sequence
+        - i (int): the index of the string within the sequence
+        - lazy (bool): see 'produce_randregex_from_tree'
+
+    Returns:
+        string: the random string
+    """
+
+    return produce_randregex_from_tree(
+        tree, lazy=lazy, rng=CounterRandom(seed, i)
+    )
+
+
+def generate_range(tree, seed, start, stop):
+    """
+    Iterate over the strings number 'start' to 'stop' - 1 of the
+    sequence seeded by 'seed'
+    """
+
+    for i in range(start, stop):
+        yield generate_at(tree, seed, i)
@@ -19,7 +19,8 @@ from .randregex import RandRegexException
 
 def parse_nb(treelist, start):
     """
-    Parse %d or %f
+    Parse %d or %f, with optional printf-like flags, width
+    and precision, as in %05d or %-8.3f
     
     Parameters:
         - treelist (list): list of GroupElt, RegexElt or PipeElt
@@ -30,15 +31,26 @@ def parse_nb(treelist, start):
     """
 
     i = start
-
-    if i >= len(treelist) or not RegexElt.IsChar(treelist[i]):
-        raise RandRegexException("Error while parsing %d or %f")
-
-    if treelist[i].elt_val == 'd':
-        return i, "%d"
-
-    if treelist[i].elt_val == 'f':
-        return i, "%f"
+    fmt = "%"
+    part = "flags"
+    while i < len(treelist) and RegexElt.IsChar(treelist[i]):
+        c = treelist[i].elt_val
+        if c == 'd' or c == 'f':
+            if fmt.endswith('.'):
+                break
+            return i, fmt + c
+        elif part == "flags" and c in "-+ 0":
+            fmt += c
+        elif part != "precision" and c == '.':
+            fmt += c
+            part = "precision"
+        elif c >= '0' and c <= '9':
+            fmt += c
+            if part == "flags":
+                part = "width"
+        else:
+            break
+        i = i + 1
 
     raise RandRegexException("Error while parsing %d or %f")
 
@@ -306,10 +318,12 @@ def parse_sbracket(charlist, start):
     Returns:
         - int : the end position
         - list : A of RegexElt (captured caracters between '[' and ']')
+                 where the escaped '[' and ']' are of type ESCAPED_CHAR
     """
 
     res = []
     backslash = False
+    depth = 0
     i = start
     while i < len(charlist):
         if not RegexElt.IsChar(charlist[i]):
@@ -319,11 +333,15 @@ def parse_sbracket(charlist, start):
         c = charlist[i].elt_val
         if backslash:
             if c == ']' or c == '[':
-                res.append(charlist[i])
+                res.append(RegexElt(EltType.ESCAPED_CHAR, c))
             else:
                 res.append(RegexElt(EltType.CHAR, '\\'))
                 res.append(charlist[i])
             backslash = not backslash
+        elif c == ']' and depth > 0:
+            # End of the operand of a class operation "--[...]"
+            depth -= 1
+            res.append(charlist[i])
         elif c == ']':
             if res == []:
                 raise RandRegexException(
@@ -333,6 +351,11 @@ def parse_sbracket(charlist, start):
         elif c == '\\':
             backslash = not backslash
         else:
+            if (c == '[' and len(res) >= 2 and RegexElt.IsChar(res[-1])
+                    and RegexElt.IsChar(res[-2])
+                    and res[-1].elt_val == res[-2].elt_val
+                    and res[-1].elt_val in "-&"):
+                depth += 1
             res.append(charlist[i])
         i = i + 1
 
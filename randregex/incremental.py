@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the incremental parsing of a pattern being edited.
+
+A group "(...){...}" is parsed the same way whatever its context, so
+the tree of a pattern can be built from the trees of its groups: the
+groups are parsed first, then their parent with a placeholder character
+in place of each of them, and the placeholders are replaced by the
+trees of the groups. The source span of every group is kept with its
+tree and its path within the tree of its parent.
+
+After an edit, only the innermost group containing it is parsed again,
+reusing the trees of its subgroups left untouched, and the trees of
+its ancestors are copied along the path to it. When the edit changes
+the structure of the group (an unbalanced parenthesis for instance),
+its parent is parsed again instead, up to the whole pattern. The
+result is always the tree 'parse_rand_regex' would return.
+"""
+
+from .randregex import (
+    RandRegexException, parse_rand_regex, pre_parse_randregex
+)
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .helper_parse_fct import (
+    parse_occ, parse_sbracket, parse_def_groupname, parse_use_groupname
+)
+
+# The placeholder of the subgroup number k is chr(PLACEHOLDER + k)
+PLACEHOLDER = 0xF0000
+
+
+class GroupSpan:
+    """
+    The source span of a group, as found by 'scan_groups'.
+    Attributes:
+        - start: the position of '('
+        - close: the position of ')'
+        - end: the position following the group and its counts
+        - children: the GroupSpan of its direct subgroups
+    """
+
+    def __init__(self, start, close, end, children):
+        self.start = start
+        self.close = close
+        self.end = end
+        self.children = children
+
+
+def scan_groups(text):
+    """
+    Find the groups of a pattern, following the steps 1 and 2 of
+    'parse_rand_regex'. The references "($name)" and the word lists
+    "(@name)" are not groups.
+
+    Returns:
+        list: the GroupSpan of the top-level groups
+    """
+
+    charlist = pre_parse_randregex(text)
+
+    # Step 1: the brackets become single elements
+    elts = []
+    positions = []
+    backslash = False
+    i = 0
+    while i < len(charlist):
+        c = charlist[i].elt_val
+        if backslash:
+            if c != '[' and c != ']':
+                elts.append(RegexElt(EltType.CHAR, '\\'))
+                positions.append(i - 1)
+            elts.append(charlist[i])
+            positions.append(i)
+            backslash = False
+        elif c == '\\':
+            backslash = True
+        elif c == '[':
+            start = i
+            i, _ = parse_sbracket(charlist, i+1)
+            while i+1 < len(charlist) and charlist[i+1].elt_val == '{':
+                i, _ = parse_occ(charlist, i+2)
+            elts.append(RegexElt(EltType.SBRACKET, None))
+            positions.append(start)
+        else:
+            elts.append(charlist[i])
+            positions.append(i)
+        i += 1
+
+    # Step 2: the groups
+    res, i = _scan_rec(elts, positions, 0, 0, False)
+    return res
+
+
+def _scan_rec(elts, positions, start, nbrec, startP):
+    """
+    Same as 'step2_groups_rec', but returns the spans of the groups
+
+    Returns:
+        (list, int): the GroupSpan found, the position of the closing
+        parenthesis or of the end, or (None, i) for a reference
+    """
+
+    res = []
+    backslash = False
+    i = start
+    while i < len(elts):
+        c = elts[i].elt_val
+        if elts[i].elt_type == EltType.SBRACKET:
+            pass
+        elif backslash:
+            backslash = False
+        elif c == '\\':
+            backslash = True
+        elif c == '(':
+            open_pos = positions[i]
+            children, i = _scan_rec(elts, positions, i+1, nbrec+1, True)
+            close_pos = positions[i]
+            while i+1 < len(elts) and elts[i+1].elt_val == '{':
+                i, _ = parse_occ(elts, i+2)
+            if children is not None:
+                res.append(GroupSpan(open_pos, close_pos, positions[i] + 1,
+                                     children))
+        elif c == ')':
+            if nbrec == 0:
+                raise RandRegexException("Parenthesis error")
+            return res, i
+        elif startP and c == '?':
+            i, _ = parse_def_groupname(elts, i+1)
+            startP = False
+        elif startP and (c == '$' or c == '@'):
+            i, _ = parse_use_groupname(elts, i+1)
+            return None, i
+        i += 1
+
+    if nbrec != 0:
+        raise RandRegexException("Parenthesis error")
+    return res, i
+
+
+class SourceGroup:
+    """
+    A group of the edited pattern with its tree.
+    Attributes:
+        - start, close, end: the source span (see GroupSpan)
+        - node: the GroupElt of the group, or the tree for the
+          whole pattern
+        - children: the SourceGroup of its direct subgroups, empty if
+          the group was parsed in one piece
+        - path: the path to the group within the node of its parent
+        - parent: the SourceGroup of its parent
+    """
+
+    def __init__(self, start, close, end):
+        self.start = start
+        self.close = close
+        self.end = end
+        self.node = None
+        self.children = []
+        self.path = None
+        self.parent = None
+
+    def shift(self, delta):
+        self.start += delta
+        self.close += delta
+        self.end += delta
+        for child in self.children:
+            child.shift(delta)
+
+
+def find_placeholders(node, paths, path=()):
+    """
+    Fill 'paths' with the path of every placeholder of a tree.
+    A path is a tuple of steps: an index in a list, ("P", j) for
+    the choice j of a PipeElt, "G" for the content of a GroupElt.
+    """
+
+    if isinstance(node, list):
+        for i, elt in enumerate(node):
+            find_placeholders(elt, paths, path + (i,))
+    elif isinstance(node, PipeElt):
+        for j, (choice, _) in enumerate(node.list_elt):
+            find_placeholders(choice, paths, path + (("P", j),))
+    elif isinstance(node, GroupElt):
+        find_placeholders(node.list_elt, paths, path + ("G",))
+    elif (node.elt_type == EltType.CHAR and len(node.elt_val) == 1
+              and ord(node.elt_val) >= PLACEHOLDER):
+        paths[ord(node.elt_val) - PLACEHOLDER] = path
+
+
+def replace_at(node, path, new):
+    """
+    Return a copy of 'node' where the element at 'path' is 'new'.
+    Only the elements along the path are copied.
+    """
+
+    if not path:
+        return new
+    step = path[0]
+    if step == "G":
+        return GroupElt(replace_at(node.list_elt, path[1:], new),
+                        node.count_infos, node.name)
+    if isinstance(step, tuple):
+        choices = list(node.list_elt)
+        choice, weight = choices[step[1]]
+        choices[step[1]] = (replace_at(choice, path[1:], new), weight)
+        return PipeElt(choices, node.expected_weight)
+    res = list(node)
+    res[step] = replace_at(node[step], path[1:], new)
+    return res
+
+
+class IncrementalParser:
+    """
+    Keeps the tree of a pattern up to date while it is edited.
+    Attributes:
+        - text: the current pattern
+        - tree: the tree of the pattern, as returned by
+          'parse_rand_regex', or None if the pattern is invalid
+        - universe: the characters of the negated classes
+        - nb_parsed: the number of characters parsed by the last
+          update, to measure the reuse
+    """
+
+    def __init__(self, text="", universe=None):
+        self.text = text
+        self.universe = universe
+        self.tree = None
+        self._root = None
+        self.nb_parsed = 0
+        self._rebuild()
+
+    def _rebuild(self):
+        self._root = None
+        self.tree = None
+        self.nb_parsed = 0
+        root = SourceGroup(0, len(self.text), len(self.text))
+        try:
+            self._build(root, scan_groups(self.text), {}, True)
+        except RandRegexException:
+            # Raise the error of a full parse, which keeps the
+            # groups untracked in the unexpected case it succeeds
+            self.nb_parsed = len(self.text)
+            self.tree = parse_rand_regex(self.text, universe=self.universe)
+            return
+        self._root = root
+        self.tree = root.node
+
+    def _build(self, group, spans, reuse, is_root=False):
+        """
+        Compute the node of a group from the spans of its subgroups.
+        The subgroups whose span is a key of 'reuse' are not parsed.
+        """
+
+        text = self.text[group.start:group.end]
+        if text and max(text) >= chr(PLACEHOLDER):
+            # No placeholder is available, parse the group in one piece
+            group.node = self._parse(text, is_root)
+            group.children = []
+            self.nb_parsed += len(text)
+            return
+
+        pieces = []
+        pos = group.start
+        children = []
+        for k, span in enumerate(spans):
+            child = reuse.get((span.start, span.end))
+            if child is None:
+                child = SourceGroup(span.start, span.close, span.end)
+                self._build(child, span.children, reuse)
+            child.parent = group
+            children.append(child)
+            pieces.append(self.text[pos:span.start])
+            pieces.append(chr(PLACEHOLDER + k))
+            pos = span.end
+        pieces.append(self.text[pos:group.end])
+        text = "".join(pieces)
+        self.nb_parsed += len(text)
+
+        node = self._parse(text, is_root)
+        paths = {}
+        find_placeholders(node, paths)
+        for k, child in enumerate(children):
+            child.path = paths[k]
+            node = replace_at(node, child.path, child.node)
+        group.node = node
+        group.children = children
+
+    def _parse(self, text, is_root):
+        tree = parse_rand_regex(text, universe=self.universe)
+        if is_root:
+            return tree
+        # The tree of "(...)" is [PipeElt([([GroupElt], weight)])]
+        return tree[0].list_elt[0][0][0]
+
+    def edit(self, start, end, new_text):
+        """
+        Replace text[start:end] by 'new_text' and update the tree
+
+        Returns:
+            list: the new tree
+
+        Raises:
+            RandRegexException: the new pattern is invalid. The
+            parser keeps the new text and can still be edited.
+        """
+
+        old_len = len(self.text)
+        self.text = self.text[:start] + new_text + self.text[end:]
+        delta = len(new_text) - (end - start)
+        if self._root is None:
+            self._rebuild()
+            return self.tree
+
+        # The innermost group containing the edit within its parentheses
+        group = self._root
+        found = True
+        while found:
+            found = False
+            for child in group.children:
+                if child.start < start and end <= child.close:
+                    group = child
+                    found = True
+                    break
+
+        self.nb_parsed = 0
+        while True:
+            try:
+                if self._update(group, start, end, delta, old_len):
+                    break
+            except RandRegexException:
+                pass
+            if group.parent is None:
+                self._rebuild()
+                return self.tree
+            group = group.parent
+
+        # Copy the ancestors along the path to the updated group
+        while group.parent is not None:
+            group.parent.node = replace_at(group.parent.node, group.path,
+                                           group.node)
+            group = group.parent
+        self.tree = self._root.node
+        return self.tree
+
+    def _update(self, group, start, end, delta, old_len):
+        """
+        Parse again a group containing the edit, reusing its subgroups
+        outside of the edit
+
+        Returns:
+            bool: False if the edit changed the span of the group
+        """
+
+        is_root = group.parent is None
+        if is_root:
+            new_end = len(self.text)
+            spans = scan_groups(self.text)
+        else:
+            new_end = group.end + delta
+            spans = scan_groups(self.text[group.start:new_end])
+            if (len(spans) != 1 or spans[0].start != 0
+                    or spans[0].end != new_end - group.start):
+                return False
+            close = spans[0].close + group.start
+            spans = spans[0].children
+            for span in spans:
+                _offset(span, group.start)
+
+        reuse = {}
+        for child in group.children:
+            if child.end < start:
+                reuse[(child.start, child.end)] = child
+            elif child.start > end:
+                child.shift(delta)
+                reuse[(child.start, child.end)] = child
+
+        old = (group.close, group.end, group.node, group.children)
+        if is_root:
+            group.close = group.end = new_end
+        else:
+            group.close, group.end = close, new_end
+        try:
+            self._build(group, spans, reuse, is_root)
+        except RandRegexException:
+            group.close, group.end, group.node, group.children = old
+            for child in old[3]:
+                if child.start > end + delta:
+                    child.shift(-delta)
+            raise
+        if not is_root:
+            # The spans of the following groups move by delta
+            _shift_after(group.parent, group, delta)
+        return True
+
+
+def _offset(span, delta):
+    span.start += delta
+    span.close += delta
+    span.end += delta
+    for child in span.children:
+        _offset(child, delta)
+
+
+def _shift_after(parent, group, delta):
+    """
+    Shift the spans of the groups following 'group' in its ancestors
+    """
+
+    while parent is not None:
+        after = False
+        for child in parent.children:
+            if after:
+                child.shift(delta)
+            elif child is group:
+                after = True
+        parent.close += delta
+        parent.end += delta
+        group = parent
+        parent = parent.parent
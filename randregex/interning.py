@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the interning layer of the trees: structurally
+identical elements (CountInfos, RegexElt, PipeElt and GroupElt) are
+replaced by a single shared instance, within a tree and across trees.
+
+The table of the shared instances only keeps weak references, so that
+the instances used by no tree anymore are freed. Interned elements
+must never be modified, which is already the case of the trees
+returned by 'parse_rand_regex'.
+"""
+
+import threading
+import weakref
+
+from .randregex import RandRegexException
+from .parsing_structures import CountInfos, RegexElt, PipeElt, GroupElt
+
+_TABLE = weakref.WeakValueDictionary()
+_LOCK = threading.Lock()
+
+
+def _interned(key, build):
+    """
+    Return the shared instance of 'key', created with 'build()'
+    if there is none
+    """
+
+    res = _TABLE.get(key)
+    if res is None:
+        res = build()
+        _TABLE[key] = res
+    return res
+
+
+def intern_count_infos(count_infos):
+    if count_infos is None:
+        return None
+    infos = tuple(tuple(info) for info in count_infos.count_infos)
+    return _interned(
+        ("C", infos, count_infos.expected_weight),
+        lambda: CountInfos([tuple(info) for info in infos],
+                           count_infos.expected_weight, compute=False)
+    )
+
+
+def intern_node(elt):
+    """
+    Return the shared instance of an element, whose children and
+    CountInfos are shared instances too.
+
+    The keys of the table identify the children by their id, which
+    is safe since a shared instance keeps its children alive as
+    long as it is itself in the table.
+    """
+
+    if isinstance(elt, PipeElt):
+        choices = [([intern_node(e) for e in choice], weight)
+                   for choice, weight in elt.list_elt]
+        key = ("P", tuple((tuple(map(id, choice)), weight)
+                          for choice, weight in choices),
+               elt.expected_weight)
+        return _interned(key, lambda: PipeElt(choices, elt.expected_weight))
+
+    if isinstance(elt, GroupElt):
+        list_elt = [intern_node(e) for e in elt.list_elt]
+        count_infos = intern_count_infos(elt.count_infos)
+        key = ("G", tuple(map(id, list_elt)), id(count_infos), elt.name)
+        return _interned(
+            key, lambda: GroupElt(list_elt, count_infos, elt.name)
+        )
+
+    if isinstance(elt, RegexElt):
+        count_infos = intern_count_infos(elt.count_infos)
+        key = ("R", elt.elt_type, elt.elt_val, id(count_infos))
+        return _interned(
+            key, lambda: RegexElt(elt.elt_type, elt.elt_val, count_infos)
+        )
+
+    raise RandRegexException(
+        "Cannot intern an element of type {}".format(type(elt))
+    )
+
+
+def intern_tree(treelist):
+    """
+    Return a tree equal to 'treelist' made of shared instances
+
+    Parameters:
+        treelist (list): list of GroupElt, RegexElt or PipeElt
+
+    Returns:
+        list: list of GroupElt, RegexElt or PipeElt
+    """
+
+    with _LOCK:
+        return [intern_node(elt) for elt in treelist]
+
+
+def nb_interned():
+    """
+    Return the number of shared instances currently alive
+    """
+
+    return len(_TABLE)
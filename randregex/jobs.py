@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains resumable corpus jobs: a large generation is split
+into deterministic shards, each one a range of indices of the sequence
+seeded by the seed of the job, so that the string i of the job is always
+'generate_at(tree, seed, i)' whichever process, machine or run
+generated it.
+
+A job lives in a directory:
+    - "job.json": the pattern, its digest, the seed, the number of
+      strings and the size of the shards
+    - "shard-NNNNNN.dat" and its index: the corpus of the shard N
+      (see randregex.corpus)
+    - "shard-NNNNNN.done": the record of a finished shard, with the
+      checksums of its files, written once they are complete
+    - "shard-NNNNNN.lock": the lock of a shard being generated, whose
+      modification time is refreshed while it is held
+    - "manifest.json": the records of all the shards, written when the
+      last one is done
+Running a job again skips the finished shards, so that a crash only
+loses the shards in progress. Several machines sharing the directory
+may run the same job: the locks keep them from generating the same
+shard, and as the shards are deterministic and their files replaced
+atomically, a shard generated twice after a lock is wrongly taken as
+stale is only wasted work.
+"""
+
+import os
+import json
+import time
+import socket
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from .randregex import (
+    RandRegexException, parse_rand_regex, produce_randregex, __version__
+)
+from .corpus import CorpusWriter, index_path
+from .counter_rng import CounterRandom
+from .length import expected_length
+
+# Version of the layout of the job directories
+JOB_FORMAT = 1
+
+JOB_FILE = "job.json"
+MANIFEST_FILE = "manifest.json"
+
+DEFAULT_SHARD_SIZE = 1000000
+
+# A lock not refreshed for this number of seconds is taken as left by
+# a crashed worker
+STALE_AFTER = 600.0
+
+# Number of strings generated between two refreshes of the lock
+STRINGS_PER_HEARTBEAT = 10000
+
+
+def encode_seed(seed):
+    """
+    Return the JSON value of a seed (int, str or bytes)
+    """
+
+    if isinstance(seed, (bytes, bytearray)):
+        return {"hex": bytes(seed).hex()}
+    if isinstance(seed, (int, str)):
+        return seed
+    raise RandRegexException("The seed must be an int, a str or bytes")
+
+
+def decode_seed(value):
+    if isinstance(value, dict):
+        return bytes.fromhex(value["hex"])
+    return value
+
+
+def write_json(path, data):
+    """
+    Atomically write a JSON file
+    """
+
+    tmp = "{}.{}-{}.tmp".format(path, socket.gethostname(), os.getpid())
+    with open(tmp, "w") as fp:
+        json.dump(data, fp, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def read_json(path):
+    """
+    Return the content of a JSON file, or None if it is missing or
+    incomplete
+    """
+
+    try:
+        with open(path) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def job_digest(pattern):
+    """
+    Return the hex sha256 digest of a pattern, tagged with the library
+    version and the job format. Unlike the digest of the parse cache, it
+    does not depend on the interpreter, as the strings of a job do not.
+    """
+
+    h = hashlib.sha256("{}-{}".format(__version__, JOB_FORMAT).encode("ascii"))
+    h.update(b"\0")
+    h.update(pattern.encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Shard:
+    """
+    A range of indices of a job, generated into one corpus file.
+    Attributes:
+        - number: the number of the shard
+        - start, stop: the indices of its strings, stop excluded
+        - path: the data file of its corpus
+    """
+
+    def __init__(self, directory, number, start, stop):
+        self.number = number
+        self.start = start
+        self.stop = stop
+        base = os.path.join(directory, "shard-{:06d}".format(number))
+        self.path = base + ".dat"
+        self.done_path = base + ".done"
+        self.lock_path = base + ".lock"
+
+    def record(self):
+        """
+        Return the record of the shard if it is done, None otherwise
+        """
+
+        return read_json(self.done_path)
+
+
+class Job:
+    """
+    A corpus job stored in a directory.
+    Attributes:
+        - directory: the directory of the job
+        - pattern: the randregex
+        - digest: the hex digest of the pattern and the library version
+        - seed: the seed of the sequence
+        - nb: the number of strings
+        - shard_size: the number of strings of a shard
+    """
+
+    def __init__(self, directory, pattern, nb, seed, shard_size):
+        self.directory = directory
+        self.pattern = pattern
+        self.digest = job_digest(pattern)
+        self.nb = nb
+        self.seed = seed
+        self.shard_size = shard_size
+        self._tree = None
+
+    def spec(self):
+        return {
+            "pattern": self.pattern,
+            "digest": self.digest,
+            "nb": self.nb,
+            "seed": encode_seed(self.seed),
+            "shard_size": self.shard_size,
+        }
+
+    def parse(self):
+        """
+        Return the tree of the pattern, parsed on the first call
+        """
+
+        if self._tree is None:
+            self._tree = parse_rand_regex(self.pattern)
+        return self._tree
+
+    def shards(self):
+        """
+        Return the list of the Shard of the job
+        """
+
+        return [Shard(self.directory, k, start,
+                      min(start + self.shard_size, self.nb))
+                for k, start in enumerate(range(0, self.nb, self.shard_size))]
+
+    def status(self):
+        """
+        Return a dict with the number of shards and of shards done
+        """
+
+        shards = self.shards()
+        done = sum(1 for shard in shards if os.path.exists(shard.done_path))
+        return {"shards": len(shards), "done": done,
+                "complete": done == len(shards)}
+
+    def manifest(self):
+        """
+        Return the manifest of the job: its spec and the records of
+        its shards, None for the shards not done
+        """
+
+        res = self.spec()
+        res["shards"] = [shard.record() for shard in self.shards()]
+        return res
+
+
+def create_job(directory, pattern, nb, seed, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Create a job, or open it if the directory already holds the same job
+
+    Parameters:
+        - directory (string): the directory of the job, created if needed
+        - pattern (string): the randregex
+        - nb (int): the number of strings
+        - seed (int, str or bytes): the seed of the sequence
+        - shard_size (int): the number of strings of a shard
+
+    Returns:
+        Job: the job
+
+    Raises:
+        RandRegexException: the directory holds a different job
+    """
+
+    if shard_size < 1:
+        raise RandRegexException("The shards must hold a string")
+    job = Job(directory, pattern, nb, seed, shard_size)
+    # Validate the pattern before touching the directory
+    job.parse()
+    os.makedirs(directory, exist_ok=True)
+    spec = read_json(os.path.join(directory, JOB_FILE))
+    if spec is None:
+        write_json(os.path.join(directory, JOB_FILE), job.spec())
+    elif spec != job.spec():
+        raise RandRegexException(
+            "{} holds a different job".format(directory)
+        )
+    return job
+
+
+def open_job(directory):
+    """
+    Open an existing job
+
+    Raises:
+        RandRegexException: the directory holds no job, or a job
+        created by another version of the library, whose strings
+        would differ
+    """
+
+    spec = read_json(os.path.join(directory, JOB_FILE))
+    if spec is None:
+        raise RandRegexException("{} holds no job".format(directory))
+    job = Job(directory, spec["pattern"], spec["nb"],
+              decode_seed(spec["seed"]), spec["shard_size"])
+    if job.digest != spec["digest"]:
+        raise RandRegexException(
+            "The job of {} was created by another version of "
+            "randregex".format(directory)
+        )
+    return job
+
+
+def acquire_lock(shard, stale_after=STALE_AFTER):
+    """
+    Try to take the lock of a shard, taking over a stale lock
+
+    Returns:
+        bool: True if the lock is taken
+    """
+
+    owner = "{} {}\n".format(socket.gethostname(), os.getpid()).encode()
+    for _ in range(2):
+        try:
+            fd = os.open(shard.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.stat(shard.lock_path).st_mtime
+            except FileNotFoundError:
+                continue
+            if age < stale_after:
+                return False
+            # Only one of the workers taking over the lock renames it
+            stale = "{}.{}-{}.stale".format(
+                shard.lock_path, socket.gethostname(), os.getpid()
+            )
+            try:
+                os.rename(shard.lock_path, stale)
+            except FileNotFoundError:
+                return False
+            os.unlink(stale)
+            continue
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(owner)
+        return True
+    return False
+
+
+def release_lock(shard):
+    try:
+        os.unlink(shard.lock_path)
+    except FileNotFoundError:
+        pass
+
+
+def generate_shard(job, shard, stale_after=STALE_AFTER):
+    """
+    Generate a shard whose lock is held, then write its record
+
+    Returns:
+        dict: the record of the shard
+    """
+
+    tree = job.parse()
+    tmp = "{}.{}-{}.tmp".format(shard.path, socket.gethostname(),
+                                os.getpid())
+    nb = shard.stop - shard.start
+    h = hashlib.sha256()
+    heartbeat = time.time()
+    rng = CounterRandom(job.seed, shard.start)
+    with CorpusWriter(tmp, nb * expected_length(tree) * 1.05) as writer:
+        for i in range(shard.start, shard.stop):
+            # Same stream as CounterRandom(seed, i), without deriving
+            # the key again
+            rng.index = i
+            rng.seed()
+            data = produce_randregex(tree, {}, rng).encode(
+                "utf-8", "surrogatepass"
+            )
+            h.update(data)
+            writer.append(data)
+            if (i - shard.start) % STRINGS_PER_HEARTBEAT == 0:
+                now = time.time()
+                if now - heartbeat > stale_after / 4:
+                    os.utime(shard.lock_path)
+                    heartbeat = now
+
+    os.replace(index_path(tmp), index_path(shard.path))
+    os.replace(tmp, shard.path)
+    record = {
+        "number": shard.number,
+        "start": shard.start,
+        "stop": shard.stop,
+        "file": os.path.basename(shard.path),
+        "size": writer.size,
+        "sha256": h.hexdigest(),
+        "index_sha256": file_sha256(index_path(shard.path)),
+    }
+    write_json(shard.done_path, record)
+    return record
+
+
+def run_shard(directory, number, stale_after=STALE_AFTER):
+    """
+    Generate the shard 'number' of the job of 'directory' unless it is
+    done or locked by another worker. Runs in the worker processes.
+
+    Returns:
+        string: "done", "locked" or "generated"
+    """
+
+    job = _open_cached(directory)
+    shard = job.shards()[number]
+    if os.path.exists(shard.done_path):
+        return "done"
+    if not acquire_lock(shard, stale_after):
+        return "locked"
+    try:
+        # Another worker may have finished it before the lock was taken
+        if not os.path.exists(shard.done_path):
+            generate_shard(job, shard, stale_after)
+            return "generated"
+        return "done"
+    finally:
+        release_lock(shard)
+
+
+_TREES = {}
+
+
+def _open_cached(directory):
+    """
+    Open a job, its pattern being parsed once per process
+    """
+
+    job = open_job(directory)
+    tree = _TREES.get(job.pattern)
+    if tree is None:
+        tree = _TREES[job.pattern] = job.parse()
+    job._tree = tree
+    return job
+
+
+def run_job(job, processes=None, stale_after=STALE_AFTER):
+    """
+    Generate the shards of a job not yet done, on local worker
+    processes, and write the manifest once all the shards are done
+
+    Parameters:
+        - job (Job): the job, see 'create_job' and 'open_job'
+        - processes (int): the number of worker processes,
+          os.cpu_count() if None, 1 to run in the current process
+        - stale_after (float): the age in seconds of a stale lock
+
+    Returns:
+        dict: the numbers of the shards "generated", already "done"
+        and "locked" by other workers, and whether the job is "complete"
+    """
+
+    directory = job.directory
+    numbers = [shard.number for shard in job.shards()
+               if not os.path.exists(shard.done_path)]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(numbers) <= 1:
+        results = [run_shard(directory, k, stale_after) for k in numbers]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(
+                run_shard, [directory] * len(numbers), numbers,
+                [stale_after] * len(numbers)
+            ))
+
+    res = {"generated": [], "done": [], "locked": []}
+    for k, result in zip(numbers, results):
+        res[result].append(k)
+    res["complete"] = job.status()["complete"]
+    if res["complete"]:
+        write_json(os.path.join(directory, MANIFEST_FILE), job.manifest())
+    return res
+
+
+def verify_job(job):
+    """
+    Check the files of the shards done against their checksums. The
+    record of a corrupted shard is removed, so that running the job
+    again generates it again.
+
+    Returns:
+        list: the numbers of the corrupted shards
+    """
+
+    res = []
+    for shard in job.shards():
+        record = shard.record()
+        if record is None:
+            continue
+        try:
+            valid = (file_sha256(shard.path) == record["sha256"]
+                     and file_sha256(index_path(shard.path))
+                     == record["index_sha256"])
+        except OSError:
+            valid = False
+        if not valid:
+            res.append(shard.number)
+            os.unlink(shard.done_path)
+    if res:
+        try:
+            os.unlink(os.path.join(job.directory, MANIFEST_FILE))
+        except FileNotFoundError:
+            pass
+    return res
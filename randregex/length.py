@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a length-constrained sampler: it generates
+strings whose length is within [min_len, max_len] without rejection.
+
+The distribution of the output length of every node of the tree is
+computed by dynamic programming (convolutions for sequences and
+repetitions, mixtures for "or lists"), then the strings are sampled
+top-down from the distribution conditioned on the total length.
+Within the allowed lengths, the probabilities of the pattern are kept.
+
+The repetitions of an element that may be empty are split into the
+empty ones and k non empty ones, k following a mixture of binomial
+distributions. Only the k non empty repetitions which fit within
+'max_len' are convolved, so that the cost does not depend on the
+maximum number of repetitions, but on 'max_len' only.
+"""
+
+import math
+import random
+from itertools import compress, count
+from collections import OrderedDict
+
+from .randregex import RandRegexException
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .wordlist import get_word_list
+
+# Number of LengthSampler kept by 'generate'
+SAMPLER_CACHE_SIZE = 32
+
+
+def convolve(a, b, max_len):
+    """
+    Return the distribution of the sum of two independent lengths,
+    truncated to 'max_len'
+    """
+
+    res = [0.0] * (max_len + 1)
+    start = first_nonzero(b)
+    # Only the non null probabilities of 'a' which may still fit
+    for i in compress(range(max_len + 1 - start), a):
+        pa = a[i]
+        res[i + start:] = [r + pa * pb for r, pb in
+                           zip(res[i + start:], b[start:max_len + 1 - i])]
+    return res
+
+
+def first_nonzero(dist):
+    """
+    Return the smallest length of a distribution, len(dist) if it
+    is null
+    """
+
+    return next(compress(count(), dist), len(dist))
+
+
+def binomial_tails(n, s, kmax):
+    """
+    Return the lists (pmf, lower, upper) of P(X = k), P(X <= k) and
+    P(X > k) for k in [0, kmax], where X follows the binomial
+    distribution of n trials of probability s, 0 < s < 1. The small
+    tails are summed directly instead of being computed as 1 - P.
+    """
+
+    log_s = math.log(s)
+    log_q = math.log1p(-s)
+    log_n = math.lgamma(n + 1)
+
+    def pmf_at(k):
+        if k > n:
+            return 0.0
+        return math.exp(log_n - math.lgamma(k + 1) - math.lgamma(n - k + 1)
+                        + k * log_s + (n - k) * log_q)
+
+    pmf = [pmf_at(k) for k in range(kmax + 1)]
+    lower = []
+    t = 0.0
+    for p in pmf:
+        t += p
+        lower.append(min(t, 1.0))
+
+    if lower[-1] <= 0.5:
+        tail = 1.0 - lower[-1]
+    else:
+        # Past the median the terms decrease, the sum stops once
+        # they are negligible
+        tail = 0.0
+        k = kmax + 1
+        while k <= n:
+            p = pmf_at(k)
+            tail += p
+            if p <= tail * 1e-17 and k > n * s + 1:
+                break
+            k += 1
+    upper = [0.0] * (kmax + 1)
+    upper[kmax] = tail
+    for k in range(kmax - 1, -1, -1):
+        upper[k] = upper[k + 1] + pmf[k + 1]
+    return pmf, lower, upper
+
+
+def pick_index(weights, rng):
+    """
+    Randomly pick an index of 'weights' with a probability
+    proportional to its weight
+    """
+
+    r = rng.random() * sum(weights)
+    t = 0.0
+    last = None
+    for i, w in enumerate(weights):
+        if w > 0.0:
+            t += w
+            last = i
+            if r < t:
+                return i
+    return last
+
+
+def count_probas(count_infos):
+    """
+    Return the list of (nb1, nb2, proba) of a CountInfos,
+    where each count of [nb1, nb2] has probability 'proba'.
+    """
+
+    return [
+        (nb1, nb2, weight / count_infos.expected_weight / (nb2 - nb1 + 1))
+        for nb1, nb2, weight in count_infos.count_infos
+    ]
+
+
+def int_segments(nb1, nb2, fmt):
+    """
+    Split the integers of [nb1, nb2] into intervals of integers
+    having the same formatted length.
+
+    Returns:
+        list: list of (lo, hi, length)
+    """
+
+    flags = ""
+    i = 1
+    while fmt[i] in "-+ 0":
+        flags += fmt[i]
+        i += 1
+    width, _, precision = fmt[i:-1].partition(".")
+    width = int(width) if width else 0
+    precision = int(precision) if precision else 0
+    plus = 1 if ("+" in flags or " " in flags) else 0
+
+    res = []
+    for lo, hi, sign in [(max(nb1, 0), nb2, 1), (nb1, min(nb2, -1), -1)]:
+        if lo > hi:
+            continue
+        alo, ahi = (lo, hi) if sign > 0 else (-hi, -lo)
+        digits = 1
+        start = 0
+        while start <= ahi:
+            end = 10 ** digits - 1
+            if end >= alo:
+                length = max(width, max(digits, precision)
+                             + (1 if sign < 0 else plus))
+                slo, shi = max(start, alo), min(end, ahi)
+                if sign > 0:
+                    res.append((slo, shi, length))
+                else:
+                    res.append((-shi, -slo, length))
+            start = end + 1
+            digits += 1
+    return res
+
+
+class LengthSampler:
+    """
+    A sampler of strings of length within [min_len, max_len].
+    Attributes:
+        - tree: the tree returned by 'parse_rand_regex'
+        - min_len, max_len: the allowed lengths
+        - dist: the distribution of the output length of the tree,
+          truncated to 'max_len'
+    """
+
+    def __init__(self, tree, min_len=0, max_len=None):
+        if max_len is None:
+            max_len = max_length(tree)
+        if min_len > max_len:
+            raise RandRegexException("min_len cannot be above max_len")
+        self.tree = tree
+        self.min_len = min_len
+        self.max_len = max_len
+        self._dists = {}
+        self._suffixes = {}
+        self._powers = {}
+        self._segments = {}
+
+        self.dist = self.seq_dist(tree)
+        if sum(self.dist[min_len:]) == 0.0:
+            raise RandRegexException(
+                "The pattern cannot generate a string of length "
+                "between {} and {}".format(min_len, max_len)
+            )
+
+    def seq_dist(self, treelist):
+        """
+        Length distribution of a list of elements, and of all its
+        suffixes, which are kept for the sampling
+        """
+
+        suffixes = self._suffixes.get(id(treelist))
+        if suffixes is None:
+            cur = [1.0] + [0.0] * self.max_len
+            suffixes = [cur]
+            for elt in reversed(treelist):
+                cur = convolve(self.node_dist(elt), cur, self.max_len)
+                suffixes.append(cur)
+            suffixes.reverse()
+            self._suffixes[id(treelist)] = suffixes
+        return suffixes[0]
+
+    def node_dist(self, elt):
+        """
+        Length distribution of one element, with its repetitions
+        """
+
+        dist = self._dists.get(id(elt))
+        if dist is not None:
+            return dist
+
+        dist = [0.0] * (self.max_len + 1)
+        if isinstance(elt, PipeElt):
+            for choice, weight in elt.list_elt:
+                p = weight / elt.expected_weight
+                for l, q in enumerate(self.seq_dist(choice)):
+                    dist[l] += p * q
+        elif isinstance(elt, RegexElt) and elt.elt_type == EltType.NUMBER:
+            for nb1, nb2, p, segments in self.number_segments(elt):
+                for lo, hi, l in segments:
+                    if l <= self.max_len:
+                        dist[l] += p * (hi - lo + 1)
+        else:
+            powers, weights = self.repeat_powers(elt)
+            for power, w in zip(powers, weights):
+                if w > 0.0:
+                    start = first_nonzero(power)
+                    dist[start:] = [d + w * q for d, q in
+                                    zip(dist[start:], power[start:])]
+
+        self._dists[id(elt)] = dist
+        return dist
+
+    def base_dist(self, elt):
+        """
+        Length distribution of a single repetition of a GroupElt
+        or a RegexElt
+        """
+
+        if isinstance(elt, GroupElt):
+            return self.seq_dist(elt.list_elt)
+        if elt.elt_type == EltType.CHAR or elt.elt_type == EltType.ESCAPED_CHAR:
+            dist = [0.0] * (self.max_len + 1)
+            if len(elt.elt_val) <= self.max_len:
+                dist[len(elt.elt_val)] = 1.0
+            return dist
+        if elt.elt_type == EltType.CHAR_CLASS:
+            dist = [0.0] * (self.max_len + 1)
+            if self.max_len >= 1:
+                dist[1] = 1.0
+            return dist
+        raise RandRegexException(
+            "Length-constrained sampling does not support {}".format(
+                "captured group names" if elt.elt_type == EltType.GROUP_NAME
+                else "word lists" if elt.elt_type == EltType.WORD_LIST
+                else str(elt.elt_type)
+            )
+        )
+
+    def nonempty_dist(self, elt):
+        """
+        Return (q, dist): the probability that a single repetition of
+        an element is empty, and the length distribution of a non empty
+        repetition, truncated to 'max_len'
+        """
+
+        base = self.base_dist(elt)
+        q = base[0]
+        if q >= 1.0:
+            return 1.0, [0.0] * (self.max_len + 1)
+        return q, [0.0] + [p / (1.0 - q) for p in base[1:]]
+
+    def repeat_powers(self, elt):
+        """
+        Return (powers, weights): the length distributions of 0, 1,
+        2... non empty repetitions of an element, and the probability
+        of each number of non empty repetitions. The list stops when
+        the repetitions cannot fit within 'max_len' anymore.
+        """
+
+        res = self._powers.get(id(elt))
+        if res is not None:
+            return res
+
+        q, nonempty = self.nonempty_dist(elt)
+        nbmax = max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+        shortest = first_nonzero(nonempty)
+        kmax = 0 if shortest > self.max_len else min(nbmax,
+                                                     self.max_len // shortest)
+        powers = [[1.0] + [0.0] * self.max_len]
+        while len(powers) <= kmax:
+            cur = convolve(nonempty, powers[-1], self.max_len)
+            if sum(cur) < 1e-300:
+                break
+            powers.append(cur)
+        res = powers, self.count_weights(elt, q, len(powers) - 1)
+        self._powers[id(elt)] = res
+        return res
+
+    def count_weights(self, elt, q, kmax):
+        """
+        Return the probabilities of 0, 1... 'kmax' non empty
+        repetitions of an element, each repetition being empty with
+        probability 'q'
+        """
+
+        weights = [0.0] * (kmax + 1)
+        for nb1, nb2, p in count_probas(elt.count_infos):
+            if q <= 0.0:
+                for k in range(nb1, min(nb2, kmax) + 1):
+                    weights[k] += p
+            elif q >= 1.0:
+                weights[0] += p * (nb2 - nb1 + 1)
+            else:
+                # The sum over r in [nb1, nb2] of P(Bin(r, s) = k) is
+                # (P(Bin(nb1, s) <= k) - P(Bin(nb2 + 1, s) <= k)) / s
+                s = 1.0 - q
+                _, lower1, upper1 = binomial_tails(nb1, s, kmax)
+                _, lower2, upper2 = binomial_tails(nb2 + 1, s, kmax)
+                for k in range(kmax + 1):
+                    if lower1[k] <= 0.5:
+                        d = lower1[k] - lower2[k]
+                    else:
+                        d = upper2[k] - upper1[k]
+                    weights[k] += p * max(d, 0.0) / s
+        return weights
+
+    def number_segments(self, elt):
+        """
+        Return, for each count range (nb1, nb2) of a number,
+        (nb1, nb2, proba of each integer, segments of same length)
+        """
+
+        res = self._segments.get(id(elt))
+        if res is None:
+            if elt.elt_val[-1] != "d":
+                raise RandRegexException(
+                    "Length-constrained sampling does not support %f"
+                )
+            res = []
+            for nb1, nb2, weight in elt.count_infos.count_infos:
+                res.append((nb1, nb2,
+                            weight / elt.count_infos.expected_weight
+                            / (nb2 - nb1 + 1),
+                            int_segments(nb1, nb2, elt.elt_val)))
+            self._segments[id(elt)] = res
+        return res
+
+    def generate(self, rng=random):
+        """
+        Generate a random string of length within [min_len, max_len]
+        """
+
+        weights = [0.0] * self.min_len + self.dist[self.min_len:]
+        length = pick_index(weights, rng)
+        return "".join(self.sample_seq(self.tree, length, {}, rng))
+
+    def sample_seq(self, treelist, length, names, rng):
+        res = []
+        suffixes = self._suffixes[id(treelist)]
+        for i, elt in enumerate(treelist):
+            dist = self.node_dist(elt)
+            rest = suffixes[i + 1]
+            l = pick_index(
+                [dist[l] * rest[length - l] for l in range(length + 1)], rng
+            )
+            res.extend(self.sample_node(elt, l, names, rng))
+            length -= l
+        return res
+
+    def sample_node(self, elt, length, names, rng):
+        if isinstance(elt, PipeElt):
+            i = pick_index([
+                weight * self.seq_dist(choice)[length]
+                for choice, weight in elt.list_elt
+            ], rng)
+            return self.sample_seq(elt.list_elt[i][0], length, names, rng)
+
+        if isinstance(elt, RegexElt) and elt.elt_type == EltType.NUMBER:
+            candidates = []
+            for nb1, nb2, p, segments in self.number_segments(elt):
+                for lo, hi, l in segments:
+                    if l == length:
+                        candidates.append((lo, hi, p * (hi - lo + 1)))
+            lo, hi, _ = candidates[pick_index(
+                [w for _, _, w in candidates], rng
+            )]
+            return [elt.elt_val % rng.randint(lo, hi)]
+
+        powers, weights = self.repeat_powers(elt)
+        k = pick_index([w * power[length]
+                        for power, w in zip(powers, weights)], rng)
+
+        if isinstance(elt, RegexElt):
+            # A character is never empty, k is the number of repetitions
+            if elt.elt_type == EltType.CHAR_CLASS:
+                return [elt.elt_val.sample_string(k, rng)]
+            return [elt.elt_val * k]
+
+        # The empty repetitions add nothing to the string
+        res = []
+        _, nonempty = self.nonempty_dist(elt)
+        for j in range(k, 0, -1):
+            rest = powers[j - 1]
+            l = pick_index(
+                [nonempty[l] * rest[length - l] for l in range(length + 1)],
+                rng
+            )
+            tmp = self.sample_seq(elt.list_elt, l, names, rng)
+            if elt.name:
+                names[elt.name] = "".join(tmp)
+            res.extend(tmp)
+            length -= l
+        return res
+
+
+def max_length(treelist):
+    """
+    Return the maximum length of the strings generated by a tree
+    """
+
+    res = 0
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            res += max(max_length(choice) for choice, _ in elt.list_elt)
+        elif isinstance(elt, GroupElt):
+            nbmax = max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+            res += nbmax * max_length(elt.list_elt)
+        elif elt.elt_type == EltType.NUMBER:
+            if elt.elt_val[-1] != "d":
+                raise RandRegexException(
+                    "Length-constrained sampling does not support %f"
+                )
+            res += max(
+                l for nb1, nb2, _ in elt.count_infos.count_infos
+                for _, _, l in int_segments(nb1, nb2, elt.elt_val)
+            )
+        elif elt.elt_type == EltType.GROUP_NAME:
+            raise RandRegexException(
+                "Length-constrained sampling does not support "
+                "captured group names"
+            )
+        elif elt.elt_type == EltType.CHAR_CLASS:
+            res += max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+        elif elt.elt_type == EltType.WORD_LIST:
+            raise RandRegexException(
+                "Length-constrained sampling does not support word lists"
+            )
+        else:
+            nbmax = max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+            res += nbmax * len(elt.elt_val)
+    return res
+
+
+_SAMPLERS = OrderedDict()
+
+def generate(tree, min_len=0, max_len=None, rng=random):
+    """
+    Generate a random string of length within [min_len, max_len],
+    without rejection. The probabilities of the strings within
+    the allowed lengths are kept.
+
+    The LengthSampler of the last trees used are kept, so that
+    repeated calls on the same tree only pay for the sampling.
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - min_len (int), max_len (int): the allowed lengths. If
+          max_len is None, the maximum length of the tree is used.
+        - rng: the random generator, the random module by default
+
+    Returns:
+        string: the random string
+    """
+
+    key = (id(tree), min_len, max_len)
+    cached = _SAMPLERS.get(key)
+    if cached is not None and cached.tree is tree:
+        _SAMPLERS.move_to_end(key)
+        sampler = cached
+    else:
+        sampler = LengthSampler(tree, min_len, max_len)
+        _SAMPLERS[key] = sampler
+        if len(_SAMPLERS) > SAMPLER_CACHE_SIZE:
+            _SAMPLERS.popitem(last=False)
+    return sampler.generate(rng)
+
+
+def expected_length(treelist, names=None):
+    """
+    Return the expected length of the strings generated by a tree.
+    The length of a %f without precision is estimated by the length
+    of a number with all its digits.
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt or PipeElt
+        - names (dict): the expected length of the captured groups
+          met so far, used by the following references
+
+    Returns:
+        float: the expected length
+    """
+
+    if names is None:
+        names = {}
+    res = 0.0
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            res += sum(weight / elt.expected_weight
+                       * expected_length(choice, names)
+                       for choice, weight in elt.list_elt)
+            continue
+
+        nb = sum((nb1 + nb2) / 2 * p * (nb2 - nb1 + 1)
+                 for nb1, nb2, p in count_probas(elt.count_infos))
+        if isinstance(elt, GroupElt):
+            inner = expected_length(elt.list_elt, names)
+            if elt.name:
+                names[elt.name] = inner
+            res += nb * inner
+        elif elt.elt_type == EltType.NUMBER:
+            for nb1, nb2, p in count_probas(elt.count_infos):
+                if elt.elt_val[-1] == "d":
+                    res += sum(p * (hi - lo + 1) * l for lo, hi, l
+                               in int_segments(nb1, nb2, elt.elt_val))
+                else:
+                    value = (nb1 + nb2) / 2 + 1 / 3
+                    text = (str(value) if len(elt.elt_val) == 2
+                            else elt.elt_val % value)
+                    res += p * (nb2 - nb1 + 1) * len(text)
+        elif elt.elt_type == EltType.GROUP_NAME:
+            res += nb * names.get(elt.elt_val, 0.0)
+        elif elt.elt_type == EltType.CHAR_CLASS:
+            res += nb
+        elif elt.elt_type == EltType.WORD_LIST:
+            res += nb * get_word_list(elt.elt_val).mean_length
+        else:
+            res += nb * len(elt.elt_val)
+    return res
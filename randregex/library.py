@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a packed file format for libraries of named
+patterns. The file is read through mmap, so that the pages are
+shared between processes, and each tree is only deserialized the
+first time it is used.
+
+Layout of a library file (all integers are big endian):
+    - header: magic, file version, tree format version, nb of patterns
+    - index: one fixed-width entry per pattern, sorted by name,
+      (name offset, name length, tree offset, tree length)
+    - the names (utf-8), then the serialized trees
+"""
+
+import os
+import mmap
+import struct
+import tempfile
+from collections import OrderedDict
+
+from .randregex import RandRegexException, parse_rand_regex
+from .serialize import FORMAT_VERSION, dump_tree, load_tree
+from .interning import intern_tree
+
+MAGIC = b"RRXL"
+LIBRARY_VERSION = 1
+
+_HEADER = struct.Struct(">4sHHI")
+_ENTRY = struct.Struct(">QIQI")
+
+
+def build_library(path, patterns):
+    """
+    Write a library file
+
+    Parameters:
+        - path (string): the library file
+        - patterns (dict): a map name -> pattern, where each pattern
+          is either a randregex string or a tree returned by
+          'parse_rand_regex'
+    """
+
+    entries = []
+    for name, pattern in patterns.items():
+        if isinstance(pattern, str):
+            pattern = parse_rand_regex(pattern)
+        entries.append((name.encode("utf-8"), dump_tree(pattern)))
+    entries.sort(key=lambda entry: entry[0])
+    for i in range(1, len(entries)):
+        if entries[i][0] == entries[i-1][0]:
+            raise RandRegexException(
+                "The pattern name {} is used twice".format(
+                    entries[i][0].decode("utf-8")
+                )
+            )
+
+    names_start = _HEADER.size + _ENTRY.size * len(entries)
+    trees_start = names_start + sum(len(name) for name, _ in entries)
+    index = []
+    name_offset, tree_offset = names_start, trees_start
+    for name, tree in entries:
+        index.append(_ENTRY.pack(name_offset, len(name),
+                                 tree_offset, len(tree)))
+        name_offset += len(name)
+        tree_offset += len(tree)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(_HEADER.pack(MAGIC, LIBRARY_VERSION, FORMAT_VERSION,
+                                  len(entries)))
+            fp.write(b"".join(index))
+            for name, _ in entries:
+                fp.write(name)
+            for _, tree in entries:
+                fp.write(tree)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class PatternLibrary:
+    """
+    A read-only library of named trees backed by a memory-mapped file.
+    Attributes:
+        - path: the library file
+        - cache_size: the maximum number of deserialized trees kept
+          in memory, the least recently used ones are dropped first
+        - intern: if True, the deserialized trees are interned, so that
+          identical subtrees are shared between the patterns
+    """
+
+    def __init__(self, path, cache_size=1024, intern=False):
+        self.path = path
+        self.cache_size = cache_size
+        self.intern = intern
+        self._cache = OrderedDict()
+        with open(path, "rb") as fp:
+            # mmap refuses empty files, check the size first
+            if os.fstat(fp.fileno()).st_size < _HEADER.size:
+                raise RandRegexException(
+                    "{} is not a pattern library".format(path)
+                )
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, tree_version, self._nb = \
+            _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise RandRegexException("{} is not a pattern library".format(path))
+        if version != LIBRARY_VERSION or tree_version != FORMAT_VERSION:
+            self.close()
+            raise RandRegexException(
+                "The pattern library {} was built by an incompatible "
+                "version and must be rebuilt".format(path)
+            )
+        if len(self._map) < _HEADER.size + self._nb * _ENTRY.size:
+            self.close()
+            raise RandRegexException(
+                "The pattern library {} is truncated".format(path)
+            )
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._map, _HEADER.size + i * _ENTRY.size)
+
+    def _name(self, entry):
+        return self._map[entry[0]:entry[0] + entry[1]]
+
+    def _find(self, name):
+        """
+        Binary search of a name within the index
+
+        Returns:
+            tuple: the index entry, or None if the name is not found
+        """
+
+        key = name.encode("utf-8")
+        lo, hi = 0, self._nb
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            cur = self._name(entry)
+            if cur == key:
+                return entry
+            if cur < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def __getitem__(self, name):
+        tree = self._cache.get(name)
+        if tree is not None:
+            self._cache.move_to_end(name)
+            return tree
+
+        entry = self._find(name)
+        if entry is None:
+            raise KeyError(name)
+        with memoryview(self._map) as view:
+            tree = load_tree(view[entry[2]:entry[2] + entry[3]])
+        if self.intern:
+            tree = intern_tree(tree)
+        self._cache[name] = tree
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tree
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return name in self._cache or self._find(name) is not None
+
+    def __len__(self):
+        return self._nb
+
+    def names(self):
+        """
+        Iterate over the names of the library, in sorted order
+        """
+
+        for i in range(self._nb):
+            yield self._name(self._entry(i)).decode("utf-8")
+
+    def close(self):
+        self._cache.clear()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
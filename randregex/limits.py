@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the limits applied to untrusted patterns.
+
+A pattern is checked before any work is spent on it:
+    - its length, which bounds the work of the first parsing steps
+    - the number of nodes of its tree, counting the characters of
+      the brackets before they are expanded
+    - the worst-case and the expected lengths of its strings, and the
+      worst-case number of nodes visited by the generation, computed
+      from the count informations without generating anything
+The generation itself may be bounded in time and in output size
+by 'generate', which aborts cleanly with a RandRegexException.
+"""
+
+import time
+import random
+
+from .randregex import (
+    RandRegexException, pick_choice, pick_repeat, repeated_value,
+    produce_number, numeric_template, produce_numeric_rows
+)
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .charclass import is_char_class
+from .length import expected_length, int_segments
+from .wordlist import get_word_list
+
+# Number of repetitions of a numeric group produced at once
+ROWS_PER_PIECE = 256
+
+# Number of nodes generated between two checks of the time
+TICKS_PER_CHECK = 1024
+
+
+class Limits:
+    """
+    The limits of a pattern and of its generation. None disables a limit.
+    Attributes:
+        - max_pattern_length: the maximum number of characters
+          of the pattern
+        - max_nodes: the maximum number of nodes of the tree
+        - max_length: the maximum worst-case length of the strings
+        - max_expected_length: the maximum expected length of the strings
+        - max_work: the maximum worst-case number of nodes visited
+          by the generation of a string
+        - max_output: the maximum length of a string during
+          the generation
+        - max_time: the maximum time of the generation of a string,
+          in seconds
+    """
+
+    def __init__(self, max_pattern_length=10000, max_nodes=100000,
+                 max_length=10**7, max_expected_length=10**6,
+                 max_work=10**7, max_output=10**7, max_time=1.0):
+        self.max_pattern_length = max_pattern_length
+        self.max_nodes = max_nodes
+        self.max_length = max_length
+        self.max_expected_length = max_expected_length
+        self.max_work = max_work
+        self.max_output = max_output
+        self.max_time = max_time
+
+
+DEFAULT_LIMITS = Limits()
+
+
+def bracket_size(regex_elt):
+    """
+    Return the number of nodes 'brackets_2_pipes' would create for a
+    RegexElt of type SBRACKET, without creating them
+    """
+
+    charlist = regex_elt.elt_val
+    if is_char_class(charlist):
+        return 1
+    res = 1
+    backslash = False
+    i = 0
+    while i < len(charlist):
+        c = charlist[i].elt_val
+        if backslash:
+            res += 1 if c == '<' or c == '>' else 2
+            backslash = False
+        elif c == '\\':
+            backslash = True
+        elif i+2 < len(charlist) and charlist[i+1].elt_val == '-':
+            res += max(ord(charlist[i+2].elt_val) - ord(c) + 1, 0) + 1
+            i += 2
+        else:
+            res += 1
+        i += 1
+    return res
+
+
+def count_nodes(treelist):
+    """
+    Return the number of nodes of a tree, where the brackets not yet
+    expanded count for the nodes of their expansion
+    """
+
+    res = 0
+    for elt in treelist:
+        res += 1
+        if isinstance(elt, PipeElt):
+            res += sum(count_nodes(choice) for choice, _ in elt.list_elt)
+        elif isinstance(elt, GroupElt):
+            res += count_nodes(elt.list_elt)
+        elif elt.elt_type == EltType.SBRACKET:
+            res += bracket_size(elt)
+    return res
+
+
+def number_length(regex_elt):
+    """
+    Return the maximum length of the numbers of a RegexElt of type NUMBER
+    """
+
+    fmt = regex_elt.elt_val
+    res = 0
+    for nb1, nb2, _ in regex_elt.count_infos.count_infos:
+        if fmt[-1] == "d":
+            res = max(res, max(l for _, _, l in int_segments(nb1, nb2, fmt)))
+        elif len(fmt) == 2:
+            # repr of a float: sign, 17 significant digits, point, exponent
+            res = max(res, 24)
+        else:
+            res = max(res, len(fmt % nb1), len(fmt % nb2))
+    return res
+
+
+def worst_case_length(treelist, names=None):
+    """
+    Return the maximum length of the strings generated by a tree,
+    computed from the count informations only
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt or PipeElt
+        - names (dict): the maximum length of the captured groups
+          met so far, used by the following references
+
+    Returns:
+        int: the maximum length
+    """
+
+    if names is None:
+        names = {}
+    res = 0
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            res += max(worst_case_length(choice, names)
+                       for choice, _ in elt.list_elt)
+            continue
+        if isinstance(elt, RegexElt) and elt.elt_type == EltType.NUMBER:
+            res += number_length(elt)
+            continue
+
+        nbmax = max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+        if isinstance(elt, GroupElt):
+            inner = worst_case_length(elt.list_elt, names)
+            if elt.name:
+                names[elt.name] = max(names.get(elt.name, 0), inner)
+            res += nbmax * inner
+        elif elt.elt_type == EltType.GROUP_NAME:
+            res += nbmax * names.get(elt.elt_val, 0)
+        elif elt.elt_type == EltType.CHAR_CLASS:
+            res += nbmax
+        elif elt.elt_type == EltType.WORD_LIST:
+            res += nbmax * get_word_list(elt.elt_val).max_length
+        else:
+            res += nbmax * len(elt.elt_val)
+    return res
+
+
+def worst_case_work(treelist):
+    """
+    Return the maximum number of nodes visited by the generation
+    of a string, such as 2 * 10**8 for "(a{0}){100000000}"
+    """
+
+    res = 0
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            res += 1 + max(worst_case_work(choice)
+                           for choice, _ in elt.list_elt)
+        elif isinstance(elt, GroupElt):
+            nbmax = max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+            if numeric_template(elt) is not None:
+                res += 1 + nbmax
+            else:
+                res += 1 + nbmax * worst_case_work(elt.list_elt)
+        elif elt.elt_type == EltType.WORD_LIST:
+            res += 1 + max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+        else:
+            res += 1
+    return res
+
+
+def check_pattern(randregex, limits):
+    """
+    Reject a pattern which is too long to be parsed
+    """
+
+    if (limits.max_pattern_length is not None
+            and len(randregex) > limits.max_pattern_length):
+        raise RandRegexException(
+            "The pattern has {} characters, more than the limit "
+            "of {}".format(len(randregex), limits.max_pattern_length)
+        )
+
+
+def check_nodes(treelist, limits):
+    """
+    Reject a partially parsed tree, before its brackets are expanded,
+    when it has too many nodes
+    """
+
+    if limits.max_nodes is None:
+        return
+    nb = count_nodes(treelist)
+    if nb > limits.max_nodes:
+        raise RandRegexException(
+            "The pattern needs {} nodes, more than the limit of {} "
+            "(a large character range may be written as a negated "
+            "class or a shorthand such as \\p{{L}})".format(
+                nb, limits.max_nodes
+            )
+        )
+
+
+def check_lengths(treelist, limits):
+    """
+    Reject a tree whose strings may be too long or too long to generate
+    """
+
+    if limits.max_length is not None:
+        nb = worst_case_length(treelist)
+        if nb > limits.max_length:
+            raise RandRegexException(
+                "The strings of the pattern may have {} characters, more "
+                "than the limit of {}".format(nb, limits.max_length)
+            )
+    if limits.max_expected_length is not None:
+        nb = expected_length(treelist)
+        if nb > limits.max_expected_length:
+            raise RandRegexException(
+                "The strings of the pattern have {:.0f} characters on "
+                "average, more than the limit of {}".format(
+                    nb, limits.max_expected_length
+                )
+            )
+    if limits.max_work is not None:
+        nb = worst_case_work(treelist)
+        if nb > limits.max_work:
+            raise RandRegexException(
+                "The generation of the pattern may visit {} nodes, more "
+                "than the limit of {}".format(nb, limits.max_work)
+            )
+
+
+class Budget:
+    """
+    The remaining output size and time of a generation.
+    Attributes:
+        - limits: the Limits
+        - size: the length generated so far
+        - deadline: the time.monotonic() of the end of the generation,
+          or None
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.size = 0
+        self.deadline = None
+        if limits.max_time is not None:
+            self.deadline = time.monotonic() + limits.max_time
+        self._ticks = 0
+
+    def spend(self, nb):
+        """
+        Account for 'nb' more characters, before they are generated
+        """
+
+        self.size += nb
+        if (self.limits.max_output is not None
+                and self.size > self.limits.max_output):
+            raise RandRegexException(
+                "The generated string exceeds the limit of {} "
+                "characters".format(self.limits.max_output)
+            )
+
+    def tick(self):
+        """
+        Account for one node, the time is checked every TICKS_PER_CHECK
+        """
+
+        self._ticks += 1
+        if self._ticks >= TICKS_PER_CHECK:
+            self._ticks = 0
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                raise RandRegexException(
+                    "The generation exceeds the limit of {} "
+                    "seconds".format(self.limits.max_time)
+                )
+
+
+def produce_limited(treelist, names, rng, budget, out):
+    """
+    Same as produce_randregex, but the pieces are appended to 'out'
+    and accounted in 'budget'
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt or PipeElt
+        - names : a map of generated group names
+        - rng: the random generator
+        - budget (Budget): the remaining output size and time
+        - out (list): the generated pieces
+    """
+
+    for regex_elt in treelist:
+        budget.tick()
+        if isinstance(regex_elt, PipeElt):
+            produce_limited(pick_choice(regex_elt, rng), names, rng,
+                            budget, out)
+            continue
+
+        if (isinstance(regex_elt, RegexElt)
+                and regex_elt.elt_type == EltType.NUMBER):
+            tmp = produce_number(regex_elt, rng)
+            budget.spend(len(tmp))
+            out.append(tmp)
+            continue
+
+        r = pick_repeat(regex_elt.count_infos, rng)
+
+        if isinstance(regex_elt, GroupElt):
+            template = numeric_template(regex_elt)
+            if template is not None:
+                for start in range(0, r, ROWS_PER_PIECE):
+                    budget.tick()
+                    tmp = produce_numeric_rows(
+                        template, min(ROWS_PER_PIECE, r - start), rng
+                    )
+                    budget.spend(len(tmp))
+                    out.append(tmp)
+                continue
+            for _ in range(r):
+                budget.tick()
+                if regex_elt.name:
+                    start = len(out)
+                    produce_limited(regex_elt.list_elt, names, rng,
+                                    budget, out)
+                    names[regex_elt.name] = "".join(out[start:])
+                else:
+                    produce_limited(regex_elt.list_elt, names, rng,
+                                    budget, out)
+        elif regex_elt.elt_type == EltType.CHAR_CLASS:
+            budget.spend(r)
+            out.append(regex_elt.elt_val.sample_string(r, rng))
+        elif regex_elt.elt_type == EltType.WORD_LIST:
+            word_list = get_word_list(regex_elt.elt_val)
+            for _ in range(r):
+                budget.tick()
+                tmp = word_list.sample(rng)
+                budget.spend(len(tmp))
+                out.append(tmp)
+        elif r:
+            tmp = repeated_value(regex_elt, names)
+            budget.spend(r * len(tmp))
+            out.append(tmp * r)
+
+
+def generate(tree, limits=DEFAULT_LIMITS, rng=random):
+    """
+    Generate a random string within the output size and the time of
+    'limits'. The string is never allocated past the size limit.
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - limits (Limits): the limits, DEFAULT_LIMITS by default
+        - rng: the random generator, the random module by default
+
+    Returns:
+        string: the random string
+    """
+
+    out = []
+    produce_limited(tree, {}, rng, Budget(limits), out)
+    return "".join(out)
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains an optional metrics registry recording the parsing
+and the generation: the number of strings per pattern, the parse and
+generation times, the lengths of the strings and how often each choice
+of each PipeElt is picked.
+
+While the metrics are disabled, 'parse_rand_regex' and
+'produce_randregex_from_tree' only test a global against None. Once
+enabled, every parsing and every string are counted, but only a random
+sample of the strings is timed and instrumented, at 'sample_rate',
+so that the metrics can be left on. The strings are counted per thread
+and the counts are summed when read, so that the threads only take the
+lock of the registry for the sampled strings. The generations which bypass
+'produce_randregex_from_tree' (generate_many, the server...) are
+not recorded.
+
+The metrics are exported as a dict by 'snapshot' or in the Prometheus
+text format by 'prometheus'.
+"""
+
+import math
+import time
+import random
+import threading
+from collections import OrderedDict
+
+from . import randregex as core
+from .randregex import (
+    RandRegexException, pick_choice_index, pick_repeat, numeric_template,
+    produce_numeric_rows, produce_randregex
+)
+from .parsing_structures import PipeElt, GroupElt
+from .histogram import Histogram
+
+DEFAULT_SAMPLE_RATE = 0.01
+
+# Maximum number of patterns with their own metrics, the strings of
+# the others are counted under the label OTHER
+MAX_PATTERNS = 1000
+OTHER = "other"
+
+# Maximum number of characters of a pattern used as label
+MAX_LABEL_LENGTH = 64
+
+# One Prometheus bucket every this number of histogram buckets
+PROMETHEUS_STEP = 5
+
+
+def length_histogram():
+    return Histogram(lowest=1, highest=1e9, buckets_per_decade=20)
+
+
+class PatternMetrics:
+    """
+    The metrics of one pattern.
+    Attributes:
+        - label: the name of the pattern in the metrics
+        - tree: the tree, kept alive so that its id stays unique
+        - pipes: the number of each PipeElt of the tree, in preorder
+        - strings: the number of strings generated, summed over the
+          counts of each thread
+        - generation: the Histogram of the sampled generation times
+        - lengths: the Histogram of the sampled lengths
+        - choices: the number of times each choice of each PipeElt
+          was picked in the sampled strings
+    """
+
+    def __init__(self, label, tree):
+        self.label = label
+        self.tree = tree
+        self.pipes = {}
+        if tree is not None:
+            number_pipes(tree, self.pipes)
+        self.counts = {}
+        self.generation = Histogram()
+        self.lengths = length_histogram()
+        self.choices = [[0] * len(pipe.list_elt) for pipe, _ in
+                        sorted(self.pipes.values(), key=lambda p: p[1])]
+
+    @property
+    def strings(self):
+        return sum(list(self.counts.values()))
+
+    def count_string(self):
+        """
+        Count a string generated by the current thread: each thread
+        only writes its own entry of 'counts', so that no lock is needed
+        """
+
+        ident = threading.get_ident()
+        self.counts[ident] = self.counts.get(ident, 0) + 1
+
+
+def number_pipes(treelist, pipes):
+    """
+    Fill 'pipes' with id(pipe) -> (pipe, number) for every PipeElt
+    of a tree, numbered in preorder
+    """
+
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            if id(elt) not in pipes:
+                pipes[id(elt)] = (elt, len(pipes))
+            for choice, _ in elt.list_elt:
+                number_pipes(choice, pipes)
+        elif isinstance(elt, GroupElt):
+            number_pipes(elt.list_elt, pipes)
+
+
+def produce_recorded(treelist, names, rng, pipes, picked):
+    """
+    Same as produce_randregex, with the same use of the random
+    generator, but the choices picked are counted in 'picked'
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt or PipeElt
+        - names : a map of generated group names
+        - rng: the random generator
+        - pipes (dict): the numbers of the PipeElt, see 'number_pipes'
+        - picked (dict): (pipe number, choice number) -> count
+    """
+
+    res = []
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            j = pick_choice_index(elt, rng)
+            key = (pipes[id(elt)][1], j)
+            picked[key] = picked.get(key, 0) + 1
+            res.append(produce_recorded(elt.list_elt[j][0], names, rng, pipes,
+                                        picked))
+        elif isinstance(elt, GroupElt):
+            r = pick_repeat(elt.count_infos, rng)
+            template = numeric_template(elt)
+            if template is not None:
+                res.append(produce_numeric_rows(template, r, rng))
+                continue
+            for _ in range(r):
+                tmp = produce_recorded(elt.list_elt, names, rng, pipes,
+                                       picked)
+                if elt.name:
+                    names[elt.name] = tmp
+                res.append(tmp)
+        else:
+            res.append(produce_randregex([elt], names, rng))
+    return "".join(res)
+
+
+def pattern_label(pattern):
+    if len(pattern) > MAX_LABEL_LENGTH:
+        return pattern[:MAX_LABEL_LENGTH - 3] + "..."
+    return pattern
+
+
+class MetricsRegistry:
+    """
+    The counters and histograms of the parsing and the generation.
+    Attributes:
+        - sample_rate: the fraction of the strings timed and instrumented
+        - start: the time.time() of the creation of the registry
+        - parses: the number of patterns parsed
+        - parse_errors: the number of patterns rejected
+        - parse_time: the Histogram of the parse times
+        - patterns: the PatternMetrics of each pattern, by label
+    """
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, seed=None):
+        if not 0 < sample_rate <= 1:
+            raise RandRegexException("The sample rate must be in ]0, 1]")
+        self.sample_rate = sample_rate
+        self.start = time.time()
+        self.parses = 0
+        self.parse_errors = 0
+        self.parse_time = Histogram()
+        self.patterns = OrderedDict()
+        self._by_tree = {}
+        self._parsed = OrderedDict()
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        # The number of strings before the next sampled one, per thread
+        self._local = threading.local()
+
+    def _next_skip(self):
+        """
+        Return the number of strings before the next sampled one, drawn
+        from a geometric law so that each string is sampled with
+        probability sample_rate
+        """
+
+        if self.sample_rate >= 1:
+            return 0
+        with self._lock:
+            draw = self._rng.random()
+        return int(math.log(1.0 - draw)
+                   / math.log(1.0 - self.sample_rate))
+
+    def parse(self, randregex, intern, universe, limits):
+        """
+        Parse a pattern and record its parse time, see 'parse_rand_regex'
+        """
+
+        start = time.perf_counter()
+        try:
+            tree = core._parse_rand_regex(randregex, intern, universe, limits)
+        except RandRegexException:
+            with self._lock:
+                self.parses += 1
+                self.parse_errors += 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.parses += 1
+            self.parse_time.record(elapsed)
+            # Remember the pattern of the last trees, to label them
+            # when they are generated
+            self._parsed[id(tree)] = (tree, randregex)
+            if len(self._parsed) > MAX_PATTERNS:
+                self._parsed.popitem(last=False)
+        return tree
+
+    def name_tree(self, tree, label):
+        """
+        Record the strings of a tree under 'label' instead of its pattern
+        """
+
+        with self._lock:
+            self._register(tree, label)
+
+    def _register(self, tree, label):
+        pattern = self.patterns.get(label)
+        if pattern is not None:
+            if pattern.tree is tree:
+                return pattern
+            label = "{}#{}".format(label, len(self.patterns))
+        if len(self.patterns) >= MAX_PATTERNS:
+            # The trees counted under OTHER are not kept, so that the
+            # registry stays bounded whatever the number of trees
+            pattern = self.patterns.get(OTHER)
+            if pattern is None:
+                pattern = self.patterns[OTHER] = PatternMetrics(OTHER, None)
+            return pattern
+        pattern = self.patterns[label] = PatternMetrics(label, tree)
+        self._by_tree[id(tree)] = pattern
+        return pattern
+
+    def _pattern(self, tree):
+        """
+        Return the PatternMetrics of a tree, created on its first string.
+        The lock is only taken for the first string of a tree.
+        """
+
+        pattern = self._by_tree.get(id(tree))
+        if pattern is not None and pattern.tree is tree:
+            return pattern
+        if len(self.patterns) >= MAX_PATTERNS:
+            # Once full, the registry only grows the OTHER pattern
+            pattern = self.patterns.get(OTHER)
+            if pattern is not None:
+                return pattern
+        with self._lock:
+            return self._new_pattern(tree)
+
+    def _new_pattern(self, tree):
+        pattern = self._by_tree.get(id(tree))
+        if pattern is not None and pattern.tree is tree:
+            return pattern
+        parsed = self._parsed.get(id(tree))
+        if parsed is not None and parsed[0] is tree:
+            label = pattern_label(parsed[1])
+        else:
+            label = "tree-{}".format(len(self.patterns))
+        return self._register(tree, label)
+
+    def generate(self, tree, lazy, rng):
+        """
+        Generate a string and record it, see 'produce_randregex_from_tree'
+        """
+
+        pattern = self._pattern(tree)
+        pattern.count_string()
+        local = self._local
+        skip = getattr(local, "skip", None)
+        if skip is None:
+            skip = self._next_skip()
+        sampled = skip == 0
+        local.skip = self._next_skip() if sampled else skip - 1
+
+        if lazy:
+            from .rope import produce_rope
+            if not sampled:
+                return produce_rope(tree, {}, rng)
+            start = time.perf_counter()
+            res = produce_rope(tree, {}, rng)
+        elif not sampled:
+            return produce_randregex(tree, {}, rng)
+        else:
+            picked = {}
+            start = time.perf_counter()
+            if pattern.tree is None:
+                res = produce_randregex(tree, {}, rng)
+            else:
+                res = produce_recorded(tree, {}, rng, pattern.pipes, picked)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            pattern.generation.record(elapsed)
+            pattern.lengths.record(len(res))
+            if not lazy:
+                for (k, j), nb in picked.items():
+                    pattern.choices[k][j] += nb
+        return res
+
+    def snapshot(self):
+        """
+        Return the metrics as a dict
+
+        Returns:
+            dict: "uptime", "parse" (count, errors, summary of the
+            parse times) and "patterns", the metrics of each pattern by
+            label: "strings", "strings_per_second", "sampled", the
+            summaries of "generation" and "length", and "choices",
+            the counts of the choices of each PipeElt in the sampled
+            strings
+        """
+
+        with self._lock:
+            uptime = time.time() - self.start
+            res = {
+                "uptime": uptime,
+                "sample_rate": self.sample_rate,
+                "parse": {
+                    "count": self.parses,
+                    "errors": self.parse_errors,
+                    "seconds": self.parse_time.summary(),
+                },
+                "patterns": {},
+            }
+            for label, pattern in self.patterns.items():
+                res["patterns"][label] = {
+                    "strings": pattern.strings,
+                    "strings_per_second": pattern.strings / uptime,
+                    "sampled": pattern.generation.count,
+                    "generation": pattern.generation.summary(),
+                    "length": pattern.lengths.summary(),
+                    "choices": [list(c) for c in pattern.choices],
+                }
+        return res
+
+    def prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format
+        """
+
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP randregex_parses_total Patterns parsed.",
+                "# TYPE randregex_parses_total counter",
+                "randregex_parses_total {}".format(self.parses),
+                "# HELP randregex_parse_errors_total Patterns rejected.",
+                "# TYPE randregex_parse_errors_total counter",
+                "randregex_parse_errors_total {}".format(self.parse_errors),
+            ]
+            prometheus_histogram(lines, "randregex_parse_seconds",
+                                 "Parse times.", [("", self.parse_time)])
+
+            patterns = list(self.patterns.values())
+            lines += [
+                "# HELP randregex_strings_total Strings generated.",
+                "# TYPE randregex_strings_total counter",
+            ]
+            for pattern in patterns:
+                lines.append("randregex_strings_total{{{}}} {}".format(
+                    label_pair("pattern", pattern.label), pattern.strings
+                ))
+            prometheus_histogram(
+                lines, "randregex_generation_seconds",
+                "Generation times of the sampled strings.",
+                [(label_pair("pattern", p.label), p.generation)
+                 for p in patterns]
+            )
+            prometheus_histogram(
+                lines, "randregex_string_length",
+                "Lengths of the sampled strings.",
+                [(label_pair("pattern", p.label), p.lengths)
+                 for p in patterns]
+            )
+            lines += [
+                "# HELP randregex_choices_total Choices picked in the "
+                "sampled strings.",
+                "# TYPE randregex_choices_total counter",
+            ]
+            for pattern in patterns:
+                for k, counts in enumerate(pattern.choices):
+                    for j, nb in enumerate(counts):
+                        lines.append("randregex_choices_total{{{},{},{}}} "
+                                     "{}".format(
+                                         label_pair("pattern", pattern.label),
+                                         label_pair("pipe", str(k)),
+                                         label_pair("choice", str(j)), nb
+                                     ))
+        return "\n".join(lines) + "\n"
+
+
+def label_pair(name, value):
+    value = (value.replace("\\", "\\\\").replace("\"", "\\\"")
+             .replace("\n", "\\n"))
+    return "{}=\"{}\"".format(name, value)
+
+
+def prometheus_histogram(lines, name, help_text, histograms):
+    """
+    Append the lines of a Prometheus histogram, with one series per
+    (labels, Histogram) of 'histograms'
+    """
+
+    lines.append("# HELP {} {}".format(name, help_text))
+    lines.append("# TYPE {} histogram".format(name))
+    for labels, histogram in histograms:
+        sep = "," if labels else ""
+        for bound, nb in histogram.cumulative(PROMETHEUS_STEP):
+            le = "+Inf" if bound == math.inf else "{:.6g}".format(bound)
+            lines.append("{}_bucket{{{}{}le=\"{}\"}} {}".format(
+                name, labels, sep, le, nb
+            ))
+        braces = "{" + labels + "}" if labels else ""
+        lines.append("{}_sum{} {}".format(name, braces, histogram.total))
+        lines.append("{}_count{} {}".format(name, braces, histogram.count))
+
+
+def enable_metrics(sample_rate=DEFAULT_SAMPLE_RATE, registry=None):
+    """
+    Start recording the parsing and the generation
+
+    Parameters:
+        - sample_rate (float): the fraction of the strings timed
+          and instrumented
+        - registry (MetricsRegistry): the registry, a new one if None
+
+    Returns:
+        MetricsRegistry: the registry recording the metrics
+    """
+
+    if registry is None:
+        registry = MetricsRegistry(sample_rate)
+    core._METRICS = registry
+    return registry
+
+
+def disable_metrics():
+    """
+    Stop recording, the registry keeps the metrics recorded so far
+    """
+
+    core._METRICS = None
+
+
+def get_metrics():
+    """
+    Return the MetricsRegistry recording the metrics, or None
+    """
+
+    return core._METRICS
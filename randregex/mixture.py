@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains weighted mixtures of patterns: a pattern is
+picked according to its weight with an alias table, then a string
+is generated from it, in a single call
+"""
+
+import random
+
+from .randregex import parse_rand_regex, produce_randregex
+from .interning import intern_tree
+from .sampling import AliasTable
+
+
+class PatternMix:
+    """
+    A weighted mixture of patterns.
+    Attributes:
+        - trees: the interned trees of the patterns, so that
+          structurally identical subtrees are shared
+        - weights: the weights of the patterns
+        - table: the AliasTable used to pick a pattern
+    """
+
+    def __init__(self, pairs):
+        """
+        Parameters:
+            - pairs (list): list of (pattern, weight) where each
+              pattern is either a randregex string or a tree returned
+              by 'parse_rand_regex', and weight a positive number
+        """
+
+        self.trees = []
+        self.weights = []
+        for pattern, weight in pairs:
+            if isinstance(pattern, str):
+                pattern = parse_rand_regex(pattern)
+            self.trees.append(intern_tree(pattern))
+            self.weights.append(weight)
+        self.table = AliasTable(self.weights)
+
+    def __len__(self):
+        return len(self.trees)
+
+    def generate(self, rng=random):
+        """
+        Pick a pattern according to the weights and generate
+        a random string from it
+        """
+
+        return produce_randregex(self.trees[self.table.sample(rng)], {}, rng)
+
+    def generate_batch(self, nb, rng=random):
+        """
+        Return a list of 'nb' random strings of the mixture
+        """
+
+        trees = self.trees
+        sample = self.table.sample
+        return [produce_randregex(trees[sample(rng)], {}, rng)
+                for _ in range(nb)]
+
+    def stream(self, nb=None, rng=random):
+        """
+        Iterate over 'nb' random strings of the mixture,
+        forever if 'nb' is None
+        """
+
+        trees = self.trees
+        sample = self.table.sample
+        if nb is None:
+            while True:
+                yield produce_randregex(trees[sample(rng)], {}, rng)
+        for _ in range(nb):
+            yield produce_randregex(trees[sample(rng)], {}, rng)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the paced generation used to drive load tests:
+the strings are emitted at a target rate, evenly spaced or as a Poisson
+arrival process, while a producer thread generates them ahead into a
+bounded buffer, so that the jitter of the generation does not delay
+the emissions.
+
+The emission times follow an absolute schedule: a late emission does
+not shift the following ones, so the average rate is kept. The time of
+each generation and the lag of each emission behind its schedule are
+recorded in histograms.
+"""
+
+import time
+import queue
+import random
+import threading
+
+from .randregex import RandRegexException, produce_randregex
+from .threads import freeze_tree, thread_rng
+from .counter_rng import CounterRandom
+from .histogram import Histogram
+
+# Below this delay before an emission, wait actively instead of
+# sleeping, as time.sleep may oversleep by up to a millisecond
+SPIN_DELAY = 0.0005
+
+
+class PacedGenerator:
+    """
+    Emits the strings of a tree at a target rate.
+    Attributes:
+        - tree: the tree returned by 'parse_rand_regex'
+        - rate: the target number of strings per second
+        - poisson: if True, the delays between two emissions are
+          exponential (Poisson arrivals), otherwise they are all 1 / rate
+        - buffer_size: the maximum number of strings generated ahead
+        - generation: the Histogram of the generation times
+        - lag: the Histogram of the delays between the scheduled and
+          the actual emissions
+        - emitted: the number of strings emitted
+        - underruns: the number of emissions which had to wait for
+          the generation of their string
+    """
+
+    def __init__(self, tree, rate, poisson=False, buffer_size=1024,
+                 seed=None):
+        """
+        'seed' (int, str or bytes) makes both the strings and the
+        Poisson delays reproducible: the string number i is then
+        'generate_at(tree, seed, i)'
+        """
+
+        if rate <= 0:
+            raise RandRegexException("The rate must be positive")
+        if buffer_size < 1:
+            raise RandRegexException("The buffer must hold a string")
+        self.tree = freeze_tree(tree)
+        self.rate = rate
+        self.poisson = poisson
+        self.buffer_size = buffer_size
+        self.seed = seed
+        self.generation = Histogram()
+        self.lag = Histogram()
+        self.emitted = 0
+        self.underruns = 0
+        self._buffer = queue.Queue(maxsize=buffer_size)
+        self._stop = threading.Event()
+        self._producer = None
+        self._error = None
+        self._arrivals = random.Random(seed)
+
+    def _produce(self):
+        """
+        Generate strings into the buffer until the generator is closed
+        """
+
+        rng = thread_rng()
+        i = 0
+        put = self._buffer.put
+        record = self.generation.record
+        released = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                if self.seed is not None:
+                    rng = CounterRandom(self.seed, i)
+                start = time.perf_counter()
+                res = produce_randregex(self.tree, {}, rng)
+                end = time.perf_counter()
+                record(end - start)
+                i += 1
+                if end - released > SPIN_DELAY:
+                    # Release the GIL, so that a due emission does not
+                    # wait for the switch interval of the interpreter
+                    time.sleep(0)
+                    released = end
+                while True:
+                    try:
+                        put(res, timeout=0.1)
+                        break
+                    except queue.Full:
+                        if self._stop.is_set():
+                            return
+        except Exception as e:
+            self._error = e
+            # The sentinel waits for room like the strings, so that it is
+            # not lost when the error happens with a full buffer
+            while not self._stop.is_set():
+                try:
+                    put(None, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+    def start(self):
+        """
+        Start the producer thread, which fills the buffer
+        """
+
+        if self._producer is None:
+            self._producer = threading.Thread(target=self._produce,
+                                              daemon=True)
+            self._producer.start()
+
+    def fill(self):
+        """
+        Start the producer thread and wait until the buffer is full
+        """
+
+        self.start()
+        while (not self._buffer.full() and self._error is None
+               and self._producer.is_alive()):
+            time.sleep(0.001)
+
+    def wait_until(self, target):
+        """
+        Wait until time.perf_counter() reaches 'target'
+        """
+
+        while True:
+            delay = target - time.perf_counter()
+            if delay <= 0:
+                return
+            # Sleeping 0 lets the producer run while waiting actively
+            time.sleep(delay - SPIN_DELAY if delay > SPIN_DELAY else 0)
+
+    def emit(self, nb=None, duration=None):
+        """
+        Iterate over the strings, each one returned at its scheduled
+        time. The buffer is filled first, then the first string is
+        emitted at once.
+
+        Parameters:
+            - nb (int): the number of strings, unlimited if None
+            - duration (float): the duration of the emission in seconds,
+              unlimited if None
+        """
+
+        self.fill()
+        get = self._buffer.get
+        get_nowait = self._buffer.get_nowait
+        record = self.lag.record
+        gap = 1.0 / self.rate
+        expovariate = self._arrivals.expovariate
+        start = time.perf_counter()
+        scheduled = start
+        end = None if duration is None else start + duration
+        count = 0
+        while nb is None or count < nb:
+            if end is not None and scheduled >= end:
+                return
+            self.wait_until(scheduled)
+            try:
+                res = get_nowait()
+            except queue.Empty:
+                self.underruns += 1
+                res = get()
+            if res is None and self._error is not None:
+                raise self._error
+            record(max(time.perf_counter() - scheduled, 0.0))
+            self.emitted += 1
+            count += 1
+            yield res
+            if self.poisson:
+                scheduled += expovariate(self.rate)
+            else:
+                scheduled = start + count * gap
+
+    def __iter__(self):
+        return self.emit()
+
+    def close(self):
+        """
+        Stop the producer thread
+        """
+
+        self._stop.set()
+        if self._producer is not None:
+            self._producer.join()
+            self._producer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def stats(self):
+        """
+        Return the statistics of the emission
+
+        Returns:
+            dict: the number of strings emitted, the number of buffer
+            underruns, and the summaries of the generation and lag
+            histograms (see Histogram.summary)
+        """
+
+        return {
+            "emitted": self.emitted,
+            "underruns": self.underruns,
+            "generation": self.generation.summary(),
+            "lag": self.lag.summary(),
+        }
+
+
+def paced(tree, rate, nb=None, duration=None, poisson=False,
+          buffer_size=1024, seed=None):
+    """
+    Iterate over strings of a tree emitted at 'rate' strings per second,
+    see PacedGenerator. The producer thread stops with the iteration.
+    """
+
+    with PacedGenerator(tree, rate, poisson, buffer_size, seed) as generator:
+        yield from generator.emit(nb, duration)
@@ -34,6 +34,7 @@ class CountInfos:
         if not compute:
             self.count_infos = count_infos
             self.expected_weight = expected_weight
+            return
 
         self.count_infos, self.expected_weight = \
             CountInfos.computeWeightInfos(
@@ -105,6 +106,8 @@ class EltType(Enum):
     NUMBER = 3
     CHAR = 4
     ESCAPED_CHAR = 5
+    CHAR_CLASS = 6
+    WORD_LIST = 7
 
 class RegexElt:
     """
@@ -114,6 +117,9 @@ class RegexElt:
         - A number, corresponding to something like "%d" or "%f"
         - A char, corresponding to something like "c"
         - An escaped char, corresponding to something like "\\{"
+        - A character class, corresponding to something like "[^'\"]",
+          whose value is a CharRanges
+        - A word list, corresponding to something like "(@firstnames)"
     An element may also contains counting informations,
     for instance "($var){2,3}{4,5}" comes with [(2,3,50),(4,5,50)]
     as count_infos.
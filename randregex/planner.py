@@ -0,0 +1,477 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a planner of the generation: it inspects a tree,
+estimates the cost of the possible strategies of each subtree and
+keeps the cheapest one:
+    - literal: the subtree always generates the same string, which
+      is computed once (consecutive literals are merged into one run)
+    - class: a character class, whose repetitions are drawn in a
+      single call to rng.choices or CharRanges.sample_string
+    - numeric: a group of numbers and characters, generated in bulk
+      (see 'produce_numeric_rows')
+    - scalar: the recursive walk of 'produce_randregex', required by
+      the captured groups, their references and the alternatives
+
+The strings are generated with the same probabilities as
+'produce_randregex', but not from the same random draws.
+
+The costs are in arbitrary units, roughly the number of Python
+operations; 'explain' shows the plan with the expected cost per string.
+"""
+
+import random
+import itertools
+
+from .randregex import (
+    pick_choice, pick_repeat, repeated_value, produce_number,
+    numeric_template, produce_numeric_rows
+)
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .wordlist import get_word_list
+
+# Cost of one visit of a node by the recursive walker
+COST_NODE = 1.0
+# Cost of one random draw and of the walk of its weights
+COST_DRAW = 1.0
+COST_WEIGHT = 0.05
+# Cost of one character drawn by rng.choices or sample_string
+COST_BULK_CHAR = 0.25
+# Cost of one number formatted by a numeric template
+COST_BULK_NUMBER = 0.6
+# Cost of appending a piece to the output
+COST_APPEND = 0.2
+
+
+def choice_probas(pipe_elt):
+    """
+    Return the probability of each choice of a PipeElt,
+    as picked by 'pick_choice'
+    """
+
+    res = []
+    t = 0
+    prev = -1
+    last = pipe_elt.expected_weight - 1
+    for choice, weight in pipe_elt.list_elt:
+        t += weight
+        cur = min(t, last)
+        res.append(max(cur - prev, 0) / pipe_elt.expected_weight)
+        prev = max(prev, cur)
+    res[-1] += max(last - prev, 0) / pipe_elt.expected_weight
+    return res
+
+
+def expected_count(count_infos):
+    """
+    Return the expected number of repetitions of a CountInfos,
+    as picked by 'pick_count' and randint
+    """
+
+    res = 0.0
+    t = 0
+    prev = -1
+    last = count_infos.expected_weight - 1
+    for nb1, nb2, weight in count_infos.count_infos:
+        t += weight
+        cur = min(t, last)
+        res += max(cur - prev, 0) / count_infos.expected_weight \
+            * (nb1 + nb2) / 2
+        prev = max(prev, cur)
+    return res + max(last - prev, 0) / count_infos.expected_weight \
+        * (nb1 + nb2) / 2
+
+
+def is_fixed(count_infos):
+    return (len(count_infos.count_infos) == 1
+            and count_infos.count_infos[0][0] == count_infos.count_infos[0][1])
+
+
+def constant_string(treelist):
+    """
+    Return the string always generated by a tree, or None if the tree
+    may generate several strings or captures a group
+    """
+
+    res = ""
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            if len(elt.list_elt) != 1:
+                return None
+            tmp = constant_string(elt.list_elt[0][0])
+        elif isinstance(elt, GroupElt):
+            if elt.name or not is_fixed(elt.count_infos):
+                return None
+            tmp = constant_string(elt.list_elt)
+            if tmp is not None:
+                tmp *= elt.count_infos.count_infos[0][0]
+        elif (elt.elt_type == EltType.CHAR
+                  or elt.elt_type == EltType.ESCAPED_CHAR):
+            if not is_fixed(elt.count_infos):
+                return None
+            tmp = elt.elt_val * elt.count_infos.count_infos[0][0]
+        else:
+            return None
+        if tmp is None:
+            return None
+        res += tmp
+    return res
+
+
+def single_char_table(elt):
+    """
+    Return (chars, cum_weights) if an element generates exactly one
+    character among a fixed table, such as a bracket, or None
+    """
+
+    if isinstance(elt, PipeElt):
+        return class_table(elt)
+    if not is_fixed(elt.count_infos) or elt.count_infos.count_infos[0][0] != 1:
+        return None
+    if isinstance(elt, GroupElt):
+        if elt.name or len(elt.list_elt) != 1:
+            return None
+        return single_char_table(elt.list_elt[0])
+    if (len(elt.elt_val) == 1 and (elt.elt_type == EltType.CHAR
+                                   or elt.elt_type == EltType.ESCAPED_CHAR)):
+        return [elt.elt_val], [1.0]
+    return None
+
+
+def class_table(pipe_elt):
+    """
+    Return (chars, cum_weights) for a PipeElt whose choices are
+    single characters, or None
+    """
+
+    chars = []
+    probas = []
+    for (choice, _), proba in zip(pipe_elt.list_elt, choice_probas(pipe_elt)):
+        if len(choice) != 1:
+            return None
+        table = single_char_table(choice[0])
+        if table is None:
+            return None
+        prev = 0.0
+        for c, p in zip(*table):
+            chars.append(c)
+            probas.append((p - prev) * proba)
+            prev = p
+    return chars, list(itertools.accumulate(probas))
+
+
+class PlanNode:
+    """
+    One step of a plan.
+    Attributes:
+        - strategy: "literal", "class", "numeric" or "scalar"
+        - label: a short description of the subtree
+        - cost: the expected cost of the subtree per string
+        - children: the plans of the sequences of the subtree,
+          as (label, list of PlanNode)
+        - run: the function run(rng, names, out) appending the
+          generated pieces to the list 'out'
+    """
+
+    def __init__(self, strategy, label, cost, run, children=()):
+        self.strategy = strategy
+        self.label = label
+        self.cost = cost
+        self.run = run
+        self.children = list(children)
+
+
+def plan_sequence(treelist):
+    """
+    Return the list of PlanNode of a sequence of elements, where the
+    groups repeated once are flattened and the consecutive literals
+    are merged
+    """
+
+    res = []
+    for elt in treelist:
+        if isinstance(elt, PipeElt) and len(elt.list_elt) == 1:
+            nodes = plan_sequence(elt.list_elt[0][0])
+        elif (isinstance(elt, GroupElt) and not elt.name
+                  and is_fixed(elt.count_infos)
+                  and elt.count_infos.count_infos[0][0] == 1
+                  and numeric_template(elt) is None):
+            nodes = plan_sequence(elt.list_elt)
+        else:
+            nodes = [plan_node(elt)]
+        for node in nodes:
+            if (node.strategy == "literal" and res
+                    and res[-1].strategy == "literal"):
+                node = literal_node(res.pop().text + node.text)
+            res.append(node)
+    return res
+
+
+def literal_node(text):
+    def run(rng, names, out):
+        out.append(text)
+    node = PlanNode("literal", repr(text), COST_APPEND, run)
+    node.text = text
+    return node
+
+
+def run_sequence(nodes, rng, names, out):
+    for node in nodes:
+        node.run(rng, names, out)
+
+
+def sequence_cost(nodes):
+    return sum(node.cost for node in nodes)
+
+
+def plan_node(elt):
+    """
+    Return the cheapest PlanNode of an element
+    """
+
+    text = constant_string([elt])
+    if text is not None:
+        return literal_node(text)
+
+    if isinstance(elt, PipeElt):
+        return plan_pipe(elt)
+    if isinstance(elt, GroupElt):
+        return plan_group(elt)
+    return plan_regex_elt(elt)
+
+
+def plan_pipe(elt):
+    choices = [(plan_sequence(choice), choice)
+               for choice, _ in elt.list_elt]
+    plans = {id(choice): nodes for nodes, choice in choices}
+    probas = choice_probas(elt)
+    cost = COST_NODE + COST_DRAW + COST_WEIGHT * len(elt.list_elt) + sum(
+        p * sequence_cost(nodes) for p, (nodes, _) in zip(probas, choices)
+    )
+
+    table = class_table(elt)
+    bulk_cost = COST_NODE + COST_BULK_CHAR + COST_APPEND
+    if table is not None and bulk_cost < cost:
+        chars, cum = table
+        def run(rng, names, out):
+            out.append(rng.choices(chars, cum_weights=cum)[0])
+        return PlanNode("class", "[{} chars]".format(len(chars)),
+                        bulk_cost, run)
+
+    def run(rng, names, out):
+        run_sequence(plans[id(pick_choice(elt, rng))], rng, names, out)
+    return PlanNode(
+        "scalar", "{} alternatives".format(len(elt.list_elt)), cost, run,
+        [("alternative {} ({:.0%})".format(i + 1, p), nodes)
+         for i, (p, (nodes, _)) in enumerate(zip(probas, choices))]
+    )
+
+
+def count_drawer(count_infos):
+    """
+    Return (draw, cost): the function draw(rng) returning a number of
+    repetitions, and its cost. A fixed count needs no random draw.
+    """
+
+    if is_fixed(count_infos):
+        nb = count_infos.count_infos[0][0]
+        return (lambda rng: nb), 0.0
+
+    def draw(rng):
+        return pick_repeat(count_infos, rng)
+    return draw, 2 * COST_DRAW + COST_WEIGHT * len(count_infos.count_infos)
+
+
+def plan_group(elt):
+    count_infos = elt.count_infos
+    reps = expected_count(count_infos)
+    draw, count_cost = count_drawer(count_infos)
+
+    template = numeric_template(elt)
+    if template is not None:
+        def run(rng, names, out):
+            out.append(produce_numeric_rows(template, draw(rng), rng))
+        return PlanNode(
+            "numeric", "({} numbers per repetition)".format(len(template[1])),
+            COST_NODE + count_cost + reps * len(template[1])
+            * COST_BULK_NUMBER + COST_APPEND, run
+        )
+
+    nodes = plan_sequence(elt.list_elt)
+    cost = COST_NODE + count_cost + reps * sequence_cost(nodes)
+
+    if not elt.name and len(elt.list_elt) == 1:
+        table = single_char_table(elt.list_elt[0])
+        bulk_cost = COST_NODE + count_cost + reps * COST_BULK_CHAR \
+            + COST_APPEND
+        if table is not None and bulk_cost < cost:
+            chars, cum = table
+            def run(rng, names, out):
+                out.append("".join(rng.choices(
+                    chars, cum_weights=cum, k=draw(rng)
+                )))
+            return PlanNode("class", "[{} chars]".format(len(chars)),
+                            bulk_cost, run)
+
+    name = elt.name
+    if name:
+        def run(rng, names, out):
+            for _ in range(draw(rng)):
+                tmp = []
+                run_sequence(nodes, rng, names, tmp)
+                names[name] = "".join(tmp)
+                out.extend(tmp)
+        label = "group {} (captured)".format(name)
+    else:
+        def run(rng, names, out):
+            for _ in range(draw(rng)):
+                run_sequence(nodes, rng, names, out)
+        label = "group"
+    return PlanNode("scalar", label, cost, run, [("repeated", nodes)])
+
+
+def plan_regex_elt(elt):
+    count_infos = elt.count_infos
+    reps = expected_count(count_infos)
+    draw, count_cost = count_drawer(count_infos)
+    elt_type = elt.elt_type
+    value = elt.elt_val
+
+    if elt_type == EltType.NUMBER:
+        def run(rng, names, out):
+            out.append(produce_number(elt, rng))
+        return PlanNode("scalar", "number " + value, COST_NODE + COST_DRAW
+                        + COST_WEIGHT * len(count_infos.count_infos)
+                        + COST_DRAW + COST_APPEND, run)
+
+    if elt_type == EltType.CHAR_CLASS:
+        def run(rng, names, out):
+            out.append(value.sample_string(draw(rng), rng))
+        return PlanNode(
+            "class", "[{} chars in {} ranges]".format(
+                value.size, len(value.ranges)
+            ),
+            COST_NODE + count_cost + reps * 2 * COST_BULK_CHAR + COST_APPEND,
+            run
+        )
+
+    if elt_type == EltType.GROUP_NAME:
+        def run(rng, names, out):
+            nb = draw(rng)
+            out.append(repeated_value(elt, names) * nb if nb else "")
+        return PlanNode("scalar", "reference " + value,
+                        COST_NODE + count_cost + COST_APPEND, run)
+
+    if elt_type == EltType.WORD_LIST:
+        def run(rng, names, out):
+            word_list = get_word_list(value)
+            for _ in range(draw(rng)):
+                out.append(word_list.sample(rng))
+        return PlanNode("scalar", "word list " + value,
+                        COST_NODE + count_cost
+                        + reps * (COST_DRAW + COST_APPEND), run)
+
+    def run(rng, names, out):
+        out.append(value * draw(rng))
+    return PlanNode("scalar", repr(value) + " repeated",
+                    COST_NODE + count_cost + COST_APPEND, run)
+
+
+class Plan:
+    """
+    The execution plan of a tree.
+    Attributes:
+        - tree: the tree returned by 'parse_rand_regex'
+        - nodes: the list of PlanNode of the tree
+        - cost: the expected cost per string of the plan
+        - scalar_cost: the expected cost per string of the plan
+          using only the scalar strategy
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.nodes = plan_sequence(tree)
+        self.cost = sequence_cost(self.nodes)
+        self.scalar_cost = scalar_cost(tree)
+
+    def generate(self, rng=random):
+        """
+        Generate a random string following the plan
+        """
+
+        out = []
+        run_sequence(self.nodes, rng, {}, out)
+        return "".join(out)
+
+    def explain(self):
+        """
+        Return a text description of the plan, one line per node
+        with its strategy and expected cost per string
+        """
+
+        lines = ["plan: expected cost {:.1f} per string "
+                 "(scalar walk {:.1f})".format(self.cost, self.scalar_cost)]
+
+        def describe(nodes, depth):
+            for node in nodes:
+                lines.append("{}{:<8} {:<40} cost {:.1f}".format(
+                    "  " * depth, node.strategy, node.label, node.cost
+                ))
+                for label, children in node.children:
+                    if len(node.children) > 1:
+                        lines.append("{}{}".format("  " * (depth + 1), label))
+                        describe(children, depth + 2)
+                    else:
+                        describe(children, depth + 1)
+        describe(self.nodes, 1)
+        return "\n".join(lines)
+
+
+def scalar_cost(treelist):
+    """
+    Return the expected cost per string of 'produce_randregex'
+    """
+
+    res = 0.0
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            res += COST_NODE + COST_DRAW + COST_WEIGHT * len(elt.list_elt)
+            res += sum(p * scalar_cost(choice) for p, (choice, _)
+                       in zip(choice_probas(elt), elt.list_elt))
+            continue
+        count_cost = (2 * COST_DRAW
+                      + COST_WEIGHT * len(elt.count_infos.count_infos))
+        if isinstance(elt, GroupElt):
+            template = numeric_template(elt)
+            if template is not None:
+                res += COST_NODE + count_cost + expected_count(
+                    elt.count_infos) * len(template[1]) * COST_BULK_NUMBER
+            else:
+                res += COST_NODE + count_cost + expected_count(
+                    elt.count_infos) * (scalar_cost(elt.list_elt)
+                                        + COST_APPEND)
+        elif elt.elt_type == EltType.NUMBER:
+            res += COST_NODE + count_cost + COST_APPEND
+        elif elt.elt_type == EltType.CHAR_CLASS:
+            res += COST_NODE + count_cost + expected_count(
+                elt.count_infos) * 2 * COST_BULK_CHAR + COST_APPEND
+        else:
+            res += COST_NODE + count_cost + expected_count(
+                elt.count_infos) * COST_APPEND
+    return res
+
+
+def plan_tree(tree):
+    """
+    Return the Plan of a tree returned by 'parse_rand_regex'
+    """
+
+    return Plan(tree)
+
+
+def explain(tree):
+    """
+    Return the text description of the plan of a tree
+    """
+
+    return Plan(tree).explain()
@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a prefix-constrained sampler: it generates
+strings of a pattern which start with a given prefix, without
+rejection, keeping the relative probabilities of the pattern.
+
+The tree is walked while tracking the offset within the prefix which
+has already been matched. For every node and every start offset, the
+probability of each end offset is computed once (the offset len(prefix)
+meaning that the whole prefix is matched). The strings are then sampled
+top-down with the choices of each "or list", count and character
+reweighted by the probability to still match the prefix. As soon as
+the prefix is matched, the rest is generated as usual.
+"""
+
+import random
+from collections import OrderedDict
+
+from .randregex import RandRegexException, produce_randregex
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .wordlist import get_word_list
+
+# Number of PrefixSampler kept by 'generate_with_prefix'
+SAMPLER_CACHE_SIZE = 32
+
+# Maximum number of integers enumerated for formatted numbers
+MAX_ENUMERATED = 100000
+
+# Repetitions which are still not fully matched with a probability
+# below this threshold are neglected
+NEGLIGIBLE = 1e-12
+
+
+def add_to(dist, key, proba):
+    if proba > 0.0:
+        dist[key] = dist.get(key, 0.0) + proba
+
+
+def pick_key(weights, rng):
+    """
+    Randomly pick a key of the dict 'weights' with a probability
+    proportional to its weight
+    """
+
+    r = rng.random() * sum(weights.values())
+    t = 0.0
+    last = None
+    for key, w in weights.items():
+        if w > 0.0:
+            t += w
+            last = key
+            if r < t:
+                return key
+    return last
+
+
+def startswith_intervals(s, lo, hi):
+    """
+    Return the intervals of the non-negative integers of [lo, hi]
+    whose decimal representation starts with 's'
+    """
+
+    if s == "":
+        return [(lo, hi)] if lo <= hi else []
+    if not s.isdigit():
+        return []
+    if s[0] == "0":
+        return [(0, 0)] if s == "0" and lo <= 0 <= hi else []
+    res = []
+    v = int(s)
+    mult = 1
+    while v * mult <= hi:
+        a, b = max(v * mult, lo), min((v + 1) * mult - 1, hi)
+        if a <= b:
+            res.append((a, b))
+        mult *= 10
+    return res
+
+
+def int_matches(nb1, nb2, fmt, s, exact):
+    """
+    Return the intervals of the integers of [nb1, nb2] whose formatted
+    representation is 's' (if 'exact') or starts with 's'
+    """
+
+    if fmt != "%d":
+        if nb2 - nb1 >= MAX_ENUMERATED:
+            raise RandRegexException(
+                "Prefix-constrained sampling does not support formatted "
+                "numbers with more than {} values".format(MAX_ENUMERATED)
+            )
+        return [(n, n) for n in range(nb1, nb2 + 1)
+                if (fmt % n == s if exact else (fmt % n).startswith(s))]
+
+    if exact:
+        try:
+            n = int(s)
+        except ValueError:
+            return []
+        return [(n, n)] if str(n) == s and nb1 <= n <= nb2 else []
+    if s.startswith("-"):
+        return [(-b, -a) for a, b in startswith_intervals(
+            s[1:], max(1, -nb2), -nb1
+        )]
+    res = startswith_intervals(s, max(0, nb1), nb2)
+    if s == "" and nb1 < 0:
+        res.append((nb1, min(nb2, -1)))
+    return res
+
+
+class PrefixSampler:
+    """
+    A sampler of the strings of a tree starting with a prefix.
+    Attributes:
+        - tree: the tree returned by 'parse_rand_regex'
+        - prefix: the prefix
+        - proba: the probability that the pattern generates
+          a string starting with the prefix
+    """
+
+    def __init__(self, tree, prefix):
+        self.tree = tree
+        self.prefix = prefix
+        self.end = len(prefix)
+        self._trans = {}
+        self._seqs = {}
+        self._reps = {}
+
+        self.proba = self.seq_table(tree, 0)[0][0].get(self.end, 0.0)
+        if self.proba == 0.0:
+            raise RandRegexException(
+                "The pattern cannot generate a string starting "
+                "with {!r}".format(prefix)
+            )
+
+    def trans(self, elt, start):
+        """
+        Return the probabilities {end offset: proba} of an element
+        (with its repetitions) starting at offset 'start'
+        """
+
+        if start == self.end:
+            return {self.end: 1.0}
+        key = (id(elt), start)
+        res = self._trans.get(key)
+        if res is not None:
+            return res
+
+        res = {}
+        if isinstance(elt, PipeElt):
+            for choice, weight in elt.list_elt:
+                p = weight / elt.expected_weight
+                for end, q in self.seq_table(choice, start)[0][start].items():
+                    add_to(res, end, p * q)
+        elif isinstance(elt, RegexElt) and elt.elt_type == EltType.NUMBER:
+            for (nb1, nb2, p), matches in self.number_matches(elt, start):
+                for end, intervals in matches.items():
+                    add_to(res, end, p * sum(b - a + 1 for a, b in intervals))
+        else:
+            reps = self.rep_table(elt, start)
+            for nb1, nb2, p in self.count_probas(elt):
+                for r, nb in self.count_range(nb1, nb2, reps):
+                    for end, q in reps[r][start].items():
+                        add_to(res, end, p * nb * q)
+
+        self._trans[key] = res
+        return res
+
+    def seq_table(self, treelist, start):
+        """
+        Return, for a list of elements starting at offset 'start',
+        the list S where S[i] maps each offset reachable before the
+        element i to the probabilities of the end offsets of the
+        elements i, i+1...
+        """
+
+        key = (id(treelist), start)
+        table = self._seqs.get(key)
+        if table is not None:
+            return table
+
+        reachable = [{start}]
+        for elt in treelist:
+            cur = set()
+            for m in reachable[-1]:
+                cur.update(self.trans(elt, m))
+            reachable.append(cur)
+
+        table = [None] * (len(treelist) + 1)
+        table[-1] = {m: {m: 1.0} for m in reachable[-1]}
+        for i in range(len(treelist) - 1, -1, -1):
+            table[i] = {}
+            for m in reachable[i]:
+                dist = {}
+                for mid, p in self.trans(treelist[i], m).items():
+                    for end, q in table[i + 1][mid].items():
+                        add_to(dist, end, p * q)
+                table[i][m] = dist
+        self._seqs[key] = table
+        return table
+
+    def base_trans(self, elt, start):
+        """
+        Return the probabilities of the end offsets of a single
+        repetition of a GroupElt or a RegexElt
+        """
+
+        if start == self.end:
+            return {self.end: 1.0}
+        if isinstance(elt, GroupElt):
+            return self.seq_table(elt.list_elt, start)[0][start]
+        if elt.elt_type == EltType.CHAR or elt.elt_type == EltType.ESCAPED_CHAR:
+            rest = self.prefix[start:]
+            if elt.elt_val.startswith(rest):
+                return {self.end: 1.0}
+            if rest.startswith(elt.elt_val):
+                return {start + len(elt.elt_val): 1.0}
+            return {}
+        if elt.elt_type == EltType.CHAR_CLASS:
+            proba = elt.elt_val.proba(self.prefix[start])
+            return {start + 1: proba} if proba > 0.0 else {}
+        raise RandRegexException(
+            "Prefix-constrained sampling does not support {} "
+            "before the end of the prefix".format(
+                "captured group names" if elt.elt_type == EltType.GROUP_NAME
+                else "word lists" if elt.elt_type == EltType.WORD_LIST
+                else str(elt.elt_type)
+            )
+        )
+
+    def rep_table(self, elt, start):
+        """
+        Return the list R where R[j] maps each offset reachable from
+        'start' to the probabilities of the end offsets of j
+        repetitions of 'elt'. When the repetitions stop changing
+        anything, the list stops and its last item stands for
+        all the following repetitions.
+        """
+
+        key = (id(elt), start)
+        reps = self._reps.get(key)
+        if reps is not None:
+            return reps
+
+        states = {start}
+        todo = [start]
+        while todo:
+            for end in self.base_trans(elt, todo.pop()):
+                if end not in states:
+                    states.add(end)
+                    todo.append(end)
+
+        nbmax = max(nb2 for _, nb2, _ in elt.count_infos.count_infos)
+        reps = [{m: {m: 1.0} for m in states}]
+        while len(reps) <= nbmax:
+            cur = {}
+            for m in states:
+                dist = {}
+                for mid, p in self.base_trans(elt, m).items():
+                    for end, q in reps[-1][mid].items():
+                        add_to(dist, end, p * q)
+                cur[m] = dist
+            if cur == reps[-1]:
+                break
+            reps.append(cur)
+            pending = sum(p for end, p in cur[start].items()
+                          if end != self.end)
+            if len(reps) > len(states) and pending < NEGLIGIBLE:
+                break
+        self._reps[key] = reps
+        return reps
+
+    def count_probas(self, elt):
+        infos = elt.count_infos
+        return [
+            (nb1, nb2, weight / infos.expected_weight / (nb2 - nb1 + 1))
+            for nb1, nb2, weight in infos.count_infos
+        ]
+
+    def count_range(self, nb1, nb2, reps):
+        """
+        Iterate over (r, nb) where r is a repetition number of
+        [nb1, nb2] and nb the number of repetition numbers of
+        [nb1, nb2] which r stands for
+        """
+
+        last = len(reps) - 1
+        for r in range(nb1, min(nb2, last - 1) + 1):
+            yield r, 1
+        if nb2 >= last:
+            yield last, nb2 - max(nb1, last) + 1
+
+    def number_matches(self, elt, start):
+        """
+        Return, for each count range of a number, (nb1, nb2, proba of
+        each integer) together with a map end offset -> intervals of
+        integers ending there
+        """
+
+        if elt.elt_val[-1] != "d":
+            raise RandRegexException(
+                "Prefix-constrained sampling does not support %f "
+                "before the end of the prefix"
+            )
+        rest = self.prefix[start:]
+        res = []
+        infos = elt.count_infos
+        for nb1, nb2, weight in infos.count_infos:
+            matches = {}
+            for k in range(1, len(rest)):
+                intervals = int_matches(nb1, nb2, elt.elt_val, rest[:k], True)
+                if intervals:
+                    matches[start + k] = intervals
+            intervals = int_matches(nb1, nb2, elt.elt_val, rest, False)
+            if intervals:
+                matches[self.end] = intervals
+            res.append(((nb1, nb2,
+                         weight / infos.expected_weight / (nb2 - nb1 + 1)),
+                        matches))
+        return res
+
+    def generate(self, rng=random):
+        """
+        Generate a random string starting with the prefix
+        """
+
+        res = []
+        self.sample_seq(self.tree, 0, self.end, {}, rng, res)
+        return "".join(res)
+
+    def sample_seq(self, treelist, start, end, names, rng, res):
+        table = self.seq_table(treelist, start)
+        cur = start
+        for i, elt in enumerate(treelist):
+            if cur == self.end:
+                res.append(produce_randregex(treelist[i:], names, rng))
+                return
+            weights = {}
+            for mid, p in self.trans(elt, cur).items():
+                add_to(weights, mid, p * table[i + 1][mid].get(end, 0.0))
+            mid = pick_key(weights, rng)
+            self.sample_node(elt, cur, mid, names, rng, res)
+            cur = mid
+
+    def sample_node(self, elt, start, end, names, rng, res):
+        if isinstance(elt, PipeElt):
+            weights = {}
+            for i, (choice, weight) in enumerate(elt.list_elt):
+                table = self.seq_table(choice, start)
+                add_to(weights, i, weight * table[0][start].get(end, 0.0))
+            choice = elt.list_elt[pick_key(weights, rng)][0]
+            self.sample_seq(choice, start, end, names, rng, res)
+            return
+
+        if isinstance(elt, RegexElt) and elt.elt_type == EltType.NUMBER:
+            weights = {}
+            for (nb1, nb2, p), matches in self.number_matches(elt, start):
+                for a, b in matches.get(end, []):
+                    add_to(weights, (a, b), p * (b - a + 1))
+            a, b = pick_key(weights, rng)
+            n = rng.randint(a, b)
+            res.append(str(n) if elt.elt_val == "%d" else elt.elt_val % n)
+            return
+
+        reps = self.rep_table(elt, start)
+        weights = {}
+        for nb1, nb2, p in self.count_probas(elt):
+            for r, nb in self.count_range(nb1, nb2, reps):
+                add_to(weights, (r, nb1, nb2),
+                       p * nb * reps[r][start].get(end, 0.0))
+        r, nb1, nb2 = pick_key(weights, rng)
+        if r == len(reps) - 1 and nb2 > r:
+            r = rng.randint(max(nb1, r), nb2)
+
+        cur = start
+        for j in range(r, 0, -1):
+            rest = reps[min(j - 1, len(reps) - 1)]
+            if cur == self.end:
+                mid = self.end
+            else:
+                weights = {}
+                for mid, p in self.base_trans(elt, cur).items():
+                    add_to(weights, mid, p * rest[mid].get(end, 0.0))
+                mid = pick_key(weights, rng)
+            self.sample_base(elt, cur, mid, names, rng, res)
+            cur = mid
+
+    def sample_base(self, elt, start, end, names, rng, res):
+        if isinstance(elt, GroupElt):
+            if start == self.end:
+                tmp = [produce_randregex(elt.list_elt, names, rng)]
+            else:
+                tmp = []
+                self.sample_seq(elt.list_elt, start, end, names, rng, tmp)
+            if elt.name:
+                names[elt.name] = "".join(tmp)
+            res.extend(tmp)
+        elif elt.elt_type == EltType.GROUP_NAME:
+            if elt.elt_val not in names:
+                raise RandRegexException(
+                    "The name {} is used before "
+                    "being defined.".format(elt.elt_val)
+                )
+            res.append(names[elt.elt_val])
+        elif elt.elt_type == EltType.WORD_LIST:
+            res.append(get_word_list(elt.elt_val).sample(rng))
+        elif elt.elt_type == EltType.CHAR_CLASS:
+            if start < self.end:
+                res.append(self.prefix[start])
+            else:
+                res.append(elt.elt_val.sample(rng))
+        else:
+            res.append(elt.elt_val)
+
+
+_SAMPLERS = OrderedDict()
+
+def generate_with_prefix(tree, prefix, rng=random):
+    """
+    Generate a random string of a tree starting with 'prefix',
+    without rejection. The probabilities of the strings starting
+    with the prefix are kept.
+
+    The PrefixSampler of the last (tree, prefix) used are kept, so
+    that repeated calls only pay for the sampling.
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - prefix (string): the prefix
+        - rng: the random generator, the random module by default
+
+    Returns:
+        string: the random string
+    """
+
+    key = (id(tree), prefix)
+    cached = _SAMPLERS.get(key)
+    if cached is not None and cached.tree is tree:
+        _SAMPLERS.move_to_end(key)
+        sampler = cached
+    else:
+        sampler = PrefixSampler(tree, prefix)
+        _SAMPLERS[key] = sampler
+        if len(_SAMPLERS) > SAMPLER_CACHE_SIZE:
+            _SAMPLERS.popitem(last=False)
+    return sampler.generate(rng)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the protocol shared by the generation server
+(see randregex/server.py) and its client (see randregex/client.py).
+
+Every message is a frame: its size as 4 bytes big-endian, then the
+payload. The requests are:
+    - OP_REGISTER + the pattern in utf-8, answered by the pattern key
+    - OP_GENERATE + (pattern key, nb), answered by 'nb' strings
+The key of a pattern is derived from its text (see 'pattern_key'), so
+that a key kept by a client across a restart of the server never
+designates another pattern: it is either unknown or the same pattern.
+The answers start with a status byte, STATUS_OK or an error status
+followed by the error message in utf-8. The strings are sent as their
+number, the array of their lengths in characters, then their
+concatenation in utf-8.
+"""
+
+import sys
+import array
+import struct
+import hashlib
+
+from .randregex import RandRegexException
+
+OP_REGISTER = 1
+OP_GENERATE = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_UNKNOWN_PATTERN = 2
+
+# Maximum size of a frame
+MAX_FRAME = 1 << 30
+
+# Maximum number of strings generated by a request
+MAX_STRINGS = 1 << 20
+
+# size of the payload
+FRAME = struct.Struct(">I")
+# OP_GENERATE, pattern key, nb
+GENERATE = struct.Struct(">BQI")
+# STATUS_OK, nb of strings
+STRINGS = struct.Struct(">BI")
+# STATUS_OK, pattern key
+PATTERN_KEY = struct.Struct(">BQ")
+
+
+def pattern_key(pattern):
+    """
+    Return the key of a pattern: the first 64 bits of the sha256 of
+    its text
+    """
+
+    digest = hashlib.sha256(pattern.encode("utf-8", "surrogatepass"))
+    return int.from_bytes(digest.digest()[:8], "big")
+
+
+def pack_frame(payload):
+    """
+    Return the frame of a payload
+    """
+
+    if len(payload) > MAX_FRAME:
+        raise RandRegexException("Frame too large")
+    return FRAME.pack(len(payload)) + payload
+
+
+def encode_strings(strings):
+    """
+    Return the payload of a list of strings
+    """
+
+    lengths = array.array("I", map(len, strings))
+    if sys.byteorder != "big":
+        lengths.byteswap()
+    return (STRINGS.pack(STATUS_OK, len(strings)) + lengths.tobytes()
+            + "".join(strings).encode("utf-8", "surrogatepass"))
+
+
+def decode_strings(payload):
+    """
+    Return the list of strings of a payload built by 'encode_strings'
+    """
+
+    nb = STRINGS.unpack_from(payload)[1]
+    start = STRINGS.size
+    lengths = array.array("I")
+    lengths.frombytes(payload[start:start + 4 * nb])
+    if sys.byteorder != "big":
+        lengths.byteswap()
+    text = bytes(payload[start + 4 * nb:]).decode("utf-8", "surrogatepass")
+    res = []
+    pos = 0
+    for length in lengths:
+        res.append(text[pos:pos + length])
+        pos += length
+    return res
+
+
+def encode_error(status, message):
+    return bytes([status]) + message.encode("utf-8")
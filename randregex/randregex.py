@@ -10,9 +10,15 @@ import sys
 import logging
 from enum import Enum
 
+__version__ = "0.2.0"
+
 #logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
 logging.basicConfig(stream=sys.stderr, level=logging.INFO)
 
+# The MetricsRegistry recording the parsing and the generation,
+# None when the metrics are disabled (see randregex/metrics.py)
+_METRICS = None
+
 class RandRegexException(Exception):
     """
     The randRegex exception class
@@ -29,6 +35,12 @@ from .helper_parse_fct import (
     parse_def_groupname, parse_use_groupname, parse_sbracket, 
 )
 
+from .charclass import (
+    SHORTHAND_LETTERS, is_char_class, parse_char_class, parse_shorthand
+)
+
+from .wordlist import get_word_list
+
 def step1_sbracket(charlist):
     """
     Deal with squared bracket
@@ -118,7 +130,7 @@ def step2_groups_rec(charlist, start, nbrec, startP):
                 backslash = not backslash
             elif c == '(':
                 oldnamePar = namePar
-                i, li, namePar, isUse = step2_groups_rec(
+                i, li, namePar, useType = step2_groups_rec(
                     charlist, i+1, nbrec+1, True
                 )
                 infos = []
@@ -127,24 +139,27 @@ def step2_groups_rec(charlist, start, nbrec, startP):
                     infos.append(info)
                 if not infos:
                     infos = [(1, 1, 0)]
-                if not isUse:
+                if useType is None:
                     res.append(GroupElt(li, CountInfos(infos), namePar))
                 else:
                     res.append(RegexElt(
-                        EltType.GROUP_NAME, namePar, CountInfos(infos)
+                        useType, namePar, CountInfos(infos)
                     ))
                 namePar = oldnamePar
             elif c == ')':
                 if nbrec == 0:
                     raise RandRegexException("Parenthesis error")
                 else:
-                    return i, res, namePar, False
+                    return i, res, namePar, None
             elif startP and c == '?':
                 i, namePar = parse_def_groupname(charlist, i+1)
                 startP = False
             elif startP and c == '$':
                 i, namePar = parse_use_groupname(charlist, i+1)
-                return i, None, namePar, True
+                return i, None, namePar, EltType.GROUP_NAME
+            elif startP and c == '@':
+                i, namePar = parse_use_groupname(charlist, i+1)
+                return i, None, namePar, EltType.WORD_LIST
             else:
                 res.append(charlist[i])
         i = i + 1
@@ -256,12 +271,13 @@ def brackets_2_pipes(regex_elt):
 
     return PipeElt(res, compute=True)
 
-def step4_misc(treelist):
+def step4_misc(treelist, universe=None):
     """
     Deal with numbers, brackets and some escaping caracters
 
     Parameters:
         treelist (list): list of GroupElt, RegexElt or PipeElt
+        universe (CharRanges): the characters of the negated classes
     
     Returns:
         list: list of GroupElt, RegexElt or PipeElt in which 
@@ -275,14 +291,22 @@ def step4_misc(treelist):
     while i < len(treelist):
         if isinstance(treelist[i], PipeElt):
             res.append(PipeElt(
-                [(step4_misc(elt), per) for elt, per in treelist[i].list_elt],
+                [(step4_misc(elt, universe), per)
+                 for elt, per in treelist[i].list_elt],
                 treelist[i].expected_weight                
             ))
         elif isinstance(treelist[i], GroupElt):
             res.append(GroupElt(
-                step4_misc(treelist[i].list_elt), 
+                step4_misc(treelist[i].list_elt, universe), 
                 treelist[i].count_infos, treelist[i].name
             ))
+        elif (treelist[i].elt_type == EltType.SBRACKET
+                  and is_char_class(treelist[i].elt_val)):
+            res.append(RegexElt(
+                EltType.CHAR_CLASS,
+                parse_char_class(treelist[i].elt_val, universe),
+                treelist[i].count_infos
+            ))
         elif treelist[i].elt_type == EltType.SBRACKET:
             res.append(GroupElt(
                 brackets_2_pipes(treelist[i]), 
@@ -304,6 +328,19 @@ def step4_misc(treelist):
                     res.append(RegexElt(EltType.ESCAPED_CHAR, '{'))
                 elif c == '}':
                     res.append(RegexElt(EltType.ESCAPED_CHAR, '}'))
+                elif c in SHORTHAND_LETTERS:
+                    i, char_class = parse_shorthand(treelist, i, universe)
+                    infos = []
+                    while (i+1 < len(treelist) and 
+                              RegexElt.IsChar(treelist[i+1]) and
+                              treelist[i+1].elt_val == '{'):
+                        i, info = parse_occ(treelist, i+2)
+                        infos.append(info)
+                    if not infos:
+                        infos = [(1, 1, 0)]
+                    res.append(RegexElt(
+                        EltType.CHAR_CLASS, char_class, CountInfos(infos)
+                    ))
                 else:
                     res.append(RegexElt(EltType.CHAR, '\\'))
                     res.append(treelist[i])
@@ -313,7 +350,9 @@ def step4_misc(treelist):
             elif c == '%':
                 i, nb = parse_nb(treelist, i+1)
                 infos = []
-                while i+1 < len(treelist) and treelist[i+1].elt_val == '{':
+                while (i+1 < len(treelist) and 
+                          RegexElt.IsChar(treelist[i+1]) and
+                          treelist[i+1].elt_val == '{'):
                     i, info = parse_occ(treelist, i+2)
                     infos.append(info)
                 if not infos:
@@ -396,18 +435,38 @@ def pre_parse_randregex(randregex):
     return charlist
 
 
-def parse_rand_regex(randregex):
+def parse_rand_regex(randregex, intern=False, universe=None, limits=None):
     """
     Return the randRegEx information Tree.
     The result should be used with 'produce_randregex_from_tree' method
 
     Parameters:
         randregex (string): the randregex
+        intern (bool): if True, structurally identical elements are
+                       shared with the other interned trees
+        universe (CharRanges): the characters of the negated classes
+                               "[^...]", printable ASCII if None
+        limits (Limits): if not None, the pattern is rejected as soon 
+                         as it exceeds one of the limits (see 
+                         randregex/limits.py)
     
     Returns:
         list: list of GroupElt, RegexElt or PipeElt    
     """        
 
+    if _METRICS is not None:
+        return _METRICS.parse(randregex, intern, universe, limits)
+    return _parse_rand_regex(randregex, intern, universe, limits)
+
+def _parse_rand_regex(randregex, intern, universe, limits):
+    """
+    Same as 'parse_rand_regex', without the metrics
+    """
+
+    if limits is not None:
+        from .limits import check_pattern, check_nodes, check_lengths
+        check_pattern(randregex, limits)
+
     charlist = pre_parse_randregex(randregex)
     logging.debug("0/ {}".format(charlist))
     
@@ -419,16 +478,245 @@ def parse_rand_regex(randregex):
     
     treelist = step3_pipes(treelist)
     logging.debug("3/ {}".format(treelist))
+
+    if limits is not None:
+        check_nodes(treelist, limits)
     
-    treelist = step4_misc(treelist)
+    treelist = step4_misc(treelist, universe)
     logging.debug("4/ {}".format(treelist))
     
     treelist = step5_characters(treelist)
     logging.debug("5/ {}".format(treelist))
+
+    if limits is not None:
+        check_lengths(treelist, limits)
+
+    if intern:
+        from .interning import intern_tree
+        treelist = intern_tree(treelist)
     
     return treelist
 
-def produce_randregex(treelist, names):
+def pick_choice_index(pipe_elt, rng=random):
+    """
+    Randomly pick one of the choices of a PipeElt according to its weights
+
+    Parameters:
+        - pipe_elt (PipeElt): the "or list" to pick from
+        - rng: the random generator, the random module by default
+
+    Returns:
+        int: the index of the picked choice in pipe_elt.list_elt
+    """
+
+    r = rng.randint(0, pipe_elt.expected_weight - 1)
+    t = 0
+    for j, (_, weight) in enumerate(pipe_elt.list_elt):
+        t += weight
+        if r <= t:
+            return j
+    return j
+
+
+def pick_choice(pipe_elt, rng=random):
+    """
+    Randomly pick one of the choices of a PipeElt according to its weights
+
+    Parameters:
+        - pipe_elt (PipeElt): the "or list" to pick from
+        - rng: the random generator, the random module by default
+
+    Returns:
+        list: the picked choice
+    """
+
+    return pipe_elt.list_elt[pick_choice_index(pipe_elt, rng)][0]
+
+
+def pick_count(count_infos, rng=random):
+    """
+    Randomly pick one of the (nb1, nb2) ranges of a CountInfos
+    according to its weights
+
+    Parameters:
+        - count_infos (CountInfos): the count informations
+        - rng: the random generator, the random module by default
+
+    Returns:
+        (int, int): the picked range
+    """
+
+    r = rng.randint(0, count_infos.expected_weight - 1)
+    t = 0
+    for nb1, nb2, per in count_infos.count_infos:
+        t += per
+        if r <= t:
+            return (nb1, nb2)
+    return (nb1, nb2)
+
+
+def pick_repeat(count_infos, rng=random):
+    """
+    Randomly pick the number of repetitions of an element: a range
+    is picked by 'pick_count', then a number within the range
+
+    Parameters:
+        - count_infos (CountInfos): the count informations
+        - rng: the random generator, the random module by default
+
+    Returns:
+        int: the number of repetitions
+    """
+
+    picked = pick_count(count_infos, rng)
+    return rng.randint(picked[0], picked[1])
+
+
+def repeated_value(regex_elt, names):
+    """
+    Return the value repeated by a RegexElt of type GROUP_NAME, CHAR
+    or ESCAPED_CHAR: the value captured by the name, or the character
+
+    Parameters:
+        - regex_elt (RegexElt): the element, repeated at least once
+        - names : a map of generated group names
+
+    Returns:
+        the value of one repetition
+    """
+
+    if regex_elt.elt_type == EltType.GROUP_NAME:
+        if regex_elt.elt_val not in names:
+            raise RandRegexException(
+                "The name {} is used before "
+                "being defined.".format(regex_elt.elt_val)
+            )
+        return names[regex_elt.elt_val]
+    return regex_elt.elt_val
+
+
+def produce_number(regex_elt, rng=random):
+    """
+    Produce a random number for a RegexElt of type NUMBER,
+    formatted according to its format (for instance "%d" or "%05.2f")
+
+    Parameters:
+        - regex_elt (RegexElt): the number element
+        - rng: the random generator, the random module by default
+
+    Returns:
+        string: the formatted number
+    """
+
+    picked = pick_count(regex_elt.count_infos, rng)
+    fmt = regex_elt.elt_val
+    if fmt[-1] == "d":
+        r = rng.randint(picked[0], picked[1])
+    else:
+        r = rng.uniform(picked[0], picked[1])
+    if len(fmt) == 2:
+        return str(r)
+    return fmt % r
+
+
+def make_numeric_template(group_elt):
+    """
+    Compute the bulk format of an unnamed group made only of numbers 
+    and single characters, such as "(%f{0,1},)"
+
+    Parameters:
+        - group_elt (GroupElt): the group
+
+    Returns:
+        (string, list): the format of one repetition of the group 
+        and the list of its RegexElt of type NUMBER, 
+        or None if the group is not of this form
+    """
+
+    if (group_elt.name or len(group_elt.list_elt) != 1 
+            or not isinstance(group_elt.list_elt[0], PipeElt)
+            or len(group_elt.list_elt[0].list_elt) != 1):
+        return None
+
+    fmt = ""
+    numbers = []
+    for elt in group_elt.list_elt[0].list_elt[0][0]:
+        if not isinstance(elt, RegexElt):
+            return None
+        if elt.elt_type == EltType.NUMBER:
+            if elt.elt_val == "%f":
+                fmt += "%r"
+            else:
+                fmt += elt.elt_val
+            numbers.append(elt)
+        elif ((elt.elt_type == EltType.CHAR 
+                   or elt.elt_type == EltType.ESCAPED_CHAR)
+                  and isinstance(elt.elt_val, str)
+                  and len(elt.count_infos.count_infos) == 1
+                  and elt.count_infos.count_infos[0][:2] == (1, 1)):
+            fmt += elt.elt_val.replace("%", "%%")
+        else:
+            return None
+
+    if not numbers:
+        return None
+    return fmt, numbers
+
+
+_NOT_COMPUTED = object()
+
+def numeric_template(group_elt):
+    """
+    Return make_numeric_template(group_elt), which is computed only
+    once and kept in the group
+    """
+
+    template = getattr(group_elt, "_numeric_template", _NOT_COMPUTED)
+    if template is _NOT_COMPUTED:
+        template = make_numeric_template(group_elt)
+        group_elt._numeric_template = template
+    return template
+
+
+def produce_numeric_rows(template, nb, rng=random):
+    """
+    Produce 'nb' repetitions of a group with a numeric template:
+    all the numbers are generated column by column, then formatted
+    with a single call.
+
+    Parameters:
+        - template: the result of numeric_template
+        - nb (int): the number of repetitions
+        - rng: the random generator, the random module by default
+
+    Returns:
+        string: the 'nb' repetitions
+    """
+
+    fmt, numbers = template
+    columns = []
+    for elt in numbers:
+        infos = elt.count_infos.count_infos
+        if elt.elt_val[-1] == "d":
+            draw = rng.randint
+        else:
+            draw = rng.uniform
+        if len(infos) == 1:
+            nb1, nb2 = infos[0][0], infos[0][1]
+            columns.append([draw(nb1, nb2) for _ in range(nb)])
+        else:
+            columns.append([
+                draw(*pick_count(elt.count_infos, rng)) for _ in range(nb)
+            ])
+
+    if len(columns) == 1:
+        values = columns[0]
+    else:
+        values = [v for row in zip(*columns) for v in row]
+    return (fmt * nb) % tuple(values)
+
+
+def produce_randregex(treelist, names, rng=random):
     """
     Produce random string recursively.
     Called By produce_randregex_from_tree
@@ -436,6 +724,7 @@ def produce_randregex(treelist, names):
     Parameters:
         - treelist (list): list of GroupElt, RegexElt or PipeElt
         - names : a map of generated group names
+        - rng: the random generator, the random module by default
     
     Returns:
         string: the random string maching the randregex
@@ -444,60 +733,48 @@ def produce_randregex(treelist, names):
     res = ""
     for regex_elt in treelist:            
         if isinstance(regex_elt, PipeElt):
-            r = random.randint(0, regex_elt.expected_weight - 1)
-            t = 0
-            picked = None
-            for choice, weight in regex_elt.list_elt:
-                t += weight
-                if r <= t:
-                    picked = choice
-                    break
-            res += produce_randregex(choice, names)
+            res += produce_randregex(pick_choice(regex_elt, rng), names, rng)
+        elif (isinstance(regex_elt, RegexElt) 
+                  and regex_elt.elt_type == EltType.NUMBER):
+            res += produce_number(regex_elt, rng)
         else:
-            
-            r = random.randint(0, regex_elt.count_infos.expected_weight - 1)
-            t = 0
-            picked = None
-            for nb1, nb2, per in regex_elt.count_infos.count_infos:
-                t += per
-                if r <= t:
-                    picked = (nb1, nb2)
-                    break
-
-            if (isinstance(regex_elt, GroupElt) or 
-                    regex_elt.elt_type != EltType.NUMBER):
-                r = random.randint(picked[0], picked[1])
-                i = 1
-                while i <= r:
-                    if isinstance(regex_elt, GroupElt):
-                        tmp = produce_randregex(regex_elt.list_elt, names)
-                        if regex_elt.name:
-                            names[regex_elt.name] = tmp
-                    elif regex_elt.elt_type == EltType.GROUP_NAME:
-                        if regex_elt.elt_val not in names:                            
-                            raise RandRegexException(
-                                "The name {} is used before "
-                                "being defined.".format(regex_elt.name)
-                            )
-                        tmp = names[regex_elt.elt_val]
-                    elif (regex_elt.elt_type == EltType.CHAR or 
-                              regex_elt.elt_type == EltType.ESCAPED_CHAR):
-                        tmp = regex_elt.elt_val
-
+            r = pick_repeat(regex_elt.count_infos, rng)
+
+            if isinstance(regex_elt, GroupElt):
+                template = numeric_template(regex_elt)
+                if template is not None:
+                    res += produce_numeric_rows(template, r, rng)
+                    continue
+                for _ in range(r):
+                    tmp = produce_randregex(regex_elt.list_elt, names, rng)
+                    if regex_elt.name:
+                        names[regex_elt.name] = tmp
                     res += tmp
-                    i = i + 1
-            else:
-                if regex_elt.elt_val == "%d":
-                    r = random.randint(picked[0], picked[1])
-                else:
-                    r = random.uniform(picked[0], picked[1])
-                res += str(r)
+            elif regex_elt.elt_type == EltType.CHAR_CLASS:
+                res += regex_elt.elt_val.sample_string(r, rng)
+            elif regex_elt.elt_type == EltType.WORD_LIST:
+                word_list = get_word_list(regex_elt.elt_val)
+                for _ in range(r):
+                    res += word_list.sample(rng)
+            elif r:
+                res += repeated_value(regex_elt, names) * r
     return res
 
-def produce_randregex_from_tree(tree):
+def produce_randregex_from_tree(tree, lazy=False, rng=random):
     """
     Generate a random string according to the information 
     returned by the method 'parse_rand_regex'
+
+    If 'lazy' is True, a Rope is returned instead of a string:
+    repeated pieces and captured groups are shared instead of copied.
+
+    'rng' is the random generator used, the random module by default.
+    It may be any random.Random instance.
     """
 
-    return produce_randregex(tree, {})
+    if _METRICS is not None:
+        return _METRICS.generate(tree, lazy, rng)
+    if lazy:
+        from .rope import produce_rope
+        return produce_rope(tree, {}, rng)
+    return produce_randregex(tree, {}, rng)
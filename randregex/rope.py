@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a lazy output mode where the generated
+string is kept as a list of shared pieces (a rope) instead
+of being copied into one big string
+"""
+
+import random
+
+from .randregex import (
+    pick_choice, pick_repeat, repeated_value, produce_number,
+    numeric_template, produce_numeric_rows
+)
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .wordlist import get_word_list
+
+# Ropes shorter than this are flattened when appended to another rope
+SMALL_ROPE = 64
+
+# Consecutive small strings are merged up to this size
+CHUNK_SIZE = 4096
+
+
+class Rope:
+    """
+    A lazily concatenated string.
+    Attributes:
+        - segments:
+          A list of the form [[piece1, times1], [piece2, times2], ...]
+          where each "piecei" is a string or a Rope, repeated "timesi"
+          times. A piece may be shared between several segments or
+          several ropes, it is never copied.
+        - length:
+          The total length of the string represented by the rope
+    """
+
+    def __init__(self):
+        self.segments = []
+        self.length = 0
+        self._pending = []
+        self._pending_len = 0
+
+    def append(self, piece, times=1):
+        """
+        Append 'times' copies of 'piece' (a string or a Rope)
+        """
+
+        if times <= 0 or len(piece) == 0:
+            return
+        if isinstance(piece, Rope) and piece.length <= SMALL_ROPE:
+            piece = piece.flatten()
+        self.length += len(piece) * times
+
+        if times == 1 and isinstance(piece, str) and len(piece) < CHUNK_SIZE:
+            self._pending.append(piece)
+            self._pending_len += len(piece)
+            if self._pending_len >= CHUNK_SIZE:
+                self._flush()
+            return
+
+        self._flush()
+        if self.segments and self.segments[-1][0] is piece:
+            self.segments[-1][1] += times
+        else:
+            self.segments.append([piece, times])
+
+    def _flush(self):
+        """
+        Move the pending small strings into a single segment
+        """
+
+        if self._pending:
+            self.segments.append(["".join(self._pending), 1])
+            self._pending = []
+            self._pending_len = 0
+
+    def iter_chunks(self):
+        """
+        Iterate over the strings composing the rope, in order
+        """
+
+        self._flush()
+        for piece, times in self.segments:
+            if isinstance(piece, Rope):
+                if piece.length * times <= CHUNK_SIZE:
+                    yield piece.flatten() * times
+                else:
+                    for _ in range(times):
+                        yield from piece.iter_chunks()
+            elif len(piece) * times <= CHUNK_SIZE:
+                yield piece * times
+            else:
+                nb = max(1, CHUNK_SIZE // len(piece))
+                while times > 0:
+                    yield piece * min(nb, times)
+                    times -= nb
+
+    def write_to(self, fp):
+        """
+        Write the rope to the file object 'fp' without flattening it
+
+        Returns:
+            int: the number of characters written
+        """
+
+        for chunk in self.iter_chunks():
+            fp.write(chunk)
+        return self.length
+
+    def flatten(self):
+        """
+        Return the string represented by the rope
+        """
+
+        return "".join(self.iter_chunks())
+
+    def nb_pieces(self):
+        """
+        Return the number of distinct pieces referenced by the rope
+        """
+
+        seen = set()
+        stack = [self]
+        while stack:
+            rope = stack.pop()
+            rope._flush()
+            for piece, _ in rope.segments:
+                if id(piece) not in seen:
+                    seen.add(id(piece))
+                    if isinstance(piece, Rope):
+                        stack.append(piece)
+        return len(seen)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return self.flatten()
+
+    def __repr__(self):
+        self._flush()
+        return "Rope({} chars, {} segments)".format(
+            self.length, len(self.segments)
+        )
+
+
+def produce_rope(treelist, names, rng=random):
+    """
+    Produce a random Rope recursively.
+    Same as produce_randregex, but captured groups and repeated
+    characters are referenced instead of copied.
+    Called By produce_randregex_from_tree
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt or PipeElt
+        - names : a map of generated group names
+        - rng: the random generator, the random module by default
+
+    Returns:
+        Rope: the random string maching the randregex
+    """
+
+    res = Rope()
+    for regex_elt in treelist:
+        if isinstance(regex_elt, PipeElt):
+            res.append(produce_rope(pick_choice(regex_elt, rng), names, rng))
+            continue
+
+        if (isinstance(regex_elt, RegexElt)
+                and regex_elt.elt_type == EltType.NUMBER):
+            res.append(produce_number(regex_elt, rng))
+            continue
+
+        r = pick_repeat(regex_elt.count_infos, rng)
+
+        if isinstance(regex_elt, GroupElt):
+            template = numeric_template(regex_elt)
+            if template is not None:
+                res.append(produce_numeric_rows(template, r, rng))
+                continue
+            for _ in range(r):
+                tmp = produce_rope(regex_elt.list_elt, names, rng)
+                if regex_elt.name:
+                    names[regex_elt.name] = tmp
+                res.append(tmp)
+        elif regex_elt.elt_type == EltType.CHAR_CLASS:
+            res.append(regex_elt.elt_val.sample_string(r, rng))
+        elif regex_elt.elt_type == EltType.WORD_LIST:
+            word_list = get_word_list(regex_elt.elt_val)
+            for _ in range(r):
+                res.append(word_list.sample(rng))
+        elif r:
+            res.append(repeated_value(regex_elt, names), r)
+    return res
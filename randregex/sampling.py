@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains sampling helpers shared by several generation
+modes
+"""
+
+import random
+
+from .randregex import RandRegexException
+
+
+class AliasTable:
+    """
+    Walker's alias table: picks an index with a probability
+    proportional to its weight in O(1), with a single random draw.
+    Attributes:
+        - probas: for each index i, the probability to keep i
+        - aliases: for each index i, the index picked otherwise
+    """
+
+    def __init__(self, weights):
+        nb = len(weights)
+        if nb == 0:
+            raise RandRegexException("Cannot pick among zero elements")
+        total = float(sum(weights))
+        if total <= 0 or any(w < 0 for w in weights):
+            raise RandRegexException(
+                "The weights must be positive with a positive sum"
+            )
+
+        scaled = [w * nb / total for w in weights]
+        self.probas = [1.0] * nb
+        self.aliases = list(range(nb))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large[-1]
+            self.probas[s] = scaled[s]
+            self.aliases[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            if scaled[l] < 1.0:
+                large.pop()
+                small.append(l)
+
+    @staticmethod
+    def from_arrays(probas, aliases):
+        """
+        Return the AliasTable of already computed probas and aliases,
+        which may be any sequences, such as memoryviews of a file
+        """
+
+        table = AliasTable.__new__(AliasTable)
+        table.probas = probas
+        table.aliases = aliases
+        return table
+
+    def __len__(self):
+        return len(self.probas)
+
+    def sample(self, rng=random):
+        """
+        Return a random index
+        """
+
+        u = rng.random() * len(self.probas)
+        i = int(u)
+        if u - i < self.probas[i]:
+            return i
+        return self.aliases[i]
+
+
+# Number of random bytes drawn at once for the draws below n <= 256,
+# and of 32 bits words for the draws below n <= 2**32
+BLOCK_BYTES = 256
+BLOCK_WORDS = 128
+
+# Maximum number of buffers of decoded draws
+MAX_BUFFERS = 1024
+
+RECIP_BPF = 2.0 ** -53
+
+# n -> (digits per byte, translation table, rejected bytes)
+_BYTE_CODES = {}
+
+
+def byte_code(n):
+    """
+    Return how the random bytes are decoded into draws below n <= 256:
+    with m = n**j the multiple of n**j closest to 256 from below,
+    a byte b < m is decoded as the j digits in base n of b % n**j, and
+    a greater byte is rejected, so that the digits are uniform. j is
+    chosen to get the most digits from a byte on average.
+
+    Returns:
+        (int, bytes or list, bytes): the number of digits j per byte,
+        the translation of the bytes (the digits of each byte when
+        j > 1), the rejected bytes
+    """
+
+    code = _BYTE_CODES.get(n)
+    if code is None:
+        j = 1
+        k = 2
+        while n ** k <= 256:
+            if k * (256 // n ** k * n ** k) > j * (256 // n ** j * n ** j):
+                j = k
+            k += 1
+        radix = n ** j
+        rejected = bytes(range(256 // radix * radix, 256))
+        if j == 1:
+            table = bytes(b % n for b in range(256))
+        else:
+            table = []
+            for b in range(256):
+                b %= radix
+                digits = []
+                for _ in range(j):
+                    b, d = divmod(b, n)
+                    digits.append(d)
+                table.append(bytes(digits))
+        code = _BYTE_CODES[n] = (j, table, rejected)
+    return code
+
+
+class BitStreamRandom(random.Random):
+    """
+    A random.Random drawing its random bits by blocks and decoding many
+    small draws from each block, so that randint, randrange, choice...
+    mostly cost a pop from a buffer of draws decoded in advance, instead
+    of several Python calls and a 32 bits word of the Mersenne Twister
+    per draw.
+
+    The draws below n <= 256 are decoded from blocks of random bytes in
+    mixed radix: each byte gives j digits in base n, such as 5 draws
+    below 3 or 2 draws below 10, the bytes beyond the last multiple
+    of n**j being rejected (see 'byte_code'). The draws below n <= 2**32 are decoded from 32 bits words,
+    rejecting the words above the greatest multiple of n. The rejection
+    keeps every draw unbiased. Larger draws use random.Random.
+
+    Attributes:
+        - source: the random.Random providing the blocks with its
+          getrandbits (os.urandom with random.SystemRandom, a
+          CounterRandom...), or None for the Mersenne Twister of
+          this instance
+        - bits_drawn: the number of bits drawn from the source
+    """
+
+    def __init__(self, x=None, source=None):
+        self.source = source
+        if source is None:
+            self._getbits = super().getrandbits
+        else:
+            self._getbits = source.getrandbits
+        super().__init__(x)
+
+    def seed(self, a=None, version=2):
+        """
+        Seed the Mersenne Twister, and forget the decoded draws
+        """
+
+        super().seed(a, version)
+        # n - 1 -> the draws below n decoded in advance
+        self._buffers = {}
+        self.bits_drawn = 0
+
+    def getstate(self):
+        return (super().getstate(),
+                {k: list(v) for k, v in self._buffers.items()},
+                self.bits_drawn)
+
+    def setstate(self, state):
+        mt_state, buffers, self.bits_drawn = state
+        self._buffers = {k: list(v) for k, v in buffers.items()}
+        super().setstate(mt_state)
+
+    def getrandbits(self, k):
+        self.bits_drawn += k
+        return self._getbits(k)
+
+    def random(self):
+        self.bits_drawn += 53
+        return self._getbits(53) * RECIP_BPF
+
+    def randbytes(self, n):
+        return self.getrandbits(n * 8).to_bytes(n, "little")
+
+    def decode(self, n):
+        """
+        Return a list of random ints in [0, n), 1 < n <= 2**32,
+        decoded from one block
+        """
+
+        if n <= 256:
+            j, table, rejected = byte_code(n)
+            data = self.randbytes(BLOCK_BYTES)
+            if j == 1:
+                return list(data.translate(table, rejected))
+            data = data.translate(None, rejected)
+            return list(b"".join(map(table.__getitem__, data)))
+        limit = (1 << 32) // n * n
+        words = memoryview(self.randbytes(4 * BLOCK_WORDS)).cast("I")
+        return [w % n for w in words if w < limit]
+
+    def _refill(self, m):
+        """
+        Return a random int in [0, m], m >= 0, refilling its buffer
+        """
+
+        if m <= 0:
+            if m == 0:
+                return 0
+            raise ValueError("empty range")
+        if m >= 1 << 32:
+            return self._randbelow_with_getrandbits(m + 1)
+        if len(self._buffers) >= MAX_BUFFERS:
+            self._buffers.clear()
+        buf = self._buffers.get(m)
+        if buf is None:
+            buf = self._buffers[m] = []
+        while not buf:
+            buf.extend(self.decode(m + 1))
+        return buf.pop()
+
+    def _randbelow(self, n):
+        try:
+            return self._buffers[n - 1].pop()
+        except (KeyError, IndexError):
+            return self._refill(n - 1)
+
+    def randint(self, a, b):
+        try:
+            return a + self._buffers[b - a].pop()
+        except (KeyError, IndexError):
+            return a + self._refill(b - a)
+
+    def randrange(self, start, stop=None, step=1):
+        if step == 1 and type(start) is int:
+            if stop is None:
+                if start > 0:
+                    return self._randbelow(start)
+            elif type(stop) is int and stop > start:
+                return start + self._randbelow(stop - start)
+        return super().randrange(start, stop, step)
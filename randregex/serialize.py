@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the functions to turn a tree returned by
+'parse_rand_regex' into a compact binary form and back
+"""
+
+import marshal
+
+from .randregex import RandRegexException
+from .parsing_structures import (
+    CountInfos, EltType, RegexElt, PipeElt, GroupElt
+)
+from .charclass import CharRanges
+
+
+# Bumped every time the encoding of the trees changes
+FORMAT_VERSION = 3
+
+_REGEX_ELT = 0
+_PIPE_ELT = 1
+_GROUP_ELT = 2
+
+_ELT_TYPES = {elt_type.value: elt_type for elt_type in EltType}
+
+
+def encode_count_infos(count_infos):
+    if count_infos is None:
+        return None
+    return (tuple(tuple(info) for info in count_infos.count_infos),
+            count_infos.expected_weight)
+
+
+def decode_count_infos(data, memo):
+    if data is None:
+        return None
+    res = memo.get(data)
+    if res is None:
+        res = CountInfos([tuple(info) for info in data[0]], data[1],
+                         compute=False)
+        memo[data] = res
+    return res
+
+
+def encode_tree(treelist):
+    """
+    Transform a tree into nested tuples of integers and strings
+
+    Parameters:
+        treelist (list): list of GroupElt, RegexElt or PipeElt
+
+    Returns:
+        tuple: the encoded tree
+    """
+
+    res = []
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            res.append((
+                _PIPE_ELT,
+                tuple((encode_tree(choice), weight)
+                      for choice, weight in elt.list_elt),
+                elt.expected_weight
+            ))
+        elif isinstance(elt, GroupElt):
+            res.append((
+                _GROUP_ELT, encode_tree(elt.list_elt),
+                encode_count_infos(elt.count_infos), elt.name
+            ))
+        elif isinstance(elt, RegexElt):
+            elt_val = elt.elt_val
+            if elt.elt_type == EltType.CHAR_CLASS:
+                elt_val = (elt_val.ranges, elt_val.by_range)
+            res.append((
+                _REGEX_ELT, elt.elt_type.value, elt_val,
+                encode_count_infos(elt.count_infos)
+            ))
+        else:
+            raise RandRegexException(
+                "Cannot serialize an element of type {}".format(type(elt))
+            )
+    return tuple(res)
+
+
+def decode_tree(data, memo=None):
+    """
+    Inverse of encode_tree.
+    Structurally identical elements are decoded only once and shared,
+    which is safe since the trees are never modified once parsed.
+
+    Parameters:
+        - data (tuple): the encoded tree
+        - memo (dict): the elements already decoded
+
+    Returns:
+        list: list of GroupElt, RegexElt or PipeElt
+    """
+
+    if memo is None:
+        memo = {}
+    res = []
+    for elt in data:
+        node = memo.get(elt)
+        if node is not None:
+            res.append(node)
+            continue
+        if elt[0] == _PIPE_ELT:
+            node = PipeElt(
+                [(decode_tree(choice, memo), weight)
+                 for choice, weight in elt[1]],
+                elt[2]
+            )
+        elif elt[0] == _GROUP_ELT:
+            node = GroupElt(
+                decode_tree(elt[1], memo), decode_count_infos(elt[2], memo),
+                elt[3]
+            )
+        elif elt[0] == _REGEX_ELT:
+            elt_type = _ELT_TYPES[elt[1]]
+            elt_val = elt[2]
+            if elt_type == EltType.CHAR_CLASS:
+                elt_val = CharRanges(elt_val[0], elt_val[1])
+            node = RegexElt(
+                elt_type, elt_val, decode_count_infos(elt[3], memo)
+            )
+        else:
+            raise RandRegexException("Corrupted serialized tree")
+        memo[elt] = node
+        res.append(node)
+    return res
+
+
+def dump_tree(treelist):
+    """
+    Serialize a tree into bytes
+
+    Parameters:
+        treelist (list): list of GroupElt, RegexElt or PipeElt
+
+    Returns:
+        bytes: the serialized tree
+    """
+
+    return marshal.dumps(encode_tree(treelist))
+
+
+def load_tree(data):
+    """
+    Inverse of dump_tree. 'data' may be any bytes-like object.
+    The data must come from a trusted source, as for .pyc files.
+
+    Parameters:
+        data (bytes): the serialized tree
+
+    Returns:
+        list: list of GroupElt, RegexElt or PipeElt
+    """
+
+    try:
+        return decode_tree(marshal.loads(data))
+    except (EOFError, ValueError, TypeError, IndexError, KeyError):
+        raise RandRegexException("Corrupted serialized tree")
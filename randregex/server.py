@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains a local generation server: it keeps a registry
+of parsed patterns, combines the concurrent requests on the same
+pattern into a single batched generation, and sends the results back
+in length-prefixed frames. It listens on a Unix socket or on a
+localhost TCP port:
+
+    python -m randregex.server --socket /tmp/randregex.sock
+    python -m randregex.server --port 7878
+
+The protocol is described in randregex/protocol.py.
+"""
+
+import os
+import asyncio
+import argparse
+
+from .randregex import RandRegexException, parse_rand_regex
+from .threads import freeze_tree, thread_rng
+from .limits import DEFAULT_LIMITS, Limits, Budget, produce_limited
+from .protocol import (
+    OP_REGISTER, OP_GENERATE, STATUS_OK, STATUS_ERROR,
+    STATUS_UNKNOWN_PATTERN, MAX_FRAME, MAX_STRINGS, FRAME, GENERATE,
+    PATTERN_KEY, pattern_key, pack_frame, encode_strings, decode_strings,
+    encode_error
+)
+
+# Maximum number of characters of the strings of a request
+MAX_OUTPUT = 1 << 26
+
+
+async def read_frame(reader):
+    """
+    Read a frame from an asyncio.StreamReader and return its payload,
+    or None at the end of the stream
+    """
+
+    try:
+        header = await reader.readexactly(FRAME.size)
+    except asyncio.IncompleteReadError:
+        return None
+    size = FRAME.unpack(header)[0]
+    if size > MAX_FRAME:
+        raise RandRegexException("Frame too large")
+    return await reader.readexactly(size)
+
+
+class PatternRegistry:
+    """
+    The parsed patterns of the server.
+    Attributes:
+        - patterns: the pattern of each key
+        - trees: the frozen tree of each key
+        - limits: the Limits checked when parsing, or None
+    """
+
+    def __init__(self, limits=None):
+        self.patterns = {}
+        self.trees = {}
+        self.limits = limits
+
+    def register(self, pattern):
+        """
+        Return the key of a pattern, parsed on its first registration
+        """
+
+        key = pattern_key(pattern)
+        known = self.patterns.get(key)
+        if known is None:
+            tree = freeze_tree(parse_rand_regex(pattern, intern=True,
+                                                limits=self.limits))
+            self.trees[key] = tree
+            self.patterns[key] = pattern
+        elif known != pattern:
+            raise RandRegexException(
+                "The key of the pattern is already used by another pattern"
+            )
+        return key
+
+    def get(self, key):
+        return self.trees.get(key)
+
+
+def generate_batch(tree, sizes, limits=DEFAULT_LIMITS, max_output=MAX_OUTPUT):
+    """
+    Generate the strings of several requests at once
+
+    Parameters:
+        - tree: the frozen tree of the pattern
+        - sizes (list): the number of strings of each request
+        - limits (Limits): the limits of the generation of each string,
+          None for no limit
+        - max_output (int): the maximum number of characters of the
+          strings of a request
+
+    Returns:
+        list: for each request, the list of its strings, or the
+        RandRegexException which stopped its generation
+    """
+
+    rng = thread_rng()
+    max_string = None if limits is None else limits.max_output
+    max_time = None if limits is None else limits.max_time
+    res = []
+    for nb in sizes:
+        strings = []
+        remaining = max_output
+        try:
+            for _ in range(nb):
+                cap = remaining
+                if max_string is not None and max_string < cap:
+                    cap = max_string
+                budget = Budget(Limits(max_output=cap, max_time=max_time))
+                out = []
+                try:
+                    produce_limited(tree, {}, rng, budget, out)
+                except RandRegexException:
+                    if budget.size > remaining:
+                        raise RandRegexException(
+                            "The strings of the request exceed the limit "
+                            "of {} characters".format(max_output)
+                        )
+                    raise
+                strings.append("".join(out))
+                remaining -= budget.size
+            res.append(strings)
+        except RandRegexException as e:
+            res.append(e)
+    return res
+
+
+class Batcher:
+    """
+    Combines the requests on one pattern received during the same
+    iteration of the event loop into a single generation, run in
+    the default executor.
+    Attributes:
+        - tree: the tree of the pattern
+        - max_batch: the maximum number of strings of a generation
+        - limits: the Limits of the generation of each string, or None
+        - max_output: the maximum number of characters of a request
+        - pending: the list of (nb, future) waiting for a generation
+    """
+
+    def __init__(self, tree, max_batch, limits=DEFAULT_LIMITS,
+                 max_output=MAX_OUTPUT):
+        self.tree = tree
+        self.max_batch = max_batch
+        self.limits = limits
+        self.max_output = max_output
+        self.pending = []
+
+    def request(self, nb):
+        """
+        Return a future of the list of 'nb' strings
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self.pending:
+            loop.call_soon(self.flush)
+        self.pending.append((nb, future))
+        return future
+
+    def flush(self):
+        pending = self.pending
+        self.pending = []
+        loop = asyncio.get_running_loop()
+        while pending:
+            batch = [pending.pop(0)]
+            total = batch[0][0]
+            while pending and total + pending[0][0] <= self.max_batch:
+                total += pending[0][0]
+                batch.append(pending.pop(0))
+            task = loop.run_in_executor(
+                None, generate_batch, self.tree, [nb for nb, _ in batch],
+                self.limits, self.max_output
+            )
+            task.add_done_callback(
+                lambda task, batch=batch: self.dispatch(task, batch)
+            )
+
+    @staticmethod
+    def dispatch(task, batch):
+        if task.exception() is not None:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(task.exception())
+            return
+        for (_, future), strings in zip(batch, task.result()):
+            if future.done():
+                continue
+            if isinstance(strings, Exception):
+                future.set_exception(strings)
+            else:
+                future.set_result(strings)
+
+
+class GenerationServer:
+    """
+    The local generation server.
+    Attributes:
+        - path: the path of the Unix socket, or None for TCP
+        - host, port: the TCP address, when path is None. The port
+          is the one actually used once started.
+        - registry: the PatternRegistry
+        - max_batch: the maximum number of strings of a generation
+        - limits: the Limits of the registered patterns and of the
+          generation of each string (see randregex/limits.py), None to
+          accept any pattern
+        - max_output: the maximum number of characters of the strings
+          of a request, a larger request is answered by an error
+    """
+
+    def __init__(self, path=None, host="127.0.0.1", port=0, max_batch=4096,
+                 limits=DEFAULT_LIMITS, max_output=MAX_OUTPUT):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.limits = limits
+        self.max_output = max_output
+        self.registry = PatternRegistry(limits)
+        self._batchers = {}
+        self._server = None
+
+    async def start(self):
+        if self.path is not None:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            self._server = await asyncio.start_unix_server(
+                self.handle, path=self.path
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self.handle, host=self.host, port=self.port
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if self.path is not None and os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def batcher(self, key):
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            tree = self.registry.get(key)
+            if tree is None:
+                return None
+            batcher = Batcher(tree, self.max_batch, self.limits,
+                              self.max_output)
+            self._batchers[key] = batcher
+        return batcher
+
+    async def answer(self, payload):
+        """
+        Return the answer payload of a request payload
+        """
+
+        try:
+            if not payload:
+                raise RandRegexException("Empty request")
+            if payload[0] == OP_REGISTER:
+                pattern = payload[1:].decode("utf-8")
+                return PATTERN_KEY.pack(STATUS_OK,
+                                        self.registry.register(pattern))
+            if payload[0] == OP_GENERATE:
+                _, key, nb = GENERATE.unpack(payload)
+                if nb > MAX_STRINGS:
+                    raise RandRegexException(
+                        "At most {} strings per request".format(MAX_STRINGS)
+                    )
+                batcher = self.batcher(key)
+                if batcher is None:
+                    return encode_error(STATUS_UNKNOWN_PATTERN,
+                                        "Unknown pattern key {:016x}".format(
+                                            key))
+                return encode_strings(await batcher.request(nb))
+            raise RandRegexException("Unknown request {}".format(payload[0]))
+        except Exception as e:
+            # A bad request must not stop the connection
+            return encode_error(STATUS_ERROR, str(e) or type(e).__name__)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload is None:
+                    break
+                writer.write(pack_frame(await self.answer(payload)))
+                await writer.drain()
+        except (ConnectionError, RandRegexException):
+            pass
+        finally:
+            writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local randregex generation server"
+    )
+    parser.add_argument("--socket", help="path of the Unix socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7878)
+    parser.add_argument("--max-batch", type=int, default=4096)
+    args = parser.parse_args(argv)
+
+    server = GenerationServer(args.socket, args.host, args.port,
+                              args.max_batch)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
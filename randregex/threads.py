@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the thread-safe generation API.
+
+The generation only reads the tree: the only value written in it is
+the numeric template of the groups, which 'freeze_tree' computes in
+advance. Once frozen, a tree can be shared by any number of threads,
+including on free-threaded builds of CPython. Each thread uses its own
+random generator instead of the global state of the random module,
+so that the threads never wait for each other.
+"""
+
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .randregex import numeric_template, produce_randregex
+from .parsing_structures import PipeElt, GroupElt
+from .counter_rng import seed_key
+
+# Number of strings generated with the same random generator
+# by 'generate_many'
+CHUNK_SIZE = 1024
+
+_LOCAL = threading.local()
+
+
+def thread_rng():
+    """
+    Return the random generator of the current thread, created and
+    seeded from os.urandom on the first call of each thread
+    """
+
+    rng = getattr(_LOCAL, "rng", None)
+    if rng is None:
+        rng = random.Random(os.urandom(32))
+        _LOCAL.rng = rng
+    return rng
+
+
+def freeze_tree(treelist):
+    """
+    Compute in advance everything the generation caches in the tree,
+    so that generating from it never modifies it afterwards.
+
+    Parameters:
+        treelist (list): list of GroupElt, RegexElt or PipeElt
+
+    Returns:
+        list: the same tree
+    """
+
+    for elt in treelist:
+        if isinstance(elt, PipeElt):
+            for choice, _ in elt.list_elt:
+                freeze_tree(choice)
+        elif isinstance(elt, GroupElt):
+            numeric_template(elt)
+            freeze_tree(elt.list_elt)
+    return treelist
+
+
+def generate(tree, rng=None):
+    """
+    Generate a random string with the random generator of the
+    current thread if 'rng' is None. Safe to call from any thread
+    on a frozen tree.
+    """
+
+    if rng is None:
+        rng = thread_rng()
+    return produce_randregex(tree, {}, rng)
+
+
+def chunk_rng(seed, k):
+    """
+    Return the random generator of the chunk number 'k' of the
+    sequence seeded by 'seed', or an unseeded one if 'seed' is None
+    """
+
+    if seed is None:
+        return random.Random(os.urandom(32))
+    return random.Random(seed_key(seed) + k.to_bytes(8, "big"))
+
+
+def _generate_chunk(tree, seed, k, nb):
+    rng = chunk_rng(seed, k)
+    return [produce_randregex(tree, {}, rng) for _ in range(nb)]
+
+
+def generate_many(tree, nb, threads=None, seed=None, chunk_size=CHUNK_SIZE):
+    """
+    Generate 'nb' random strings with a pool of threads.
+
+    The strings are generated by chunks of 'chunk_size', each one with
+    its own random generator. With a seed, the result only depends on
+    (tree, nb, seed, chunk_size), whatever the number of threads.
+
+    The threads only run in parallel on free-threaded builds of
+    CPython; with the GIL, this is mostly useful when the caller
+    already runs in a thread pool.
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - nb (int): the number of strings
+        - threads (int): the number of threads, os.cpu_count() if None
+        - seed (int, str or bytes): the seed of the sequence, or None
+        - chunk_size (int): the number of strings per chunk
+
+    Returns:
+        list: the 'nb' random strings
+    """
+
+    freeze_tree(tree)
+    if threads is None:
+        threads = os.cpu_count() or 1
+    starts = range(0, nb, chunk_size)
+    if threads == 1 or len(starts) <= 1:
+        chunks = [_generate_chunk(tree, seed, k, min(chunk_size, nb - start))
+                  for k, start in enumerate(starts)]
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            chunks = list(executor.map(
+                lambda k: _generate_chunk(
+                    tree, seed, k, min(chunk_size, nb - starts[k])
+                ),
+                range(len(starts))
+            ))
+    return [s for chunk in chunks for s in chunk]
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the shorthand classes \\d, \\w, \\s and the range
+tables of the Unicode general categories \\p{...}. The shorthands are
+ASCII unless an explicit universe is given. The tables are built once
+from unicodedata, which takes about a second, then cached on disk next
+to the cached trees and loaded on first use only.
+
+The surrogates (Cs) and the unassigned codepoints (Cn) belong to no
+table, so that the generated strings can always be encoded.
+"""
+
+import os
+import sys
+import marshal
+import tempfile
+import unicodedata
+
+from .randregex import RandRegexException
+from .charclass import CharRanges, PRINTABLE_ASCII
+from .cache import default_cache_dir
+
+TABLES_VERSION = 1
+
+# The categories of \p{X} for a one letter X
+CATEGORIES = {
+    "L": ["Lu", "Ll", "Lt", "Lm", "Lo"],
+    "M": ["Mn", "Mc", "Me"],
+    "N": ["Nd", "Nl", "No"],
+    "P": ["Pc", "Pd", "Ps", "Pe", "Pi", "Pf", "Po"],
+    "S": ["Sm", "Sc", "Sk", "So"],
+    "Z": ["Zs", "Zl", "Zp"],
+    "C": ["Cc", "Cf", "Co"],
+}
+
+# The characters of each shorthand, as in the re module with re.ASCII
+SHORTHANDS = {
+    "d": CharRanges([(0x30, 0x39)]),
+    "w": CharRanges([(0x30, 0x39), (0x41, 0x5a), (0x5f, 0x5f), (0x61, 0x7a)]),
+    "s": CharRanges([(0x09, 0x0d), (0x20, 0x20)]),
+}
+
+# The table of each shorthand within an explicit universe, as in the re
+# module without re.ASCII
+UNICODE_SHORTHANDS = {"d": "Nd", "w": "word", "s": "space"}
+
+_TABLES = None
+_CLASSES = {}
+
+
+def build_tables():
+    """
+    Compute the tables from unicodedata
+
+    Returns:
+        dict: map table name -> tuple of (lo, hi) ranges
+    """
+
+    tables = {}
+
+    def add(name, code):
+        ranges = tables.setdefault(name, [])
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+
+    for code in range(sys.maxunicode + 1):
+        c = chr(code)
+        category = unicodedata.category(c)
+        if category == "Cs" or category == "Cn":
+            continue
+        add(category, code)
+        if c.isalnum() or c == "_":
+            add("word", code)
+        if c.isspace():
+            add("space", code)
+    return {name: tuple(map(tuple, ranges)) for name, ranges in tables.items()}
+
+
+def tables_path(cache_dir=None):
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    return os.path.join(cache_dir, "unicode-{}-{}.tables".format(
+        unicodedata.unidata_version, TABLES_VERSION
+    ))
+
+
+def load_tables(cache_dir=None):
+    """
+    Return the tables, read from the disk cache if possible, built
+    and written to it otherwise. Errors of the cache are ignored.
+    """
+
+    global _TABLES
+    if _TABLES is not None:
+        return _TABLES
+
+    path = tables_path(cache_dir)
+    try:
+        with open(path, "rb") as fp:
+            tables = marshal.load(fp)
+        if not isinstance(tables, dict):
+            tables = None
+    except (OSError, EOFError, ValueError, TypeError):
+        tables = None
+
+    if tables is None:
+        tables = build_tables()
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    marshal.dump(tables, fp)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            pass
+
+    _TABLES = tables
+    return tables
+
+
+def table_class(name):
+    """
+    Return the CharRanges of a table, or of a one letter category
+    """
+
+    res = _CLASSES.get(name)
+    if res is None:
+        tables = load_tables()
+        if name in CATEGORIES:
+            res = CharRanges(
+                r for cat in CATEGORIES[name] for r in tables.get(cat, ())
+            )
+        elif name in tables:
+            res = CharRanges(tables[name])
+        else:
+            raise RandRegexException(
+                "Unknown Unicode category {}".format(name)
+            )
+        _CLASSES[name] = res
+    return res
+
+
+def shorthand_class(letter, universe=None):
+    """
+    Return the CharRanges of \\d, \\w, \\s, or of their negations
+    \\D, \\W, \\S. Without a universe, they are the ASCII characters
+    of the shorthands and the negations are taken within PRINTABLE_ASCII.
+    Within an explicit universe, they are the characters of the universe
+    matched, or not matched, by the Unicode shorthands.
+    """
+
+    if universe is None:
+        res = SHORTHANDS[letter.lower()]
+        if letter.isupper():
+            res = res.complement(PRINTABLE_ASCII)
+        return res
+
+    res = table_class(UNICODE_SHORTHANDS[letter.lower()])
+    if letter.isupper():
+        res = res.complement(universe)
+    else:
+        res = res.intersection(universe)
+    if res.size == 0:
+        raise RandRegexException(
+            "The class \\{} is empty within the universe".format(letter)
+        )
+    return res
+
+
+def category_class(name, negate, universe):
+    """
+    Return the CharRanges of \\p{name}, or of \\P{name} within 'universe'
+    when 'negate' is True
+    """
+
+    if name not in CATEGORIES and (len(name) != 2 or name[0] not in CATEGORIES):
+        raise RandRegexException("Unknown Unicode category {}".format(name))
+    res = table_class(name)
+    if negate:
+        res = res.complement(universe)
+    return res
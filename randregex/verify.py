@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the translation of a tree into an equivalent
+Python regular expression, and a bulk verifier checking the generated
+strings with the C regex engine of the re module.
+
+The translation drops the weights, so that it matches every string
+the tree may generate:
+    - the captured groups become numbered groups, and their references
+      back-references (a name defined several times refers to the last
+      definition which matched)
+    - the integers %d{a,b} match exactly the formatted integers of
+      [a, b]; the floats are checked by their shape only
+    - the word lists become the alternation of their words, or any
+      string without tab nor newline when they are too large
+"""
+
+import re
+import random
+
+from .randregex import RandRegexException, produce_randregex
+from .parsing_structures import EltType, RegexElt, PipeElt, GroupElt
+from .charclass import CharRanges
+from .length import int_segments
+from .wordlist import get_word_list
+
+# Word lists with more words are matched by their shape only
+MAX_WORD_ALTERNATION = 10000
+
+# Number of strings checked in one call by 'verify_sample'
+BATCH_SIZE = 10000
+
+
+def escape_code(code):
+    """
+    Return the escaped form of a codepoint within a character set
+    """
+
+    c = chr(code)
+    if c.isalnum() and code < 0x80:
+        return c
+    if code < 0x10000:
+        return "\\u{:04x}".format(code)
+    return "\\U{:08x}".format(code)
+
+
+def char_set(ranges):
+    """
+    Return the character set [...] of a list of (lo, hi) ranges
+    """
+
+    res = []
+    for lo, hi in ranges:
+        if lo == hi:
+            res.append(escape_code(lo))
+        else:
+            res.append(escape_code(lo) + "-" + escape_code(hi))
+    return "[" + "".join(res) + "]"
+
+
+def digits_range(lo, hi):
+    """
+    Return the regex of the decimal numbers between the strings of
+    digits 'lo' and 'hi', which have the same length
+    """
+
+    if lo == hi:
+        return lo
+    if len(lo) == 1:
+        return "[{}-{}]".format(lo, hi)
+    n = len(lo) - 1
+    if lo[1:] == "0" * n and hi[1:] == "9" * n:
+        return "[{}-{}][0-9]{{{}}}".format(lo[0], hi[0], n)
+    if lo[0] == hi[0]:
+        return lo[0] + digits_range(lo[1:], hi[1:])
+    parts = [lo[0] + digits_range(lo[1:], "9" * n)]
+    if int(hi[0]) - int(lo[0]) > 1:
+        parts.append("[{}-{}][0-9]{{{}}}".format(
+            int(lo[0]) + 1, int(hi[0]) - 1, n
+        ))
+    parts.append(hi[0] + digits_range("0" * n, hi[1:]))
+    return "(?:" + "|".join(parts) + ")"
+
+
+def parse_format(fmt):
+    """
+    Return (flags, width, precision) of a number format such as "%+08.2f"
+    """
+
+    i = 1
+    while fmt[i] in "-+ 0":
+        i += 1
+    width, _, precision = fmt[i:-1].partition(".")
+    return (fmt[1:i], int(width) if width else 0,
+            int(precision) if precision else None)
+
+
+def pad(body, length, flags):
+    """
+    Return the regex of 'body', of 'length' characters, padded
+    to the width of the format
+    """
+
+    if length <= 0:
+        return body
+    if "-" in flags:
+        return body + " " * length
+    return " " * length + body
+
+
+def integer_regex(nb1, nb2, fmt):
+    """
+    Return the regex of the integers of [nb1, nb2] formatted with 'fmt'
+    """
+
+    flags, width, precision = parse_format(fmt)
+    precision = precision or 0
+    parts = []
+    for lo, hi, length in int_segments(nb1, nb2, fmt):
+        if lo < 0:
+            sign = "-"
+            alo, ahi = -hi, -lo
+        else:
+            sign = "+" if "+" in flags else (" " if " " in flags else "")
+            alo, ahi = lo, hi
+        ndigits = len(str(alo))
+        zeros = max(precision - ndigits, 0)
+        body = digits_range(str(alo), str(ahi))
+        padding = length - len(sign) - ndigits - zeros
+        if "0" in flags and "-" not in flags and not precision:
+            zeros += padding
+            padding = 0
+        parts.append(pad(re.escape(sign) + "0" * zeros + body,
+                         padding, flags))
+    return "(?:" + "|".join(parts) + ")"
+
+
+def float_regex(fmt):
+    """
+    Return the regex of the shape of the floats formatted with 'fmt'
+    """
+
+    if len(fmt) == 2:
+        return "-?[0-9]+(?:\\.[0-9]+)?(?:e[-+][0-9]+)?"
+    flags, width, precision = parse_format(fmt)
+    if precision is None:
+        precision = 6
+    sign = "[-+]" if "+" in flags else ("[- ]" if " " in flags else "-?")
+    body = "[0-9]+"
+    if precision:
+        body += "\\.[0-9]{{{}}}".format(precision)
+    if not width:
+        return sign + body
+    if "-" in flags:
+        return sign + body + " *"
+    if "0" in flags:
+        return sign + "0*" + body
+    return " *" + sign + body
+
+
+def count_ranges(count_infos):
+    """
+    Return the sorted and merged (nb1, nb2) ranges of a CountInfos,
+    the weights being dropped
+    """
+
+    res = []
+    for nb1, nb2 in sorted((nb1, nb2) for nb1, nb2, _
+                           in count_infos.count_infos):
+        if res and nb1 <= res[-1][1] + 1:
+            res[-1] = (res[-1][0], max(res[-1][1], nb2))
+        else:
+            res.append((nb1, nb2))
+    return res
+
+
+def quantify(make_atom, count_infos):
+    """
+    Return the regex of an atom repeated according to its count
+    informations. 'make_atom' is called once per range of counts, so
+    that each copy of the atom gets its own capturing groups.
+    """
+
+    res = []
+    for nb1, nb2 in count_ranges(count_infos):
+        atom = make_atom()
+        if nb1 == nb2 == 1:
+            res.append(atom)
+        elif nb1 == nb2:
+            res.append("{}{{{}}}".format(atom, nb1))
+        else:
+            res.append("{}{{{},{}}}".format(atom, nb1, nb2))
+    if len(res) == 1:
+        return res[0]
+    return "(?:" + "|".join(res) + ")"
+
+
+class Translator:
+    """
+    The translation of a tree into a regex.
+    Attributes:
+        - nb_groups: the number of capturing groups created so far
+        - groups: the capturing groups of each name, in the order
+          of the pattern
+    """
+
+    def __init__(self):
+        self.nb_groups = 0
+        self.groups = {}
+
+    def reference(self, name):
+        """
+        Return the regex of a reference to the captured group 'name'
+        """
+
+        groups = self.groups.get(name)
+        if not groups:
+            # The generation fails when the name is not defined
+            return "(?!)"
+        res = "(?:\\{})".format(groups[0])
+        for group in groups[1:]:
+            res = "(?({0})\\{0}|{1})".format(group, res)
+        return res
+
+    def sequence(self, treelist):
+        return "".join(self.element(elt) for elt in treelist)
+
+    def element(self, elt):
+        if isinstance(elt, PipeElt):
+            chars = pipe_chars(elt)
+            if chars is not None:
+                return char_set(CharRanges.from_chars(chars).ranges)
+            if len(elt.list_elt) == 1:
+                return self.sequence(elt.list_elt[0][0])
+            return "(?:" + "|".join(
+                self.sequence(choice) for choice, _ in elt.list_elt
+            ) + ")"
+
+        if isinstance(elt, GroupElt):
+            if elt.name:
+                return quantify(lambda: self.capture(elt), elt.count_infos)
+            return quantify(lambda: self.group(elt), elt.count_infos)
+
+        elt_type = elt.elt_type
+        if elt_type == EltType.NUMBER:
+            if elt.elt_val[-1] == "d":
+                return "(?:" + "|".join(
+                    integer_regex(nb1, nb2, elt.elt_val)
+                    for nb1, nb2, _ in elt.count_infos.count_infos
+                ) + ")"
+            return "(?:" + float_regex(elt.elt_val) + ")"
+        if elt_type == EltType.GROUP_NAME:
+            atom = self.reference(elt.elt_val)
+        elif elt_type == EltType.CHAR_CLASS:
+            atom = char_set(elt.elt_val.ranges)
+        elif elt_type == EltType.WORD_LIST:
+            atom = word_list_regex(elt.elt_val)
+        elif len(elt.elt_val) == 1:
+            atom = re.escape(elt.elt_val)
+        else:
+            atom = "(?:" + re.escape(elt.elt_val) + ")"
+        return quantify(lambda: atom, elt.count_infos)
+
+    def group(self, group_elt):
+        """
+        Return the atom of an unnamed GroupElt
+        """
+
+        res = self.sequence(group_elt.list_elt)
+        if res.startswith("[") and res.endswith("]") and "]" not in res[1:-1]:
+            return res
+        return "(?:" + res + ")"
+
+    def capture(self, group_elt):
+        """
+        Return a new capturing group for a named GroupElt
+        """
+
+        self.nb_groups += 1
+        group = self.nb_groups
+        res = "(" + self.sequence(group_elt.list_elt) + ")"
+        self.groups.setdefault(group_elt.name, []).append(group)
+        return res
+
+
+def pipe_chars(pipe_elt):
+    """
+    Return the set of characters of a PipeElt whose choices are single
+    characters, such as an expanded bracket, or None
+    """
+
+    res = set()
+    for choice, _ in pipe_elt.list_elt:
+        if len(choice) != 1:
+            return None
+        elt = choice[0]
+        if isinstance(elt, PipeElt):
+            inner = pipe_chars(elt)
+            if inner is None:
+                return None
+            res |= inner
+        elif (isinstance(elt, RegexElt) and len(elt.elt_val) == 1
+                  and (elt.elt_type == EltType.CHAR
+                       or elt.elt_type == EltType.ESCAPED_CHAR)
+                  and count_ranges(elt.count_infos) == [(1, 1)]):
+            res.add(elt.elt_val)
+        else:
+            return None
+    return res
+
+
+def word_list_regex(name):
+    """
+    Return the regex of the words of a registered word list
+    """
+
+    word_list = get_word_list(name)
+    if len(word_list) > MAX_WORD_ALTERNATION:
+        return "[^\\t\\n\\r]*"
+    words = sorted({word_list[i] for i in range(len(word_list))},
+                   key=lambda w: (-len(w), w))
+    return "(?:" + "|".join(re.escape(w) for w in words) + ")"
+
+
+def tree_to_regex(treelist):
+    """
+    Translate a tree into the source of an equivalent regex
+
+    Parameters:
+        - treelist (list): list of GroupElt, RegexElt or PipeElt
+
+    Returns:
+        string: the regex, to be used with re.fullmatch
+    """
+
+    return Translator().sequence(treelist)
+
+
+def compile_tree(treelist):
+    """
+    Return the compiled regex matching the strings of a tree
+    """
+
+    try:
+        return re.compile(tree_to_regex(treelist))
+    except re.error as e:
+        raise RandRegexException(
+            "The tree cannot be translated into a regex: {}".format(e)
+        )
+
+
+class Verifier:
+    """
+    Checks generated strings against the regex of a tree.
+    Attributes:
+        - tree: the tree returned by 'parse_rand_regex'
+        - regex: the compiled regex of the tree
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.regex = compile_tree(tree)
+
+    def mismatches(self, strings):
+        """
+        Return the indices of the strings not matching the tree.
+        The strings are matched by the C regex engine, in one pass
+        over the batch.
+        """
+
+        return [i for i, match in enumerate(map(self.regex.fullmatch, strings))
+                if match is None]
+
+    def check(self, strings):
+        """
+        Tell whether all the strings match the tree
+        """
+
+        return all(map(self.regex.fullmatch, strings))
+
+
+def verify_sample(tree, nb, rng=random, batch_size=BATCH_SIZE):
+    """
+    Generate 'nb' strings of a tree and check them by batches
+
+    Parameters:
+        - tree: the tree returned by 'parse_rand_regex'
+        - nb (int): the number of strings
+        - rng: the random generator, the random module by default
+        - batch_size (int): the number of strings checked at once
+
+    Returns:
+        list: the generated strings which do not match the tree
+    """
+
+    verifier = Verifier(tree)
+    res = []
+    for start in range(0, nb, batch_size):
+        batch = [produce_randregex(tree, {}, rng)
+                 for _ in range(min(batch_size, nb - start))]
+        res.extend(batch[i] for i in verifier.mismatches(batch))
+    return res
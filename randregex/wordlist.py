@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+"""
+This files contains the word lists used by the "(@name)" elements:
+a word file, with one entry per line, is memory-mapped together with
+an index of the entries, so that a word is drawn in O(1) and the
+pages are shared between the patterns and between the processes.
+
+The entries may have tab-separated columns: the word is the first one,
+and another column may give the weight of the entry.
+
+The index is stored next to the word file, in "<path>.idx" or
+"<path>.w<column>.idx" for weighted draws, and rebuilt when the word
+file changes. Layout (integers are little endian, as the machine):
+    - header: magic, version, padding, size and mtime of the word file,
+      nb of entries, weight column + 1 (0 if not weighted)
+    - the start offsets, then the end offsets of the words (64 bits)
+    - for weighted draws, the alias table: probas (doubles), then
+      aliases (64 bits)
+"""
+
+import os
+import sys
+import mmap
+import array
+import random
+import struct
+import tempfile
+
+from .randregex import RandRegexException
+from .sampling import AliasTable
+
+MAGIC = b"RRXW"
+WORDLIST_VERSION = 1
+
+_HEADER = struct.Struct("<4sH2xQqQQ")
+
+_WORD_LISTS = {}
+_REGISTRY = {}
+
+
+def index_path(path, weight_column=None):
+    if weight_column is None:
+        return path + ".idx"
+    return "{}.w{}.idx".format(path, weight_column)
+
+
+def scan_entries(data, weight_column=None):
+    """
+    Return the start offsets, end offsets and weights of the words
+    of a word file. Empty lines are ignored.
+    """
+
+    starts = array.array("Q")
+    ends = array.array("Q")
+    weights = []
+    pos = 0
+    size = len(data)
+    while pos < size:
+        end = data.find(b"\n", pos)
+        if end < 0:
+            end = size
+        line_end = end
+        if line_end > pos and data[line_end - 1] == 0x0d:
+            line_end -= 1
+        if line_end > pos:
+            tab = data.find(b"\t", pos, line_end)
+            word_end = line_end if tab < 0 else tab
+            if weight_column is not None:
+                columns = data[pos:line_end].split(b"\t")
+                try:
+                    weights.append(float(columns[weight_column]))
+                except (IndexError, ValueError):
+                    raise RandRegexException(
+                        "Line {} of the word file has no weight in "
+                        "column {}".format(len(starts) + 1, weight_column)
+                    )
+            starts.append(pos)
+            ends.append(word_end)
+        pos = end + 1
+    return starts, ends, weights
+
+
+class WordList:
+    """
+    A memory-mapped word file with its index.
+    Attributes:
+        - path: the word file
+        - weight_column: the column of the weights, None for
+          uniform draws
+        - mean_length: the mean length in bytes of the words
+        - max_length: the maximum length in bytes of the words,
+          computed on first use
+        - is_ascii: True if all the words are ASCII, computed on
+          first use
+    """
+
+    def __init__(self, path, weight_column=None):
+        self.path = path
+        self.weight_column = weight_column
+        self._maps = []
+        with open(path, "rb") as fp:
+            stat = os.fstat(fp.fileno())
+            if stat.st_size == 0:
+                raise RandRegexException(
+                    "The word file {} is empty".format(path)
+                )
+            self._data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(self._data)
+
+        if not self._load_index(stat):
+            self._build_index(stat)
+        if len(self._starts) == 0:
+            raise RandRegexException(
+                "The word file {} has no entry".format(path)
+            )
+        self.mean_length = ((sum(self._ends) - sum(self._starts))
+                            / len(self._starts))
+        self._max_length = None
+        self._is_ascii = None
+
+    @property
+    def max_length(self):
+        if self._max_length is None:
+            self._max_length = max(
+                end - start for start, end in zip(self._starts, self._ends)
+            )
+        return self._max_length
+
+    @property
+    def is_ascii(self):
+        if self._is_ascii is None:
+            data = self._data
+            # The whole file is checked by blocks first, the words one
+            # by one only if another column is not ASCII
+            self._is_ascii = all(
+                data[pos:pos + (1 << 20)].isascii()
+                for pos in range(0, len(data), 1 << 20)
+            ) or all(
+                data[start:end].isascii()
+                for start, end in zip(self._starts, self._ends)
+            )
+        return self._is_ascii
+
+    def _load_index(self, stat):
+        """
+        Map the index file if it matches the word file
+
+        Returns:
+            bool: True if the index was loaded
+        """
+
+        try:
+            with open(index_path(self.path, self.weight_column), "rb") as fp:
+                index = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(index) >= _HEADER.size:
+            magic, version, size, mtime, nb, column = \
+                _HEADER.unpack_from(index)
+            expected = _HEADER.size + 16 * nb
+            if self.weight_column is not None:
+                expected += 16 * nb
+            if (magic == MAGIC and version == WORDLIST_VERSION
+                    and size == stat.st_size and mtime == stat.st_mtime_ns
+                    and column == (0 if self.weight_column is None
+                                   else self.weight_column + 1)
+                    and len(index) == expected
+                    and sys.byteorder == "little"):
+                self._maps.append(index)
+                view = memoryview(index)
+                pos = _HEADER.size
+                self._starts = view[pos:pos + 8 * nb].cast("Q")
+                self._ends = view[pos + 8 * nb:pos + 16 * nb].cast("Q")
+                self._table = None
+                if self.weight_column is not None:
+                    pos += 16 * nb
+                    self._table = AliasTable.from_arrays(
+                        view[pos:pos + 8 * nb].cast("d"),
+                        view[pos + 8 * nb:pos + 16 * nb].cast("Q")
+                    )
+                return True
+        index.close()
+        return False
+
+    def _build_index(self, stat):
+        """
+        Compute the index, and write it if the directory is writable
+        """
+
+        starts, ends, weights = scan_entries(self._data, self.weight_column)
+        self._starts = starts
+        self._ends = ends
+        self._table = None
+        arrays = [starts, ends]
+        if self.weight_column is not None:
+            self._table = AliasTable(weights)
+            arrays.append(array.array("d", self._table.probas))
+            arrays.append(array.array("Q", self._table.aliases))
+        if sys.byteorder != "little":
+            return
+
+        path = index_path(self.path, self.weight_column)
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    fp.write(_HEADER.pack(
+                        MAGIC, WORDLIST_VERSION, stat.st_size,
+                        stat.st_mtime_ns, len(starts),
+                        0 if self.weight_column is None
+                        else self.weight_column + 1
+                    ))
+                    for values in arrays:
+                        fp.write(values.tobytes())
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, i):
+        return str(self._data[self._starts[i]:self._ends[i]], "utf-8")
+
+    def sample(self, rng=random):
+        """
+        Return a random word, in O(1)
+        """
+
+        if self._table is not None:
+            i = self._table.sample(rng)
+        else:
+            i = rng.randrange(len(self._starts))
+        return str(self._data[self._starts[i]:self._ends[i]], "utf-8")
+
+    def close(self):
+        for m in self._maps:
+            try:
+                m.close()
+            except BufferError:
+                # The index is still referenced by its memoryviews
+                pass
+        self._maps = []
+
+
+def open_word_list(path, weight_column=None):
+    """
+    Return the WordList of a word file, opened once per process
+    """
+
+    key = (os.path.realpath(path), weight_column)
+    res = _WORD_LISTS.get(key)
+    if res is None:
+        res = WordList(path, weight_column)
+        _WORD_LISTS[key] = res
+    return res
+
+
+def register_word_list(name, path, weight_column=None):
+    """
+    Make the word file available to the patterns as "(@name)"
+
+    Parameters:
+        - name (string): the name used in the patterns
+        - path (string): the word file, in utf-8, one entry per line
+        - weight_column (int): the tab-separated column of the weights,
+          counting from 0 for the word, or None for uniform draws
+
+    Returns:
+        WordList: the word list
+    """
+
+    res = open_word_list(path, weight_column)
+    _REGISTRY[name] = res
+    return res
+
+
+def get_word_list(name):
+    """
+    Return the WordList registered under 'name'
+    """
+
+    res = _REGISTRY.get(name)
+    if res is None:
+        raise RandRegexException(
+            "The word list {} is not registered".format(name)
+        )
+    return res
@@ -1,6 +1,10 @@
 import os
 import sys
 import re
+import io
+import json
+import random
+import tempfile
 
 sys.path.insert(0, os.path.dirname(
     os.path.dirname(os.path.realpath(__file__)))
@@ -39,6 +43,15 @@ class TestsBasic:
         self.basic_test("%d{-99,99}", 20, "-?[1-9]?[0-9]")
         self.basic_test("(%d{1,6} ){3}", 10, "([1-6] ){3}")
 
+    def test_number_format(self):
+        self.basic_test("%05d{0,999}", 20, "[0-9]{5}")
+        self.basic_test("%+d{1,9}", 20, "\\+[1-9]")
+        self.basic_test("%.3f{0,1}", 20, "[01]\\.[0-9]{3}")
+        self.basic_test("%8.2f{10,99}", 20, "   [1-9][0-9]\\.[0-9]{2}")
+        self.basic_test("(%.2f{0,1},){20}", 5, "([01]\\.[0-9]{2},){20}")
+        self.basic_test("(%d{1,6}\\% %f{0,1};){3}", 5, 
+                        "([1-6]% [01]\\.[0-9]+(e-[0-9]+)?;){3}")
+
     def test_float(self):
         mytree = randregex.parse_rand_regex("%f{-1,1}")
         for i in range(20):
@@ -140,6 +153,1221 @@ class TestsComplex:
         self.basic_test(">|d", 50, 
                         ">|d")
 
+class TestsRope:
+    def basic_test(self, pattern, nb=1, testpattern=None):
+        if testpattern is None:
+            testpattern = pattern
+        mytree = randregex.parse_rand_regex(pattern)
+        for i in range(nb):
+            res = randregex.produce_randregex_from_tree(mytree, lazy=True)
+            assert len(res) == len(str(res))
+            assert re.fullmatch(testpattern, str(res)) is not None
+
+    def test_rope(self):
+        self.basic_test("toto|(tata|titi)", 10)
+        self.basic_test("(a|e|i){1,4}", 10)
+        self.basic_test("(%d{1,6} ){3}", 10, "([1-6] ){3}")
+        self.basic_test("(?blah=[a-z]{5}) is repeated twice in ($blah){2}", 5,
+                        "([a-z]{5}) is repeated twice in \\1\\1")
+
+    def test_shared_pieces(self):
+        mytree = randregex.parse_rand_regex("(?blob=[a-z]{5000})($blob){1000}")
+        res = randregex.produce_randregex_from_tree(mytree, lazy=True)
+        assert len(res) == 5000 * 1001
+        assert res.nb_pieces() < 20
+        fp = io.StringIO()
+        assert res.write_to(fp) == len(res)
+        assert fp.getvalue() == str(res)
+        assert fp.getvalue() == fp.getvalue()[:5000] * 1001
+
+class TestsCache:
+    patterns = [
+        "(?var=titi|tata|toto) is equal to ($var)",
+        "[a-c<70>d-f]{2,3}%d{-5,5}",
+        "(ici|lala((foo|b[(co|ol)]a|r)to{2}to|la(lol){1,3}la))",
+    ]
+
+    def test_roundtrip(self):
+        from randregex.serialize import encode_tree, dump_tree, load_tree
+        for pattern in self.patterns:
+            mytree = randregex.parse_rand_regex(pattern)
+            loaded = load_tree(dump_tree(mytree))
+            assert encode_tree(loaded) == encode_tree(mytree)
+
+    def test_cache(self):
+        from randregex.cache import (
+            parse_rand_regex_cached, pattern_digest, cache_path
+        )
+        from randregex.serialize import encode_tree
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for pattern in self.patterns:
+                tree1 = parse_rand_regex_cached(pattern, cache_dir)
+                path = cache_path(pattern_digest(pattern), cache_dir)
+                assert os.path.exists(path)
+                tree2 = parse_rand_regex_cached(pattern, cache_dir)
+                assert encode_tree(tree1) == encode_tree(tree2)
+
+                with open(path, "r+b") as fp:
+                    fp.seek(-1, os.SEEK_END)
+                    fp.write(b"?")
+                tree3 = parse_rand_regex_cached(pattern, cache_dir)
+                assert encode_tree(tree1) == encode_tree(tree3)
+
+class TestsLibrary:
+    def test_library(self):
+        from randregex.library import build_library, PatternLibrary
+        patterns = {
+            "pipe": "foo|bar",
+            "group": "(?var=titi|tata|toto) is equal to ($var)",
+            "digits": randregex.parse_rand_regex("[0-9]{3}"),
+        }
+        tests = {
+            "pipe": "foo|bar",
+            "group": "(titi|tata|toto) is equal to \\1",
+            "digits": "[0-9]{3}",
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "patterns.rrl")
+            build_library(path, patterns)
+            with PatternLibrary(path, cache_size=2) as library:
+                assert len(library) == 3
+                assert list(library.names()) == ["digits", "group", "pipe"]
+                assert "pipe" in library and "toto" not in library
+                for name in ["pipe", "group", "digits", "pipe"]:
+                    res = randregex.produce_randregex_from_tree(library[name])
+                    assert re.fullmatch(tests[name], res) is not None
+                    assert len(library._cache) <= 2
+                assert library.get("toto") is None
+
+    def test_bad_file(self):
+        from randregex.library import build_library, PatternLibrary
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "patterns.rrl")
+            build_library(path, {"pipe": "foo|bar", "digits": "[0-9]{3}"})
+            with open(path, "rb") as fp:
+                data = fp.read()
+            # Empty, shorter than the header, cut in the index
+            for size in [0, 5, 20]:
+                with open(path, "wb") as fp:
+                    fp.write(data[:size])
+                try:
+                    PatternLibrary(path)
+                    assert(False)
+                except randregex.RandRegexException:
+                    pass
+
+class TestsBytes:
+    def basic_test(self, pattern, nb=1, testpattern=None):
+        from randregex.bytes_mode import (
+            parse_rand_regex_bytes, produce_bytes_from_tree
+        )
+        if testpattern is None:
+            testpattern = pattern
+        mytree = parse_rand_regex_bytes(pattern)
+        for i in range(nb):
+            res = produce_bytes_from_tree(mytree)
+            assert isinstance(res, bytearray)
+            assert re.fullmatch(testpattern.encode("ascii"), res) is not None
+
+    def test_bytes(self):
+        self.basic_test("foo|bar|toto", 10)
+        self.basic_test("[a-dW-Z0-2_]{3,5}", 50, "[a-dW-Z0-2_]{3,5}")
+        self.basic_test("(?blah=[a-z]{5}) is repeated twice in ($blah){2}", 5,
+                        "([a-z]{5}) is repeated twice in \\1\\1")
+        self.basic_test("(%d{1,6} ){3}", 10, "([1-6] ){3}")
+        self.basic_test(b"[a<30>e<50>iouy]".decode("ascii"), 20, "[aeiouy]")
+
+    def test_byte_class(self):
+        from randregex.bytes_mode import parse_rand_regex_bytes, ByteClass
+        mytree = parse_rand_regex_bytes("[a-c<70>d-f]{2}")
+        byte_class = mytree[0].list_elt[0][0][0]
+        assert isinstance(byte_class, ByteClass)
+        assert byte_class.table == b"abcdef"
+
+    def test_non_ascii(self):
+        from randregex.bytes_mode import parse_rand_regex_bytes
+        for pattern in ["caf\u00e9", b"caf\xc3\xa9"]:
+            try:
+                parse_rand_regex_bytes(pattern)
+                assert(False)
+            except randregex.RandRegexException as e:
+                assert "at position 3 is not ASCII" in str(e)
+
+class TestsCounter:
+    def test_generate_at(self):
+        from randregex.counter_rng import generate_at, generate_range
+        mytree = randregex.parse_rand_regex(
+            "(?var=[a-z]{5}) %d{1,1000} %.2f{0,1} ($var)"
+        )
+        res = [generate_at(mytree, 42, i) for i in range(20)]
+        for i in range(20):
+            assert re.fullmatch(
+                "([a-z]{5}) [0-9]+ [01]\\.[0-9]{2} \\1", res[i]
+            ) is not None
+        assert list(generate_range(mytree, 42, 5, 10)) == res[5:10]
+        assert generate_at(mytree, 42, 7) == res[7]
+        assert len(set(res)) == 20
+        assert [generate_at(mytree, 43, i) for i in range(20)] != res
+
+    def test_proba(self):
+        from randregex.counter_rng import generate_at
+        mytree = randregex.parse_rand_regex("toto<10>|titi<20>|tata<70>")
+        res = [generate_at(mytree, "seed", i) for i in range(1000)]
+        for elt, p in [("toto", 1/10.), ("titi", 2/10.), ("tata", 7/10.)]:
+            assert abs(res.count(elt) / 1000. - p) < 0.07
+
+class TestsLength:
+    def test_generate(self):
+        from randregex.length import generate
+        mytree = randregex.parse_rand_regex(
+            "[a-z]{1,100} %d{-1000,1000}( (foo|ba(r){0,50})){0,5}"
+        )
+        for i in range(50):
+            res = generate(mytree, min_len=10, max_len=30)
+            assert 10 <= len(res) <= 30
+            assert re.fullmatch(
+                "[a-z]{1,100} -?[0-9]+( (foo|bar{0,50})){0,5}", res
+            ) is not None
+        for i in range(10):
+            assert len(generate(mytree, max_len=3)) == 3
+
+    def test_proba(self):
+        from randregex.length import LengthSampler
+        sampler = LengthSampler(
+            randregex.parse_rand_regex("a{1,10}|b{1,10}<30>"), 5, 6
+        )
+        res = [sampler.generate() for i in range(1000)]
+        for elt, p in [("a{5}", .35), ("a{6}", .35), ("b{5}", .15), ("b{6}", .15)]:
+            freq = sum(re.fullmatch(elt, x) is not None for x in res) / 1000.
+            assert abs(freq - p) < 0.07
+
+    def test_large_repeat(self):
+        import time
+        from randregex.length import LengthSampler
+        # The cost does not depend on the number of repetitions of a
+        # group which may be empty
+        start = time.perf_counter()
+        sampler = LengthSampler(
+            randregex.parse_rand_regex("(x{0,1}){0,100000}"), 0, 200
+        )
+        res = [sampler.generate() for i in range(100)]
+        assert time.perf_counter() - start < 5
+        assert all(re.fullmatch("x{0,200}", x) for x in res)
+        # P(l) = sum over r of P(Bin(r, 1/2) = l) / 100001, about 2 / 100001
+        for l in (0, 1, 100, 200):
+            assert abs(sampler.dist[l] * 100001 / 2 - 1) < 1e-9
+
+    def test_errors(self):
+        from randregex.length import generate
+        for pattern, msg in [
+            ("(?var=a)($var)", "Length-constrained sampling does not "
+                               "support captured group names"),
+            ("%f{0,1}", "Length-constrained sampling does not support %f"),
+            ("toto", "The pattern cannot generate a string of length "
+                     "between 5 and 6"),
+        ]:
+            try:
+                generate(randregex.parse_rand_regex(pattern), 5, 6)
+                assert(False)
+            except randregex.RandRegexException as e:
+                assert(str(e) == msg)
+
+class TestsPrefix:
+    def test_prefix(self):
+        from randregex.prefix import generate_with_prefix
+        mytree = randregex.parse_rand_regex(
+            "(user|admin|guest<5>)-%d{0,99999}-[a-z]{2,4}(?x=[0-9]{2})($x)"
+        )
+        for i in range(50):
+            res = generate_with_prefix(mytree, "guest-12")
+            assert res.startswith("guest-12")
+            assert re.fullmatch(
+                "(?:user|admin|guest)-[0-9]+-[a-z]{2,4}([0-9]{2})\\1", res
+            ) is not None
+
+    def test_proba(self):
+        from randregex.prefix import PrefixSampler
+        sampler = PrefixSampler(
+            randregex.parse_rand_regex("x|(ab|a|b){1,3}"), "ab"
+        )
+        res = [sampler.generate() for i in range(1000)]
+        # Knowing that the string starts with "ab", "ab" itself
+        # has probability 4/11, as in the original pattern
+        assert abs(res.count("ab") / 1000. - 4 / 11.) < 0.07
+
+    def test_errors(self):
+        from randregex.prefix import PrefixSampler
+        for pattern, prefix, msg in [
+            ("(?var=x|y)($var)", "xx",
+             "Prefix-constrained sampling does not support captured "
+             "group names before the end of the prefix"),
+            ("toto", "ti",
+             "The pattern cannot generate a string starting with 'ti'"),
+        ]:
+            try:
+                PrefixSampler(randregex.parse_rand_regex(pattern), prefix)
+                assert(False)
+            except randregex.RandRegexException as e:
+                assert(str(e) == msg)
+
+class TestsMixture:
+    def test_alias(self):
+        from randregex.sampling import AliasTable
+        table = AliasTable([1, 2, 7])
+        res = [table.sample() for i in range(1000)]
+        for i, p in [(0, 1/10.), (1, 2/10.), (2, 7/10.)]:
+            assert abs(res.count(i) / 1000. - p) < 0.07
+
+    def test_mix(self):
+        from randregex.mixture import PatternMix
+        mix = PatternMix([
+            ("foo[0-9]{2}", 1),
+            (randregex.parse_rand_regex("bar[0-9]{2}"), 3),
+        ])
+        assert len(mix) == 2
+        res = mix.generate_batch(1000) + list(mix.stream(10))
+        assert all(re.fullmatch("(foo|bar)[0-9]{2}", x) for x in res)
+        assert abs(sum(x.startswith("foo") for x in res[:1000]) / 1000.
+                   - 1/4.) < 0.07
+        assert re.fullmatch("(foo|bar)[0-9]{2}", mix.generate()) is not None
+
+    def test_shared_subtrees(self):
+        from randregex.mixture import PatternMix
+        mix = PatternMix([("foo[0-9]{2}", 1), ("bar[0-9]{2}", 1)])
+        def digits(tree):
+            return tree[0].list_elt[0][0][3]
+        assert digits(mix.trees[0]) is digits(mix.trees[1])
+
+class TestsInterning:
+    def test_intern(self):
+        from randregex.interning import nb_interned
+        tree1 = randregex.parse_rand_regex("a{2}[0-9]{2}[0-9]{2}", intern=True)
+        tree2 = randregex.parse_rand_regex("b[0-9]{2}|c", intern=True)
+        digits1 = tree1[0].list_elt[0][0][1]
+        assert digits1 is tree1[0].list_elt[0][0][2]
+        assert digits1 is tree2[0].list_elt[0][0][1]
+        assert tree1[0].list_elt[0][0][0].count_infos is digits1.count_infos
+        for i in range(10):
+            res = randregex.produce_randregex_from_tree(tree1)
+            assert re.fullmatch("aa[0-9]{4}", res) is not None
+
+        nb = nb_interned()
+        tree3 = randregex.parse_rand_regex("(xyz){3}toto", intern=True)
+        assert nb_interned() > nb
+        del tree3
+        assert nb_interned() == nb
+
+class TestsThreads:
+    def test_generate_many(self):
+        from randregex.threads import generate_many
+        tree = randregex.parse_rand_regex("[a-c]{3}(%d{0,9},){2}")
+        res = generate_many(tree, 100, threads=4, chunk_size=7)
+        assert len(res) == 100
+        for s in res:
+            assert re.fullmatch("[a-c]{3}([0-9],){2}", s) is not None
+
+        res1 = generate_many(tree, 50, threads=1, seed=3, chunk_size=8)
+        res4 = generate_many(tree, 50, threads=4, seed=3, chunk_size=8)
+        assert res1 == res4
+        assert res1 != generate_many(tree, 50, threads=4, seed=4, chunk_size=8)
+
+    def test_thread_rng(self):
+        import threading
+        from randregex.threads import thread_rng, generate
+        rngs = []
+        def work():
+            rngs.append(thread_rng())
+            assert thread_rng() is rngs[-1]
+        threads = [threading.Thread(target=work) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(set(map(id, rngs))) == 3
+
+        tree = randregex.parse_rand_regex("x[0-9]")
+        assert re.fullmatch("x[0-9]", generate(tree)) is not None
+
+class TestsAsync:
+    def test_agenerate_chunks(self):
+        import asyncio
+        from randregex.aio import agenerate_chunks, agenerate
+        tree = randregex.parse_rand_regex("(?x=[a-c]{2})($x){2}(%d{0,9},){600}")
+
+        async def collect():
+            return [c async for c in agenerate_chunks(tree, chunk_size=100,
+                                                      yield_every=3)]
+        chunks = asyncio.run(collect())
+        assert len(chunks) > 1
+        assert all(len(c) >= 100 for c in chunks[:-1])
+        res = "".join(chunks)
+        assert re.fullmatch("([a-c]{2})\\1{2}([0-9],){600}", res) is not None
+
+        rng1, rng2 = random.Random(5), random.Random(5)
+        tree = randregex.parse_rand_regex("(?x=[a-c]{2})($x){2}[0-9]{1,5}")
+        assert asyncio.run(agenerate(tree, rng=rng1)) == \
+            randregex.produce_randregex_from_tree(tree, rng=rng2)
+
+    def test_astream(self):
+        import asyncio
+        from randregex.aio import astream
+        from randregex.threads import generate_many
+        tree = randregex.parse_rand_regex("[a-z]{3}%d{0,99}")
+
+        async def collect():
+            return [s async for s in astream(tree, 50, maxsize=4,
+                                             batch_size=8, seed=1)]
+        res = asyncio.run(collect())
+        assert res == generate_many(tree, 50, seed=1, chunk_size=8)
+
+class TestsServer:
+    def start_server(self, path, **kwargs):
+        import asyncio
+        import threading
+        from randregex.server import GenerationServer
+        ready = threading.Event()
+        holder = {}
+
+        async def serve():
+            holder["server"] = GenerationServer(path, **kwargs)
+            await holder["server"].start()
+            holder["stop"] = asyncio.Event()
+            ready.set()
+            await holder["stop"].wait()
+            holder["server"].close()
+
+        thread = threading.Thread(target=asyncio.run, args=(serve(),))
+        thread.start()
+        ready.wait()
+        return holder, thread
+
+    def test_framing(self):
+        from randregex.server import encode_strings, decode_strings
+        strings = ["", "abc", "\u00e9t\u00e9", "\U0001f600x"]
+        assert decode_strings(encode_strings(strings)) == strings
+
+    def test_server(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from randregex.client import Client
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "randregex.sock")
+            holder, thread = self.start_server(path)
+            try:
+                with Client(path, pool_size=2) as client:
+                    res = client.generate("[a-c]{3}%d{0,9}", 20)
+                    assert len(res) == 20
+                    for s in res:
+                        assert re.fullmatch("[a-c]{3}[0-9]", s) is not None
+                    from randregex.protocol import pattern_key
+                    assert (client.register("[a-c]{3}%d{0,9}")
+                            == pattern_key("[a-c]{3}%d{0,9}"))
+
+                    try:
+                        client.generate("(a")
+                        assert(False)
+                    except randregex.RandRegexException:
+                        pass
+                    assert client.generate_one("x{2}") == "xx"
+
+                    with ThreadPoolExecutor(8) as executor:
+                        res = list(executor.map(
+                            lambda i: client.generate("y{%d}" % (i % 3), 2),
+                            range(40)
+                        ))
+                    for i, strings in enumerate(res):
+                        assert strings == ["y" * (i % 3)] * 2
+                    assert len(client._pool) <= 2
+            finally:
+                holder["server"]._server.get_loop().call_soon_threadsafe(
+                    holder["stop"].set
+                )
+                thread.join()
+
+    def test_restart(self):
+        from randregex.client import Client
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "randregex.sock")
+            with Client(path) as client:
+                for patterns in (["a{2}"], ["b{2}", "a{2}"]):
+                    holder, thread = self.start_server(path)
+                    try:
+                        # The restarted server registers another pattern
+                        # first, the key kept by the client stays valid
+                        with Client(path) as other:
+                            other.generate(patterns[0])
+                        assert client.generate("a{2}") == ["aa"]
+                    finally:
+                        holder["server"]._server.get_loop() \
+                            .call_soon_threadsafe(holder["stop"].set)
+                        thread.join()
+
+    def test_output_limit(self):
+        from randregex.client import Client
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "randregex.sock")
+            holder, thread = self.start_server(path, max_output=100)
+            try:
+                with Client(path) as client:
+                    assert client.generate("a{10}", 10) == ["a" * 10] * 10
+                    try:
+                        client.generate("a{10}", 11)
+                        assert(False)
+                    except randregex.RandRegexException as e:
+                        assert "100 characters" in str(e)
+                    try:
+                        client.generate("a{0,1000000}b{0,1000000}"
+                                        "c{0,1000000}d{0,1000000}")
+                        assert(False)
+                    except randregex.RandRegexException:
+                        pass
+                    assert client.generate("b{3}", 2) == ["bbb"] * 2
+            finally:
+                holder["server"]._server.get_loop().call_soon_threadsafe(
+                    holder["stop"].set
+                )
+                thread.join()
+
+class TestsCorpus:
+    def test_expected_length(self):
+        from randregex.length import expected_length
+        for pattern, length in [("abc", 3), ("a{0,4}", 2), ("a|bbb", 2),
+                                ("(?x=ab{2})($x){3}", 12),
+                                ("%d{0,99}", 1.9), ("%.2f{0,1}", 4)]:
+            tree = randregex.parse_rand_regex(pattern)
+            assert abs(expected_length(tree) - length) < 1e-9
+
+    def test_corpus(self):
+        from randregex.corpus import CorpusWriter, Corpus, build_corpus
+        from randregex.counter_rng import generate_at
+        tree = randregex.parse_rand_regex("[a-c\u00e9]{0,5}%d{0,99}")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "corpus")
+            build_corpus(path, tree, 200, seed=7)
+            with Corpus(path) as corpus:
+                assert len(corpus) == 200
+                for i in [0, 1, 57, 199, -1]:
+                    assert corpus.get_str(i) == generate_at(tree, 7, i % 200)
+                with corpus[3] as view:
+                    assert isinstance(view, memoryview)
+                    assert bytes(view).decode("utf-8") == corpus.get_str(3)
+                try:
+                    corpus[200]
+                    assert(False)
+                except IndexError:
+                    pass
+
+            strings = ["", "abc", "\u00e9" * 10, "x" * 100]
+            with CorpusWriter(path, grow_chunk=16) as writer:
+                for s in strings:
+                    writer.append(s)
+            assert os.path.getsize(path) == 123
+            with Corpus(path) as corpus:
+                assert [corpus.get_str(i) for i in range(4)] == strings
+
+class TestsCharClass:
+    def test_ranges(self):
+        from randregex.charclass import CharRanges
+        a = CharRanges([(ord("a"), ord("z")), (ord("0"), ord("9"))])
+        assert a.ranges == ((48, 57), (97, 122))
+        assert len(a) == 36
+        b = CharRanges.from_chars("aeiou5")
+        assert "".join(a.difference(b).chars()) == \
+            "012346789bcdfghjklmnpqrstvwxyz"
+        assert "".join(a.intersection(b).chars()) == "5aeiou"
+        assert a.union(b) == a
+        assert CharRanges([(0, 5), (6, 9), (3, 4)]).ranges == ((0, 9),)
+        assert "".join(a.char_at(k) for k in range(len(a))) == \
+            "".join(a.chars())
+        assert "b" in a and "B" not in a
+
+    def test_parse(self):
+        from randregex.charclass import CharRanges
+        printable = "".join(chr(c) for c in range(0x20, 0x7f))
+        for pattern, chars in [
+                ("[^a-z]", "".join(c for c in printable
+                                   if not "a" <= c <= "z")),
+                ("[a-z--[aeiou]]", "bcdfghjklmnpqrstvwxyz"),
+                ("[a-z&&[^a-w]]", "xyz"),
+                ("[a-z--[b-y]&&[^a]]", "z"),
+                ("[0-9--[0-4]--[9]]", "5678"),
+                ("[^\\[\\]]", printable.replace("[", "").replace("]", ""))]:
+            tree = randregex.parse_rand_regex(pattern)
+            assert tree[0].list_elt[0][0][0].elt_val == \
+                CharRanges.from_chars(chars)
+            res = randregex.produce_randregex_from_tree(
+                randregex.parse_rand_regex(pattern + "{50}")
+            )
+            assert len(res) == 50 and all(c in chars for c in res)
+
+        # The legacy brackets are unchanged
+        tree = randregex.parse_rand_regex("[a-c^]")
+        assert isinstance(tree[0].list_elt[0][0][0],
+                          randregex.GroupElt)
+
+        universe = CharRanges([(0x3b1, 0x3c9)])
+        tree = randregex.parse_rand_regex("[^\u03b1]{20}", universe=universe)
+        res = randregex.produce_randregex_from_tree(tree)
+        assert all("\u03b2" <= c <= "\u03c9" for c in res)
+
+        for pattern, message in [("[^ -~]", "is empty"),
+                                 ("[^a<30>b]", "Weights are not allowed"),
+                                 ("[a--[b]", "does not have a closing")]:
+            try:
+                randregex.parse_rand_regex(pattern)
+                assert(False)
+            except randregex.RandRegexException as e:
+                assert message in str(e)
+
+    def test_generators(self):
+        from randregex.serialize import dump_tree, load_tree
+        from randregex.length import generate
+        from randregex.prefix import generate_with_prefix
+        from randregex.bytes_mode import (
+            parse_rand_regex_bytes, produce_bytes_from_tree
+        )
+        tree = randregex.parse_rand_regex("[^a-z]{3,6}-[a-z--[aeiou]]{2}")
+        regex = "[^a-z]{3,6}-[b-df-hj-np-tv-z]{2}"
+        for res in [
+                randregex.produce_randregex_from_tree(load_tree(
+                    dump_tree(tree))),
+                str(randregex.produce_randregex_from_tree(tree, lazy=True)),
+                generate(tree, 9, 9),
+                generate_with_prefix(tree, "AB"),
+                produce_bytes_from_tree(parse_rand_regex_bytes(
+                    "[^a-z]{3,6}-[a-z--[aeiou]]{2}"
+                )).decode("ascii")]:
+            assert re.fullmatch(regex, res) is not None
+        assert len(generate(tree, 9, 9)) == 9
+        assert generate_with_prefix(tree, "AB").startswith("AB")
+
+class TestsShorthand:
+    def test_shorthands(self):
+        for pattern, regex in [("\\d{50}", "\\d{50}"),
+                               ("\\w{50}", "\\w{50}"),
+                               ("\\s{50}", "\\s{50}"),
+                               ("\\D{50}", "[ -~]{50}"),
+                               ("[\\d_]{50}", "[\\d_]{50}"),
+                               ("[\\w--[\\d]]{50}", "[^\\W\\d]{50}"),
+                               ("\\p{Lu}{50}", "[^\\W\\d_]{50}"),
+                               ("\\p{L:range}{50}", "[^\\W\\d_]{50}"),
+                               ("\\P{L}{50}", "[ -@\\[-`{-~]{50}"),
+                               ("a\\\\d", "a\\\\d")]:
+            tree = randregex.parse_rand_regex(pattern)
+            res = randregex.produce_randregex_from_tree(tree)
+            assert re.fullmatch(regex, res) is not None
+
+        tree = randregex.parse_rand_regex("\\p{Lu}")
+        char_class = tree[0].list_elt[0][0][0].elt_val
+        assert "A" in char_class and "a" not in char_class
+
+        for pattern, message in [("\\p{Xy}", "Unknown Unicode category"),
+                                 ("\\p{L:foo}", "Unknown sampling mode"),
+                                 ("[\\p{L:range}]", "not allowed"),
+                                 ("\\pL", "Expected a category")]:
+            try:
+                randregex.parse_rand_regex(pattern)
+                assert(False)
+            except randregex.RandRegexException as e:
+                assert message in str(e)
+
+    def test_ascii(self):
+        from randregex.charclass import CharRanges
+        from randregex.bytes_mode import (
+            parse_rand_regex_bytes, produce_bytes_from_tree
+        )
+        # The shorthands are ASCII unless a universe is given
+        for pattern, regex in [("\\d{200}", "[0-9]{200}"),
+                               ("\\w{200}", "[0-9A-Za-z_]{200}"),
+                               ("\\s{200}", "[ \t\n\r\f\v]{200}"),
+                               ("[^\\d]{200}", "[ -/:-~]{200}"),
+                               ("\\W{200}", "[ -/:-@\\[-^`{-~]{200}")]:
+            tree = randregex.parse_rand_regex(pattern)
+            res = randregex.produce_randregex_from_tree(tree)
+            assert re.fullmatch(regex, res) is not None
+            res = produce_bytes_from_tree(parse_rand_regex_bytes(pattern))
+            assert re.fullmatch(regex.encode(), bytes(res)) is not None
+
+        universe = CharRanges([(0x30, 0x39), (0x660, 0x669), (0x41, 0x5a)])
+        tree = randregex.parse_rand_regex("\\d{200}", universe=universe)
+        res = randregex.produce_randregex_from_tree(tree)
+        assert re.fullmatch("[0-9\u0660-\u0669]{200}", res) is not None
+        assert any(c > "9" for c in res)
+        tree = randregex.parse_rand_regex("\\D{50}", universe=universe)
+        res = randregex.produce_randregex_from_tree(tree)
+        assert re.fullmatch("[A-Z]{50}", res) is not None
+
+    def test_by_range(self):
+        from randregex.charclass import CharRanges
+        ranges = CharRanges([(97, 97), (48, 57)], by_range=True)
+        assert ranges.proba("a") == 0.5
+        assert ranges.proba("0") == 0.05
+        rng = random.Random(0)
+        res = ranges.sample_string(2000, rng)
+        assert 800 < res.count("a") < 1200
+
+    def test_tables_cache(self):
+        from randregex import unicode_classes
+        with tempfile.TemporaryDirectory() as tmp:
+            tables = unicode_classes.load_tables()
+            saved = unicode_classes._TABLES
+            unicode_classes._TABLES = None
+            try:
+                assert unicode_classes.load_tables(tmp) == tables
+                assert os.path.exists(unicode_classes.tables_path(tmp))
+                unicode_classes._TABLES = None
+                assert unicode_classes.load_tables(tmp) == tables
+            finally:
+                unicode_classes._TABLES = saved
+
+class TestsWordList:
+    def test_word_list(self):
+        from randregex.wordlist import (
+            register_word_list, WordList, index_path
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "names.txt")
+            with open(path, "wb") as fp:
+                fp.write("Alice\t1\r\nBob\t0\n\n\u00c9mile\t3\n".encode("utf-8"))
+            words = register_word_list("first_test", path)
+            assert len(words) == 3
+            assert [words[i] for i in range(3)] == ["Alice", "Bob", "\u00c9mile"]
+            assert os.path.exists(index_path(path))
+            assert WordList(path)[2] == "\u00c9mile"
+
+            tree = randregex.parse_rand_regex("(@first_test) x(@first_test){2}")
+            for _ in range(20):
+                res = randregex.produce_randregex_from_tree(tree)
+                assert re.fullmatch("(Alice|Bob|\u00c9mile) x"
+                                    "(Alice|Bob|\u00c9mile){2}", res)
+            res = str(randregex.produce_randregex_from_tree(tree, lazy=True))
+            assert re.fullmatch("(Alice|Bob|\u00c9mile) x"
+                                "(Alice|Bob|\u00c9mile){2}", res)
+
+            weighted = register_word_list("first_test", path, weight_column=1)
+            rng = random.Random(0)
+            draws = [weighted.sample(rng) for _ in range(2000)]
+            assert "Bob" not in draws
+            assert 1300 < draws.count("\u00c9mile") < 1700
+            assert WordList(path, weight_column=1).sample(rng) != "Bob"
+
+            with open(path, "ab") as fp:
+                fp.write(b"Zoe\t1\n")
+            assert len(WordList(path)) == 4
+
+        try:
+            randregex.produce_randregex_from_tree(
+                randregex.parse_rand_regex("(@unknown_list)")
+            )
+            assert(False)
+        except randregex.RandRegexException as e:
+            assert "not registered" in str(e)
+
+    def test_bytes_mode(self):
+        from randregex.wordlist import register_word_list
+        from randregex.bytes_mode import (
+            parse_rand_regex_bytes, produce_bytes_from_tree
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ascii.txt")
+            with open(path, "wb") as fp:
+                fp.write("Alice\t\u00e9\nBob\n".encode("utf-8"))
+            words = register_word_list("ascii_test", path)
+            assert words.is_ascii
+            tree = parse_rand_regex_bytes("(@ascii_test)-(@ascii_test)")
+            for _ in range(20):
+                res = bytes(produce_bytes_from_tree(tree))
+                assert re.fullmatch(b"(Alice|Bob)-(Alice|Bob)", res)
+
+            path = os.path.join(tmp, "utf8.txt")
+            with open(path, "wb") as fp:
+                fp.write("Alice\n\u00c9mile\n".encode("utf-8"))
+            assert not register_word_list("utf8_test", path).is_ascii
+            try:
+                parse_rand_regex_bytes("(@utf8_test)")
+                assert(False)
+            except randregex.RandRegexException as e:
+                assert "ASCII word lists" in str(e)
+
+class TestsPlanner:
+    def test_plan(self):
+        from randregex.planner import Plan
+        tree = randregex.parse_rand_regex(
+            "id-[a-z]{3,5}(?c=[0-9]{2})/($c)(x|yz){0,2}(%d{0,99};){3}"
+        )
+        plan = Plan(tree)
+        assert [node.strategy for node in plan.nodes][:2] == ["literal", "class"]
+        assert "numeric" in plan.explain()
+        assert plan.cost < plan.scalar_cost
+        rng = random.Random(0)
+        for _ in range(200):
+            res = plan.generate(rng)
+            assert re.fullmatch(
+                "id-[a-z]{3,5}([0-9]{2})/\\1(x|yz){0,2}([0-9]{1,2};){3}", res
+            )
+
+    def test_same_distribution(self):
+        from randregex.planner import Plan
+        tree = randregex.parse_rand_regex("([a<30>b<70>]|c(d|e)){1,2}")
+        plan = Plan(tree)
+        rng = random.Random(1)
+        planned = [plan.generate(rng) for _ in range(20000)]
+        walked = [randregex.produce_randregex_from_tree(tree, rng=rng)
+                  for _ in range(20000)]
+        for s in ["a", "b", "cd", "ce", "bb", "ab", "cda"]:
+            assert abs(planned.count(s) - walked.count(s)) < 400
+
+class TestsLimits:
+    def rejected(self, pattern, msg, limits=None):
+        from randregex.limits import DEFAULT_LIMITS
+        try:
+            randregex.parse_rand_regex(pattern,
+                                       limits=limits or DEFAULT_LIMITS)
+            assert(False)
+        except randregex.RandRegexException as e:
+            assert msg in str(e)
+
+    def test_static_limits(self):
+        from randregex.limits import (
+            Limits, worst_case_length, worst_case_work
+        )
+        self.rejected("((a){1000000}){1000000}", "may have 1000000000000")
+        self.rejected("[\u0000-\U0010ffff]", "1114116 nodes")
+        self.rejected("(a{0}){100000000}", "may visit")
+        self.rejected("(b(a){1000}){1000}", "on average")
+        self.rejected("a" * 20, "20 characters", Limits(max_pattern_length=10))
+
+        tree = randregex.parse_rand_regex(
+            "(?x=[a-z]{3}){2}($x){4} %d{0,99999}|[^a]{5}"
+        )
+        assert worst_case_length(tree) == 3 * 2 + 12 + 1 + 5
+        assert worst_case_work(tree) < 100
+
+    def test_generate(self):
+        from randregex.limits import Limits, generate
+        tree = randregex.parse_rand_regex("(?x=[ab]{2})-($x){3}")
+        res = generate(tree, rng=random.Random(0))
+        assert re.fullmatch("([ab]{2})-(\\1){3}", res)
+
+        tree = randregex.parse_rand_regex("(ab){100000}")
+        try:
+            generate(tree, Limits(max_output=1000))
+            assert(False)
+        except randregex.RandRegexException as e:
+            assert "1000 characters" in str(e)
+
+        tree = randregex.parse_rand_regex("(a{0}){100000000}")
+        try:
+            generate(tree, Limits(max_time=0.05))
+            assert(False)
+        except randregex.RandRegexException as e:
+            assert "0.05 seconds" in str(e)
+
+class TestsVerify:
+    PATTERNS = [
+        "foo|bar|toto", "[a-dW-Z0-2_]{1,5}", "[0-9]{3,5}{10,12}{50}",
+        "%d{-99,99}", "%05d{0,999}", "% d{-300,300}", "%-6d{-50,50};",
+        "%8.2f{10,99}", "(%d{1,6}\\% %f{0,1};){3}",
+        "(?var=titi|tata|toto) is equal to ($var)",
+        "(?blah=[a-z]{5}) is repeated twice in ($blah){2}",
+        "((?x=a|b){1,2}{5}) ($x)", "\\(titi\\|tata\\)\\{2}",
+        "[a\\]\\[z\\<\\>]", "This is a \\c", "ceci\\<30\\>|cela\\<70\\>",
+        "[^a-z]{3}\\d{2}\\p{L}", "[a-z--[aeiou]]{4}", "e{1,2<20>}{9,10}",
+    ]
+
+    def test_translation(self):
+        from randregex.verify import tree_to_regex
+        tree = randregex.parse_rand_regex("(?x=[ab]){2}-($x)%d{1,12}")
+        assert tree_to_regex(tree) == (
+            "([a-b]){2}\\-(?:\\1)(?:(?:[1-9]|1[0-2]))"
+        )
+
+    def test_conformance(self):
+        from randregex.verify import Verifier, verify_sample
+        rng = random.Random(0)
+        for pattern in self.PATTERNS:
+            tree = randregex.parse_rand_regex(pattern)
+            assert verify_sample(tree, 2000, rng, batch_size=500) == []
+
+        verifier = Verifier(randregex.parse_rand_regex("(?x=[ab]){2}-($x)"))
+        assert verifier.check(["ab-b", "aa-a"])
+        assert verifier.mismatches(["ab-b", "ab-a", "abc-c"]) == [1, 2]
+
+    def test_batch(self):
+        from randregex.verify import Verifier, verify_sample
+        tree = randregex.parse_rand_regex(
+            "[a-z]{5,15}@[a-z]{3,8}\\.(com|org|net) (%d{0,9999};){5}"
+        )
+        rng = random.Random(1)
+        strings = [randregex.produce_randregex(tree, {}, rng)
+                   for _ in range(2000)]
+        bad = [3, 999, 1999]
+        for i in bad:
+            strings[i] = strings[i].replace("@", "#")
+
+        verifier = Verifier(tree)
+        regex = verifier.regex
+        calls = []
+
+        class CountingRegex:
+            def fullmatch(self, string):
+                calls.append(string)
+                return regex.fullmatch(string)
+
+        # Each string of the batch is matched once
+        verifier.regex = CountingRegex()
+        assert verifier.mismatches(strings) == bad
+        assert calls == strings
+        assert verifier.check(strings[:3] + strings[4:999])
+        assert not verifier.check(strings)
+
+        assert verify_sample(tree, 2000, random.Random(1),
+                             batch_size=300) == []
+
+class TestsIncremental:
+    def full_parse(self, text):
+        from randregex.serialize import encode_tree
+        try:
+            return encode_tree(randregex.parse_rand_regex(text))
+        except randregex.RandRegexException:
+            return None
+
+    def test_random_edits(self):
+        from randregex.incremental import IncrementalParser
+        from randregex.serialize import encode_tree
+        base = ("(?a=[a-z]{2,5})-(%d{0,99}|x(y|z){2}){1,3} ($a) "
+                "[0-9<20>a-f]{4}\\((q)\\) (((deep)))<30>|alt(b|c)")
+        pieces = list("ab()[]{}|\\<>0123,-?$=%d") + ["(x)", "{2}", "[ab]"]
+        rng = random.Random(0)
+        for _ in range(40):
+            parser = IncrementalParser(base)
+            for _ in range(20):
+                start = rng.randint(0, len(parser.text))
+                end = min(len(parser.text), start + rng.choice([0, 0, 1, 2]))
+                try:
+                    res = encode_tree(
+                        parser.edit(start, end, rng.choice(pieces))
+                    )
+                except randregex.RandRegexException:
+                    res = None
+                    assert parser.tree is None
+                assert res == self.full_parse(parser.text)
+
+    def test_reuse(self):
+        from randregex.incremental import IncrementalParser
+        from randregex.serialize import encode_tree
+        text = "".join("(?f{0}=[a-z]{{3}}) (%d{{0,9}}|(no|na)){{2}};".format(i)
+                       for i in range(50))
+        parser = IncrementalParser(text)
+        pos = text.index("(no|", 1000) + 1
+        tree = parser.edit(pos, pos, "x")
+        assert parser.nb_parsed < 20
+        res = randregex.produce_randregex_from_tree(tree)
+        assert re.fullmatch("([a-z]{3} ([0-9]|x?no|na){2};){50}", res)
+
+        try:
+            parser.edit(pos, pos, ")")
+            assert(False)
+        except randregex.RandRegexException as e:
+            assert "Parenthesis" in str(e)
+        parser.edit(pos, pos + 1, "")
+        assert parser.text.count("(xno|") == 1
+        assert self.full_parse(parser.text) == encode_tree(parser.tree)
+
+class TestsPacing:
+    def test_histogram(self):
+        from randregex.histogram import Histogram
+        hist = Histogram()
+        for i in range(1, 1001):
+            hist.record(i * 1e-6)
+        assert hist.count == 1000
+        assert abs(hist.mean() - 500.5e-6) < 1e-9
+        for q, value in ((0.5, 500e-6), (0.9, 900e-6), (0.99, 990e-6)):
+            assert value <= hist.percentile(q) <= value * 1.13
+        assert hist.percentile(1) == hist.max == 1e-3
+
+        other = Histogram()
+        other.record(1.0)
+        hist.merge(other)
+        assert hist.summary()["max"] == 1.0 and hist.count == 1001
+        try:
+            hist.merge(Histogram(buckets_per_decade=10))
+            assert(False)
+        except randregex.RandRegexException:
+            pass
+
+    def test_rate(self):
+        import time
+        from randregex.pacing import PacedGenerator
+        from randregex.counter_rng import generate_at
+        tree = randregex.parse_rand_regex("[a-z]{5,10}@%d{0,999}")
+        with PacedGenerator(tree, 1000, buffer_size=64, seed=3) as gen:
+            gen.fill()
+            start = time.perf_counter()
+            res = list(gen.emit(nb=200))
+            elapsed = time.perf_counter() - start
+        assert 0.19 < elapsed < 0.4
+        assert res[:10] == [generate_at(tree, 3, i) for i in range(10)]
+        stats = gen.stats()
+        assert stats["emitted"] == 200 and stats["lag"]["count"] == 200
+        assert stats["generation"]["count"] >= 200
+
+    def test_poisson(self):
+        from randregex.pacing import paced
+        tree = randregex.parse_rand_regex("x%d{0,9}")
+        res = list(paced(tree, 2000, duration=0.25, poisson=True, seed=1))
+        assert 350 < len(res) < 650
+        assert all(re.fullmatch("x[0-9]", s) for s in res)
+        try:
+            list(paced(tree, 0, nb=1))
+            assert(False)
+        except randregex.RandRegexException:
+            pass
+
+    def test_producer_error(self):
+        import threading
+        from randregex.pacing import PacedGenerator
+        # With the seed 10, the strings 0 and 1 fill the buffer, and
+        # the string 2 uses the name a before it is defined
+        tree = randregex.parse_rand_regex("(?a=x){0,1}($a)")
+        gen = PacedGenerator(tree, 1000, buffer_size=2, seed=10)
+        res = []
+        errors = []
+
+        def consume():
+            try:
+                for s in gen.emit(nb=5):
+                    res.append(s)
+            except randregex.RandRegexException as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=consume, daemon=True)
+        thread.start()
+        thread.join(5)
+        gen.close()
+        assert not thread.is_alive()
+        assert res == ["xx", "xx"]
+        assert len(errors) == 1 and "before being defined" in str(errors[0])
+
+class TestsJobs:
+    def test_resume(self):
+        from randregex.jobs import create_job, open_job, run_job, verify_job
+        from randregex.corpus import Corpus
+        from randregex.counter_rng import generate_at
+        directory = tempfile.mkdtemp()
+        job = create_job(directory, "[a-z]{3,8}@%d{0,999}", 2500, "s",
+                         shard_size=1000)
+        assert [(s.start, s.stop) for s in job.shards()] == \
+            [(0, 1000), (1000, 2000), (2000, 2500)]
+        res = run_job(job, processes=2)
+        assert res["generated"] == [0, 1, 2] and res["complete"]
+        with Corpus(job.shards()[1].path) as corpus:
+            assert len(corpus) == 1000
+            assert corpus.get_str(7) == generate_at(job.parse(), "s", 1007)
+
+        # A corrupted shard is generated again, the others are skipped
+        with open(job.shards()[2].path, "r+b") as fp:
+            fp.write(b"#")
+        job = open_job(directory)
+        assert verify_job(job) == [2]
+        assert not job.status()["complete"]
+        res = run_job(job, processes=1)
+        assert res["generated"] == [2] and res["complete"]
+        assert verify_job(job) == []
+        with open(os.path.join(directory, "manifest.json")) as fp:
+            manifest = json.load(fp)
+        assert [s["stop"] for s in manifest["shards"]] == [1000, 2000, 2500]
+
+        try:
+            create_job(directory, "[a-z]{3,8}@%d{0,999}", 2500, "other",
+                       shard_size=1000)
+            assert(False)
+        except randregex.RandRegexException:
+            pass
+
+    def test_locks(self):
+        from randregex.jobs import create_job, run_job, acquire_lock
+        directory = tempfile.mkdtemp()
+        job = create_job(directory, "a%d{0,9}", 20, 1, shard_size=10)
+        shard = job.shards()[0]
+        assert acquire_lock(shard)
+        assert not acquire_lock(shard)
+        res = run_job(job, processes=1)
+        assert res["locked"] == [0] and res["generated"] == [1]
+        assert not res["complete"]
+        # A lock left by a crashed worker is taken over
+        os.utime(shard.lock_path, (0, 0))
+        res = run_job(job, processes=1, stale_after=60)
+        assert res["generated"] == [0] and res["complete"]
+        assert not os.path.exists(shard.lock_path)
+
+class TestsMetrics:
+    def test_disabled(self):
+        from randregex.metrics import get_metrics
+        assert get_metrics() is None
+
+    def test_snapshot(self):
+        from randregex.metrics import (
+            MetricsRegistry, enable_metrics, disable_metrics
+        )
+        registry = enable_metrics(registry=MetricsRegistry(1.0))
+        try:
+            tree = randregex.parse_rand_regex("(a|b<80>|c)-%d{10,99}")
+            try:
+                randregex.parse_rand_regex("(a")
+                assert(False)
+            except randregex.RandRegexException:
+                pass
+            rng = random.Random(4)
+            res = [randregex.produce_randregex_from_tree(tree, rng=rng)
+                   for _ in range(1000)]
+            lazy = randregex.produce_randregex_from_tree(tree, lazy=True)
+        finally:
+            disable_metrics()
+        # The instrumented generation draws the same strings
+        rng = random.Random(4)
+        assert res == [randregex.produce_randregex_from_tree(tree, rng=rng)
+                       for _ in range(1000)]
+        assert len(lazy) == 4
+
+        snapshot = registry.snapshot()
+        assert snapshot["parse"]["count"] == 2
+        assert snapshot["parse"]["errors"] == 1
+        pattern = snapshot["patterns"]["(a|b<80>|c)-%d{10,99}"]
+        assert pattern["strings"] == 1001 and pattern["sampled"] == 1001
+        assert pattern["length"]["max"] == 4
+        choices = pattern["choices"][1]
+        assert choices == [sum(s[0] == c for s in res) for c in "abc"]
+        assert 700 < choices[1] < 900
+
+    def test_sampling(self):
+        from randregex.metrics import MetricsRegistry
+        registry = MetricsRegistry(0.1, seed=1)
+        tree = randregex.parse_rand_regex("x(y|z)")
+        registry.name_tree(tree, "xy")
+        for _ in range(5000):
+            registry.generate(tree, False, random)
+        pattern = registry.snapshot()["patterns"]["xy"]
+        assert pattern["strings"] == 5000
+        assert 400 < pattern["sampled"] < 600
+        assert sum(pattern["choices"][0]) == pattern["sampled"]
+
+    def test_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from randregex.metrics import MetricsRegistry
+        registry = MetricsRegistry(0.1, seed=1)
+        tree = randregex.parse_rand_regex("x(y|z)")
+        registry.name_tree(tree, "xy")
+
+        def work(seed):
+            rng = random.Random(seed)
+            for _ in range(2000):
+                registry.generate(tree, False, rng)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(work, range(8)))
+        pattern = registry.snapshot()["patterns"]["xy"]
+        # The counts of the threads are summed without losing any
+        assert pattern["strings"] == 16000
+        assert 1200 < pattern["sampled"] < 2000
+        assert sum(pattern["choices"][0]) == pattern["sampled"]
+
+    def test_prometheus(self):
+        from randregex.metrics import MetricsRegistry
+        registry = MetricsRegistry(1.0)
+        tree = randregex.parse_rand_regex("a(b|c)")
+        registry.name_tree(tree, 'say "hi"')
+        for _ in range(10):
+            registry.generate(tree, False, random)
+        text = registry.prometheus()
+        assert '# TYPE randregex_generation_seconds histogram' in text
+        assert 'randregex_strings_total{pattern="say \\"hi\\""} 10' in text
+        assert re.search('randregex_string_length_bucket'
+                         '{pattern=".*",le="\\+Inf"} 10', text)
+        assert re.search('randregex_choices_total'
+                         '{pattern=".*",pipe="1",choice="0"} [0-9]+', text)
+
+    def test_max_patterns(self):
+        from randregex import metrics
+        registry = metrics.MetricsRegistry(1.0)
+        max_patterns = metrics.MAX_PATTERNS
+        metrics.MAX_PATTERNS = 3
+        try:
+            trees = [randregex.parse_rand_regex("a{%d}" % k)
+                     for k in range(20)]
+            for tree in trees:
+                registry.generate(tree, False, random)
+                registry.generate(tree, False, random)
+        finally:
+            metrics.MAX_PATTERNS = max_patterns
+        # The trees past the limit are counted under OTHER, not kept
+        assert len(registry._by_tree) == 3
+        patterns = registry.snapshot()["patterns"]
+        assert len(patterns) == 4
+        assert patterns[metrics.OTHER]["strings"] == 2 * 17
+
+class TestsBitStream:
+    def test_byte_code(self):
+        from randregex.sampling import byte_code
+        for n in (2, 3, 7, 10, 16, 26, 100, 200, 256):
+            j, table, rejected = byte_code(n)
+            accepted = [b for b in range(256) if b not in rejected]
+            # Every sequence of j digits comes from as many bytes
+            if j == 1:
+                res = [table[b] for b in accepted]
+            else:
+                res = [table[b] for b in accepted]
+                assert all(len(d) == j for d in res)
+            counts = {}
+            for d in res:
+                counts[d] = counts.get(d, 0) + 1
+            assert len(counts) == n ** j
+            assert len(set(counts.values())) == 1
+        assert byte_code(3)[0] == 5 and byte_code(10)[0] == 2
+
+    def test_uniform(self):
+        from randregex.sampling import BitStreamRandom
+        rng = BitStreamRandom(5)
+        for n in (3, 10, 300, 70000):
+            counts = [0] * 10
+            for _ in range(20000):
+                counts[rng.randrange(n) * 10 // n] += 1
+            expected = [sum(1 for v in range(n) if v * 10 // n == k)
+                        * 20000 / n for k in range(10)]
+            assert all(abs(c - e) <= 5 * e ** 0.5
+                       for c, e in zip(counts, expected))
+        assert rng.randint(5, 5) == 5
+        assert 0 <= rng.randrange(3 * 2 ** 61) < 3 * 2 ** 61
+        assert rng.choice("abc") in "abc"
+        try:
+            rng.randint(3, 2)
+            assert(False)
+        except ValueError:
+            pass
+
+        rng.seed(7)
+        for _ in range(10000):
+            rng.randint(0, 2)
+        assert rng.bits_drawn < 10000 * 2
+
+    def test_state(self):
+        from randregex.sampling import BitStreamRandom
+        from randregex.counter_rng import CounterRandom
+        rng = BitStreamRandom(1)
+        rng.randint(0, 5)
+        state = rng.getstate()
+        res = [rng.randint(0, 99) for _ in range(100)]
+        rng.setstate(state)
+        assert res == [rng.randint(0, 99) for _ in range(100)]
+
+        tree = randregex.parse_rand_regex("[a-z]{3,8}-(x|y|z){2}%d{0,999}")
+        res = [randregex.produce_randregex_from_tree(
+                   tree, rng=BitStreamRandom(source=CounterRandom(3, i)))
+               for i in range(50)]
+        assert res == [randregex.produce_randregex_from_tree(
+                           tree, rng=BitStreamRandom(source=CounterRandom(3, i)))
+                       for i in range(50)]
+        assert all(re.fullmatch("[a-z]{3,8}-[xyz]{2}[0-9]+", x) for x in res)
+
 class TestsError:
     def basic_test(self, pattern, msg):
         try:        
@@ -152,6 +1380,8 @@ class TestsError:
         self.basic_test("%(c)", "Error while parsing %d or %f")
         self.basic_test("%[c]", "Error while parsing %d or %f")
         self.basic_test("%s[c]", "Error while parsing %d or %f")
+        self.basic_test("%5.d", "Error while parsing %d or %f")
+        self.basic_test("%.3s", "Error while parsing %d or %f")
 
     def test_error2(self):            
         self.basic_test("[a-z]{2<s>}{3}", "Error while parsing <n>")